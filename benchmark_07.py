@@ -0,0 +1,680 @@
+"""
+Бенчмарки консольного файлового менеджера
+Запуск: python benchmark_07.py listing --sizes 10000,100000,1000000
+       python benchmark_07.py history --sizes 1000000
+       python benchmark_07.py ops --sizes 1000,10000 --save-baseline
+       python benchmark_07.py startup --budget-ms 25
+"""
+import os
+import sys
+import time
+import shutil
+import json
+import argparse
+import tracemalloc
+import random
+import tempfile
+import io
+import cProfile
+import platform
+import threading
+import subprocess
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from itertools import islice
+
+import file_manager_07 as fm
+
+# ========== СИНТЕТИЧЕСКИЕ ДАННЫЕ ==========
+
+def make_flat_directory(root, count, dir_ratio=0.1):
+    """Создание директории с count элементами (часть из них - папки)"""
+    os.makedirs(root, exist_ok=True)
+    dir_every = max(1, int(1 / dir_ratio)) if dir_ratio else 0
+    for i in range(count):
+        path = os.path.join(root, f"item_{i:07d}")
+        if dir_every and i % dir_every == 0:
+            os.mkdir(path)
+        else:
+            with open(path, 'wb') as f:
+                f.write(b'x' * (i % 512))
+    return root
+
+def make_tree(root, total_files, files_per_dir=100, fanout=10):
+    """Создание дерева папок примерно с total_files файлами"""
+    os.makedirs(root, exist_ok=True)
+    queue = [root]
+    created = 0
+    while created < total_files:
+        current = queue.pop(0)
+        for i in range(min(files_per_dir, total_files - created)):
+            with open(os.path.join(current, f"file_{i:04d}"), 'wb') as f:
+                f.write(b'x' * ((created + i) % 4096))
+        created += min(files_per_dir, total_files - created)
+        for i in range(fanout):
+            subdir = os.path.join(current, f"dir_{i:02d}")
+            os.mkdir(subdir)
+            queue.append(subdir)
+    return root
+
+def timed(func, *args, repeat=3):
+    """Лучшее время из repeat запусков и результат последнего"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+# ========== СТАРАЯ РЕАЛИЗАЦИЯ (os.listdir + isfile/isdir/getsize) ==========
+
+def legacy_contents(path):
+    """Логика list_contents до перехода на scandir"""
+    files = []
+    dirs = []
+    for item in sorted(os.listdir(path)):
+        item_path = os.path.join(path, item)
+        if os.path.isfile(item_path):
+            files.append((item, os.path.getsize(item_path)))
+        else:
+            dirs.append(item)
+    return files, dirs
+
+def legacy_folders(path):
+    """Логика list_folders до перехода на scandir"""
+    items = os.listdir(path)
+    return sorted(item for item in items if os.path.isdir(os.path.join(path, item)))
+
+def legacy_files(path):
+    """Логика list_files до перехода на scandir"""
+    items = os.listdir(path)
+    files = [item for item in items if os.path.isfile(os.path.join(path, item))]
+    return [(f, os.path.getsize(os.path.join(path, f))) for f in sorted(files)]
+
+def legacy_export(path):
+    """Логика save_directory_contents до перехода на scandir (без записи)"""
+    files = []
+    dirs = []
+    for item in sorted(os.listdir(path)):
+        if os.path.isfile(os.path.join(path, item)):
+            files.append(item)
+        else:
+            dirs.append(item)
+    return '\n'.join(["files:"] + files + ["\ndirs:"] + dirs)
+
+def scandir_export(path):
+    """Сборка содержимого listdir.txt через движок scandir (без записи)"""
+    files, dirs = fm.collect_contents(path, stat_files=False)
+    return '\n'.join(["files:"] + [r.name for r in files] + ["\ndirs:"] + [r.name for r in dirs])
+
+LISTING_CASES = [
+    ("list_contents", legacy_contents, fm.collect_contents),
+    ("list_folders", legacy_folders, fm.collect_folders),
+    ("list_files", legacy_files, fm.collect_files),
+    ("save_directory_contents", legacy_export, scandir_export),
+]
+
+def bench_listing(args):
+    """Сравнение старого листинга и движка scandir"""
+    base = args.dir or tempfile.mkdtemp(prefix="fm_bench_")
+    try:
+        print(f"{'операция':<26}{'элементов':>10}{'listdir, с':>13}{'scandir, с':>13}{'ускорение':>11}")
+        for size in args.sizes:
+            root = os.path.join(base, f"flat_{size}")
+            if not os.path.isdir(root):
+                make_flat_directory(root, size)
+            for name, old, new in LISTING_CASES:
+                old_time, _ = timed(old, root, repeat=args.repeat)
+                new_time, _ = timed(new, root, repeat=args.repeat)
+                speedup = old_time / new_time if new_time else float('inf')
+                print(f"{name:<26}{size:>10}{old_time:>13.3f}{new_time:>13.3f}{speedup:>10.2f}x")
+    finally:
+        if not args.dir and not args.keep:
+            shutil.rmtree(base, ignore_errors=True)
+
+# ========== АНАЛИЗ ЗАНЯТОГО МЕСТА ==========
+
+def legacy_walk_usage(path):
+    """Однопоточный подсчет размера через os.walk + os.lstat"""
+    total = 0
+    seen = set()
+    for root, _, files in os.walk(path):
+        for name in files:
+            st = os.lstat(os.path.join(root, name))
+            if st.st_nlink > 1:
+                if (st.st_dev, st.st_ino) in seen:
+                    continue
+                seen.add((st.st_dev, st.st_ino))
+            total += st.st_size
+    return total
+
+def bench_du(args):
+    """Сравнение os.walk и параллельного обхода disk_usage"""
+    base = args.dir or tempfile.mkdtemp(prefix="fm_bench_")
+    try:
+        print(f"{'файлов':>10}{'os.walk, с':>13}{'disk_usage, с':>15}{'ускорение':>11}")
+        for size in args.sizes:
+            root = os.path.join(base, f"tree_{size}")
+            if not os.path.isdir(root):
+                make_tree(root, size)
+            old_time, old_total = timed(legacy_walk_usage, root, repeat=args.repeat)
+            new_time, usage = timed(fm.disk_usage, root, repeat=args.repeat)
+            assert old_total == usage.total, (old_total, usage.total)
+            print(f"{size:>10}{old_time:>13.3f}{new_time:>15.3f}{old_time / new_time:>10.2f}x")
+    finally:
+        if not args.dir and not args.keep:
+            shutil.rmtree(base, ignore_errors=True)
+
+# ========== ИСТОРИЯ ПОКУПОК ==========
+
+PURCHASE_NAMES = ["Хлеб", "Молоко", "Кофе", "Книга", "Билет", "Такси", "Обед", "Подписка"]
+
+def make_purchases(count, start=datetime(2020, 1, 1)):
+    """Синтетическая история покупок в формате bank_account.json"""
+    rnd = random.Random(count)
+    balance = 10.0 * count
+    purchases = []
+    for i in range(count):
+        amount = round(rnd.uniform(1, 500), 2)
+        balance -= amount
+        purchases.append({
+            'name': rnd.choice(PURCHASE_NAMES),
+            'amount': amount,
+            'date': (start + timedelta(minutes=3 * i)).strftime('%Y-%m-%d %H:%M:%S'),
+            'balance_after': balance
+        })
+    return purchases
+
+def bench_history(args):
+    """Итоги и фильтры истории: пересчет по списку против PurchaseHistory"""
+    print(f"{'операция':<34}{'покупок':>10}{'список, мс':>13}{'индекс, мс':>13}")
+    for size in args.sizes:
+        purchases = make_purchases(size)
+        middle = purchases[size // 2]['date'][:10]
+        build_time, history = timed(fm.PurchaseHistory, purchases, repeat=1)
+        print(f"{'построение PurchaseHistory':<34}{size:>10}{'-':>13}{build_time * 1000:>13.1f}")
+
+        cases = [
+            ("всего потрачено",
+             lambda: sum(p['amount'] for p in purchases),
+             lambda: history.total),
+            ("фильтр по названию (все)",
+             lambda: [p for p in purchases if 'кофе' in p['name'].lower()],
+             lambda: list(history.select(name='кофе'))),
+            ("фильтр по названию (страница)",
+             lambda: [p for p in reversed(purchases) if 'кофе' in p['name'].lower()][:10],
+             lambda: list(islice(history.select(name='кофе'), 10))),
+            ("покупки за один день",
+             lambda: [p for p in purchases if p['date'][:10] == middle],
+             lambda: list(history.select(date_from=middle, date_to=middle))),
+            ("первая страница (10 новых)",
+             lambda: list(reversed(purchases))[:10],
+             lambda: list(islice(history.select(), 10))),
+        ]
+        for name, old, new in cases:
+            old_time, _ = timed(old, repeat=args.repeat)
+            new_time, _ = timed(new, repeat=args.repeat)
+            print(f"{name:<34}{size:>10}{old_time * 1000:>13.2f}{new_time * 1000:>13.2f}")
+
+def measure_memory(build):
+    """Объем памяти, занятый результатом build() (по tracemalloc)"""
+    tracemalloc.start()
+    try:
+        result = build()
+        used, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return used, result
+
+def bench_memory(args):
+    """Память истории покупок: список словарей из JSON против колонок PurchaseHistory"""
+    print(f"{'покупок':>10}{'list[dict], МБ':>17}{'колонки, МБ':>14}{'байт/покупку':>16}{'экономия':>10}")
+    for size in args.sizes:
+        # Как после json.load: каждая покупка - отдельный словарь со своими строками
+        text = json.dumps(make_purchases(size), ensure_ascii=False)
+        dicts_used, purchases = measure_memory(lambda: json.loads(text))
+        columns_used, history = measure_memory(lambda: fm.PurchaseHistory(purchases))
+        # balance_after в синтетике накапливает ошибку float - сравниваем с округлением до копеек
+        for restored, original in zip(history.to_dicts()[:100], purchases):
+            assert restored == dict(original, balance_after=round(original['balance_after'], 2))
+        mb = 1024 * 1024
+        print(f"{size:>10}{dicts_used / mb:>17.1f}{columns_used / mb:>14.1f}"
+              f"{columns_used / size:>16.1f}{dicts_used / columns_used:>9.1f}x")
+
+# ========== ОПЕРАЦИИ МЕНЕДЖЕРА ЧЕРЕЗ ПОДМЕНУ ВВОДА-ВЫВОДА ==========
+
+# Защита от зацикливания сценария, если функция просит ввод бесконечно
+MAX_SCRIPTED_INPUTS = 1_000_000
+
+class NullOutput(io.TextIOBase):
+    """Поток вывода, который только считает символы"""
+    
+    def __init__(self):
+        self.chars = 0
+    
+    def write(self, text):
+        self.chars += len(text)
+        return len(text)
+    
+    def isatty(self):
+        return False
+
+class ScriptedSession:
+    """Подмена prompt_input и print в модуле fm: ответы берутся из списка, вывод отбрасывается.
+
+    Когда ответы заканчиваются, возвращается default - Enter листает
+    страницы до конца и закрывает экраны. Прямой вывод в sys.stdout
+    (строка прогресса, кадры экрана) тоже перенаправляется.
+    """
+    
+    def __init__(self, answers=(), default=""):
+        self.answers = iter(answers)
+        self.default = default
+        self.inputs = 0
+        self.output = NullOutput()
+        self.redirect = None
+        self.saved = None
+    
+    def input(self, prompt=""):
+        self.inputs += 1
+        if self.inputs > MAX_SCRIPTED_INPUTS:
+            raise RuntimeError("сценарий зациклился: слишком много запросов ввода")
+        self.output.write(prompt)
+        return next(self.answers, self.default)
+    
+    def print(self, *args, sep=" ", end="\n", file=None, flush=False):
+        self.output.write(sep.join(map(str, args)) + end)
+    
+    def __enter__(self):
+        self.saved = fm.prompt_input
+        fm.prompt_input = self.input
+        fm.print = self.print
+        self.redirect = redirect_stdout(self.output)
+        self.redirect.__enter__()
+        return self
+    
+    def __exit__(self, *exc):
+        self.redirect.__exit__(*exc)
+        del fm.print
+        # Обертка ввода модуля (учет ожидания в метриках) возвращается на место
+        fm.prompt_input = self.saved
+        return False
+
+class SyscallCounter:
+    """Счетчик системных вызовов на время замера.
+
+    Файловые операции Python считаются по событиям аудита (open, scandir,
+    unlink, rename и т.д.; stat событий аудита не имеет), вызовы read/write
+    ядра - по /proc/self/io (только Linux).
+    """
+    
+    EVENTS = {"open", "os.scandir", "os.listdir", "os.fwalk", "os.remove", "os.rmdir", "os.mkdir",
+              "os.rename", "os.link", "os.symlink", "os.chmod", "os.utime", "os.truncate",
+              "shutil.copyfile", "shutil.copystat", "sqlite3.connect"}
+    installed = False
+    active = None
+    lock = threading.Lock()
+    
+    def __init__(self):
+        self.audit = 0
+        self.reads = self.writes = None
+        self._io_start = None
+    
+    @classmethod
+    def _hook(cls, event, args):
+        counter = cls.active
+        if counter is not None and event in cls.EVENTS:
+            with cls.lock:
+                counter.audit += 1
+    
+    @staticmethod
+    def proc_io():
+        try:
+            with open("/proc/self/io") as f:
+                fields = dict(line.split(": ") for line in f.read().splitlines())
+            return int(fields["syscr"]), int(fields["syscw"])
+        except (OSError, KeyError, ValueError):
+            return None
+    
+    def __enter__(self):
+        if not SyscallCounter.installed:
+            # Хук аудита нельзя снять - ставим один раз и включаем через active
+            sys.addaudithook(SyscallCounter._hook)
+            SyscallCounter.installed = True
+        self._io_start = self.proc_io()
+        SyscallCounter.active = self
+        return self
+    
+    def __exit__(self, *exc):
+        SyscallCounter.active = None
+        io_end = self.proc_io()
+        if self._io_start and io_end:
+            self.reads = io_end[0] - self._io_start[0]
+            self.writes = io_end[1] - self._io_start[1]
+        return False
+
+def run_case(case, size, args, profile_dir=None):
+    """Замер одной операции: лучшее время, системные вызовы и пиковая память"""
+    best = float('inf')
+    for _ in range(args.repeat):
+        state = case.setup(size)
+        start = time.perf_counter()
+        case.run(state)
+        best = min(best, time.perf_counter() - start)
+    
+    # Отдельный прогон под счетчиками, чтобы они не искажали время
+    state = case.setup(size)
+    tracemalloc.start()
+    with SyscallCounter() as calls:
+        case.run(state)
+    snapshot = tracemalloc.take_snapshot() if profile_dir else None
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    if profile_dir:
+        label = f"{case.name}_{size}"
+        with open(os.path.join(profile_dir, label + ".tracemalloc.txt"), 'w', encoding='utf-8') as f:
+            for stat in snapshot.statistics('lineno')[:30]:
+                f.write(f"{stat}\n")
+        state = case.setup(size)
+        profiler = cProfile.Profile()
+        profiler.runcall(case.run, state)
+        profiler.dump_stats(os.path.join(profile_dir, label + ".prof"))
+    
+    return {
+        'seconds': best,
+        'audit_calls': calls.audit,
+        'read_calls': calls.reads,
+        'write_calls': calls.writes,
+        'peak_kb': peak // 1024,
+    }
+
+class Case:
+    """Сценарий бенчмарка: setup(size) готовит данные, run(state) выполняет операцию"""
+    
+    def __init__(self, name, setup, run):
+        self.name = name
+        self.setup = setup
+        self.run = run
+
+def fresh_cache():
+    """Холодный кэш директорий перед каждым прогоном"""
+    fm.directory_cache = fm.DirectoryCache()
+
+def build_cases(base):
+    """Сценарии операций; данные каждого размера создаются один раз в base"""
+    def flat(size):
+        root = os.path.join(base, f"flat_{size}")
+        if not os.path.isdir(root):
+            make_flat_directory(root, size)
+        return root
+    
+    def tree(size):
+        root = os.path.join(base, f"tree_{size}")
+        if not os.path.isdir(root):
+            make_tree(root, size)
+        return root
+    
+    def listing_setup(size):
+        fm.working_directory = flat(size)
+        fresh_cache()
+    
+    def interactive(func, answers=()):
+        def run(state):
+            with ScriptedSession(answers):
+                func()
+        return run
+    
+    def copy_setup(size):
+        source = tree(size)
+        fm.working_directory = base
+        dest = os.path.join(base, f"copy_{size}")
+        if os.path.exists(dest):
+            fm.delete_tree(dest)
+        fresh_cache()
+        return os.path.basename(source), os.path.basename(dest)
+    
+    def copy_run(state):
+        source, dest = state
+        # Ответы: источник, копия, не в фоне, Enter
+        with ScriptedSession([source, dest, "n"]):
+            fm.copy_item()
+    
+    def delete_setup(size):
+        victim = os.path.join(base, f"victim_{size}")
+        if not os.path.exists(victim):
+            fm.copy_tree(tree(size), victim)
+        fm.working_directory = base
+        fresh_cache()
+        return os.path.basename(victim)
+    
+    def delete_run(name):
+        with ScriptedSession([name, "y", "n"]):
+            fm.delete_item()
+    
+    def bank_dir(size):
+        path = os.path.join(base, f"bank_{size}")
+        os.makedirs(path, exist_ok=True)
+        return path
+    
+    def bank_save_setup(size):
+        for name in (fm.BANK_ACCOUNT_FILE, fm.BANK_JOURNAL_FILE):
+            if os.path.exists(os.path.join(bank_dir(size), name)):
+                os.remove(os.path.join(bank_dir(size), name))
+        return bank_dir(size), make_purchases(size)
+    
+    def bank_save_run(state):
+        path, purchases = state
+        with working_dir(path):
+            assert fm.save_bank_data(purchases[-1]['balance_after'], purchases)
+    
+    def bank_load_setup(size):
+        path, purchases = bank_save_setup(size)
+        bank_save_run((path, purchases))
+        return path
+    
+    def bank_load_run(path):
+        with working_dir(path):
+            fm.load_bank_data()
+    
+    return [
+        Case("list_contents", listing_setup, interactive(fm.list_contents)),
+        Case("list_files", listing_setup, interactive(fm.list_files)),
+        Case("list_folders", listing_setup, interactive(fm.list_folders)),
+        # Ответы: формат txt, без gzip
+        Case("save_directory_contents", listing_setup, interactive(fm.save_directory_contents, ["1", "n", "n"])),
+        Case("copy_item", copy_setup, copy_run),
+        Case("delete_item", delete_setup, delete_run),
+        Case("save_bank_data", bank_save_setup, bank_save_run),
+        Case("load_bank_data", bank_load_setup, bank_load_run),
+    ]
+
+class working_dir:
+    """Временная смена текущей директории процесса (файлы счета относительные)"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.previous = None
+    
+    def __enter__(self):
+        self.previous = os.getcwd()
+        os.chdir(self.path)
+    
+    def __exit__(self, *exc):
+        os.chdir(self.previous)
+        return False
+
+def compare_with_baseline(results, baseline, tolerance, noise=0.005):
+    """Сравнение с сохраненными результатами; возвращает список регрессий"""
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get('cases', {}).get(key)
+        if old is None:
+            continue
+        ratio = result['seconds'] / old['seconds'] if old['seconds'] else float('inf')
+        result['baseline_ratio'] = ratio
+        if ratio > 1 + tolerance and result['seconds'] - old['seconds'] > noise:
+            regressions.append((key, old['seconds'], result['seconds'], ratio))
+    return regressions
+
+def bench_ops(args):
+    """Операции меню на синтетических данных: время, системные вызовы, память"""
+    base = args.dir or tempfile.mkdtemp(prefix="fm_bench_")
+    if args.profile:
+        os.makedirs(args.profile, exist_ok=True)
+    selected = set(args.cases.split(',')) if args.cases else None
+    results = {}
+    try:
+        print(f"{'операция':<26}{'размер':>9}{'время, с':>11}{'файл. выз.':>12}"
+              f"{'read':>9}{'write':>9}{'пик, КБ':>10}")
+        for size in args.sizes:
+            for case in build_cases(base):
+                if selected and case.name not in selected:
+                    continue
+                result = run_case(case, size, args, args.profile)
+                results[f"{case.name}/{size}"] = result
+                print(f"{case.name:<26}{size:>9}{result['seconds']:>11.3f}{result['audit_calls']:>12}"
+                      f"{result['read_calls'] if result['read_calls'] is not None else '-':>9}"
+                      f"{result['write_calls'] if result['write_calls'] is not None else '-':>9}"
+                      f"{result['peak_kb']:>10}")
+    finally:
+        fm.working_directory = os.getcwd()
+        if not args.dir and not args.keep:
+            shutil.rmtree(base, ignore_errors=True)
+    
+    status = 0
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        print(f"\nСравнение с {args.baseline} (допуск {args.tolerance:.0%}):")
+        if not regressions:
+            print("регрессий нет")
+        for key, old, new, ratio in regressions:
+            print(f"РЕГРЕССИЯ {key}: {old:.3f} с -> {new:.3f} с ({ratio:.2f}x)")
+            status = 1
+    
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({
+                'created': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'repeat': args.repeat,
+                'cases': results,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\nБазовые результаты сохранены в {args.baseline}")
+    return status
+
+# ========== ВРЕМЯ ЗАПУСКА ==========
+
+# Модули, которые должны загружаться только действием, которому они нужны
+LAZY_MODULES = ["shutil", "platform", "json", "sqlite3", "concurrent.futures", "tempfile", "gzip",
+                "csv", "hashlib", "mmap", "argparse", "shlex", "decimal", "pickle", "subprocess", "ctypes",
+                "tarfile", "zipfile", "zlib", "queue"]
+
+def parse_importtime(stderr):
+    """Строки -X importtime: список (модуль, собственное время, суммарное время) в мкс"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            continue  # строка заголовка
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+def measure_import(module_dir, module="file_manager_07"):
+    """Один запуск интерпретатора с -X importtime: (модули при импорте, мкс, мс процесса)"""
+    env = dict(os.environ, PYTHONPATH=module_dir, FM_METRICS="1")
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, env=env, check=True)
+    wall_ms = (time.perf_counter() - start) * 1000
+    modules = parse_importtime(result.stderr)
+    # Все, что импортировано после site, загружено импортом модуля
+    site_index = max(i for i, (name, _, _) in enumerate(modules) if name == "site")
+    own = modules[site_index + 1:]
+    total_us = next(cumulative for name, _, cumulative in own if name == module)
+    return own, total_us, wall_ms
+
+def bench_startup(args):
+    """Проверка бюджета времени импорта file_manager_07 по -X importtime"""
+    module_dir = os.path.dirname(os.path.abspath(fm.__file__))
+    runs = [measure_import(module_dir) for _ in range(args.repeat)]
+    own, total_us, wall_ms = min(runs, key=lambda run: run[1])
+    base_ms = timed(subprocess.run, [sys.executable, "-c", "pass"], repeat=args.repeat)[0] * 1000
+    
+    print(f"Импорт file_manager_07: {total_us / 1000:.1f} мс (лучший из {args.repeat}), "
+          f"бюджет {args.budget_ms:.1f} мс")
+    print(f"Процесс целиком: {wall_ms:.1f} мс, пустой интерпретатор: {base_ms:.1f} мс")
+    print("\nСамые дорогие модули (собственное время):")
+    for name, self_us, cumulative_us in sorted(own, key=lambda m: m[1], reverse=True)[:10]:
+        print(f"  {name:<32}{self_us / 1000:>8.2f} мс{cumulative_us / 1000:>10.2f} мс всего")
+    
+    loaded = {name for name, _, _ in own}
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    status = 0
+    if eager:
+        print(f"\nОШИБКА: при запуске загружены отложенные модули: {', '.join(eager)}")
+        status = 1
+    if total_us / 1000 > args.budget_ms:
+        print(f"\nОШИБКА: импорт дольше бюджета на {total_us / 1000 - args.budget_ms:.1f} мс")
+        status = 1
+    if not status:
+        print("\nБюджет запуска соблюден")
+    return status
+
+# ========== ЗАПУСК ==========
+
+def parse_sizes(value):
+    """Разбор списка размеров вида 10000,100000"""
+    return [int(v) for v in value.split(',') if v.strip()]
+
+def build_parser():
+    """Параметры командной строки бенчмарков"""
+    parser = argparse.ArgumentParser(description="Бенчмарки файлового менеджера")
+    parser.add_argument('--dir', help="каталог для синтетических данных (сохраняется между запусками)")
+    parser.add_argument('--keep', action='store_true', help="не удалять временные данные")
+    parser.add_argument('--repeat', type=int, default=3, help="число повторов каждого замера")
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    listing = sub.add_parser('listing', help="листинг: os.listdir против os.scandir")
+    listing.add_argument('--sizes', type=parse_sizes, default=[10_000, 100_000, 1_000_000])
+    listing.set_defaults(func=bench_listing)
+
+    du = sub.add_parser('du', help="размеры папок: os.walk против disk_usage")
+    du.add_argument('--sizes', type=parse_sizes, default=[10_000, 100_000, 1_000_000])
+    du.set_defaults(func=bench_du)
+
+    history = sub.add_parser('history', help="история покупок: пересчет против индексов")
+    history.add_argument('--sizes', type=parse_sizes, default=[10_000, 100_000, 1_000_000])
+    history.set_defaults(func=bench_history)
+
+    memory = sub.add_parser('memory', help="память истории покупок: словари против колонок")
+    memory.add_argument('--sizes', type=parse_sizes, default=[10_000, 100_000, 1_000_000])
+    memory.set_defaults(func=bench_memory)
+    
+    ops = sub.add_parser('ops', help="операции меню: время, системные вызовы, пиковая память")
+    ops.add_argument('--sizes', type=parse_sizes, default=[1_000, 10_000, 100_000])
+    ops.add_argument('--cases', help="только указанные операции через запятую, например list_files,copy_item")
+    ops.add_argument('--profile', metavar='DIR', help="сохранить профили cProfile и отчеты tracemalloc в DIR")
+    ops.add_argument('--baseline', default="benchmark_baseline.json", help="файл базовых результатов")
+    ops.add_argument('--save-baseline', action='store_true', help="записать результаты как базовые")
+    ops.add_argument('--tolerance', type=float, default=0.25, help="допустимое замедление (0.25 = 25%%)")
+    ops.set_defaults(func=bench_ops)
+    
+    startup = sub.add_parser('startup', help="время импорта по -X importtime и проверка бюджета")
+    startup.add_argument('--budget-ms', type=float, default=25.0, help="допустимое время импорта, мс")
+    startup.set_defaults(func=bench_startup)
+    return parser
+
+def main(argv=None):
+    """Точка входа бенчмарков"""
+    args = build_parser().parse_args(argv)
+    return args.func(args) or 0
+
+if __name__ == "__main__":
+    sys.exit(main())
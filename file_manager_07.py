@@ -3,62 +3,1595 @@
 Версия 2.0 с сохранением данных и экспортом содержимого
 """
 import os
-import shutil
-import platform
 import sys
-from datetime import datetime
-import json
+from datetime import datetime, timedelta
+from array import array
+from collections import namedtuple, OrderedDict, defaultdict, deque
+from operator import attrgetter
+from itertools import islice
+import heapq
+import bisect
+import stat
+import threading
+import time
+import builtins
+import functools
+import struct
+# Тяжелые модули (shutil, platform, json, sqlite3, concurrent.futures, tempfile,
+# gzip, csv, hashlib, argparse...) импортируются внутри функций, которым они
+# нужны: запуск программы не платит за действия, которые не будут выбраны.
 
 # Глобальная переменная для рабочей директории
 working_directory = os.getcwd()
 
 # Константы для файлов с данными
 BANK_ACCOUNT_FILE = "bank_account.json"
+BANK_JOURNAL_FILE = "bank_account.journal"
 LISTDIR_FILE = "listdir.txt"
 
+# ========== ВЫВОД НА ЭКРАН ==========
+
+# ANSI: курсор в левый верхний угол, очистка экрана и буфера прокрутки
+ANSI_CLEAR = "\033[H\033[2J\033[3J"
+# ANSI: на строку вверх и очистка ее целиком (стирает эхо введенной команды)
+ANSI_ERASE_PROMPT = "\033[1A\033[2K\r"
+
+class Screen:
+    """Буферизованный вывод экранов без запуска внешних команд.
+
+    Экран собирается в список строк и выводится одним sys.stdout.write
+    вместе с ANSI-очисткой. Если кадр совпадает с предыдущим и с тех пор
+    на терминале появилась только строка ввода, кадр не перерисовывается -
+    стирается лишь эта строка. Любой вывод мимо Screen должен начинаться
+    с clear_screen() или заканчиваться wait_for_enter(), которые
+    сбрасывают запомненный кадр.
+    """
+    
+    def __init__(self):
+        self.last_frame = None
+        self.vt_enabled = False
+        self.redraws = 0
+        self.skipped = 0
+    
+    def is_terminal(self):
+        """ANSI-последовательности выводятся только в терминал"""
+        try:
+            interactive = sys.stdout.isatty()
+        except (AttributeError, ValueError):
+            return False
+        if interactive and os.name == 'nt' and not self.vt_enabled:
+            # Пустая команда включает обработку ANSI в консоли Windows (один раз за сеанс)
+            os.system('')
+            self.vt_enabled = True
+        return interactive
+    
+    def invalidate(self):
+        self.last_frame = None
+    
+    def write(self, text):
+        sys.stdout.write(text)
+        sys.stdout.flush()
+    
+    def clear(self):
+        self.last_frame = None
+        if self.is_terminal():
+            self.write(ANSI_CLEAR)
+    
+    def render(self, lines):
+        """Вывод кадра целиком; повторный вывод того же кадра пропускается"""
+        frame = "\n".join(lines) + "\n"
+        terminal = self.is_terminal()
+        if terminal and frame == self.last_frame:
+            self.skipped += 1
+            self.write(ANSI_ERASE_PROMPT)
+        else:
+            self.redraws += 1
+            self.write((ANSI_CLEAR if terminal else "") + frame)
+        self.last_frame = frame
+    
+    def prompt(self, lines, text):
+        """Вывод кадра и чтение ответа пользователя"""
+        self.render(lines)
+        return prompt_input(text)
+    
+    def stats_lines(self):
+        return [f"Перерисовок: {self.redraws}, пропущено без изменений: {self.skipped}"]
+
+screen = Screen()
+
 def clear_screen():
     """Очистка экрана консоли"""
-    os.system('cls' if os.name == 'nt' else 'clear')
+    screen.clear()
+
+def header_lines(title):
+    """Строки заголовка экрана"""
+    return ["=" * 60, f"{title:^60}", "=" * 60]
 
 def print_header(title):
     """Вывод заголовка"""
-    print("=" * 60)
-    print(f"{title:^60}")
-    print("=" * 60)
+    screen.write("\n".join(header_lines(title)) + "\n")
 
 def wait_for_enter():
     """Ожидание нажатия Enter"""
-    input("\nНажмите Enter для продолжения...")
+    prompt_input("\nНажмите Enter для продолжения...")
+    screen.invalidate()
+
+MAIN_MENU_ITEMS = [
+    "1. Создать папку",
+    "2. Удалить (файл/папку)",
+    "3. Копировать (файл/папку)",
+    "4. Просмотр содержимого рабочей директории",
+    "5. Посмотреть только папки",
+    "6. Посмотреть только файлы",
+    "7. Просмотр информации об операционной системе",
+    "8. Создатель программы",
+    "9. Играть в викторину",
+    "10. Мой банковский счет",
+    "11. Смена рабочей директории",
+    "12. Сохранить содержимое директории в файл",
+    "13. Выход",
+    # Новые пункты добавляются после выхода, чтобы не менять привычные номера
+    "14. Диагностика",
+    "15. Анализ занятого места",
+    "16. Поиск файлов",
+    "17. Фоновые задания",
+    "18. Поиск дубликатов",
+    "19. Синхронизация папок",
+    "20. Крупные и новые файлы",
+    "21. Архивировать (tar.gz/zip)",
+    "22. Распаковать архив",
+]
 
 def show_menu():
     """Отображение главного меню"""
-    clear_screen()
-    print_header("КОНСОЛЬНЫЙ ФАЙЛОВЫЙ МЕНЕДЖЕР")
-    print(f"Текущая директория: {working_directory}")
-    print("=" * 60)
-    print("1. Создать папку")
-    print("2. Удалить (файл/папку)")
-    print("3. Копировать (файл/папку)")
-    print("4. Просмотр содержимого рабочей директории")
-    print("5. Посмотреть только папки")
-    print("6. Посмотреть только файлы")
-    print("7. Просмотр информации об операционной системе")
-    print("8. Создатель программы")
-    print("9. Играть в викторину")
-    print("10. Мой банковский счет")
-    print("11. Смена рабочей директории")
-    print("12. Сохранить содержимое директории в файл")  # Новый пункт
-    print("13. Выход")
-    print("=" * 60)
-    return input("Выберите пункт меню: ")
+    lines = header_lines("КОНСОЛЬНЫЙ ФАЙЛОВЫЙ МЕНЕДЖЕР")
+    lines.append(f"Текущая директория: {working_directory}")
+    lines.append("=" * 60)
+    lines.extend(MAIN_MENU_ITEMS)
+    lines.append("=" * 60)
+    return screen.prompt(lines, "Выберите пункт меню: ")
+
+# ========== ПРОГРЕСС ДЛИТЕЛЬНЫХ ОПЕРАЦИЙ ==========
+
+class OperationCancelled(Exception):
+    """Операция прервана по запросу пользователя"""
+
+class Progress:
+    """Потокобезопасные счетчики длительной операции (файлы, байты, ошибки)"""
+    
+    def __init__(self, show_bytes=True):
+        self.lock = threading.Lock()
+        self.show_bytes = show_bytes
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.finished = None
+        self.cancelled = threading.Event()
+        # Дополнительные счетчики отдельных операций (например, синхронизации)
+        self.counters = defaultdict(int)
+    
+    def add(self, files=0, nbytes=0, skipped=0):
+        with self.lock:
+            self.files += files
+            self.bytes += nbytes
+            self.skipped += skipped
+    
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+    
+    def add_error(self, path, error):
+        with self.lock:
+            self.errors.append((path, error))
+    
+    def elapsed(self):
+        return (self.finished or time.monotonic()) - self.started
+    
+    def restart(self):
+        """Отсчет времени с начала фактического выполнения"""
+        self.started = time.monotonic()
+    
+    def finish(self):
+        """Фиксация времени, чтобы скорость не падала после завершения"""
+        self.finished = time.monotonic()
+    
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise OperationCancelled()
+    
+    def status_line(self):
+        """Строка состояния: количество, файлы/с и МБ/с"""
+        elapsed = max(self.elapsed(), 1e-6)
+        parts = [f"Файлов: {self.files} ({self.files / elapsed:.1f} файл/с)"]
+        if self.show_bytes:
+            mb = self.bytes / (1024 * 1024)
+            parts.append(f"{mb:.1f} МБ ({mb / elapsed:.1f} МБ/с)")
+        if self.skipped:
+            parts.append(f"пропущено: {self.skipped}")
+        parts.append(f"ошибок: {len(self.errors)}")
+        return " | ".join(parts)
+
+def run_with_progress(progress, func, *args, interval=0.5):
+    """Выполнение func с обновлением строки прогресса в консоли"""
+    done = threading.Event()
+    
+    def reporter():
+        while not done.wait(interval):
+            sys.stdout.write("\r" + progress.status_line())
+            sys.stdout.flush()
+    
+    thread = threading.Thread(target=reporter, daemon=True)
+    thread.start()
+    try:
+        return func(*args)
+    finally:
+        done.set()
+        thread.join()
+        sys.stdout.write("\r" + progress.status_line() + "\n")
+        sys.stdout.flush()
+
+def print_errors(progress, limit=10):
+    """Сводка ошибок длительной операции"""
+    if not progress.errors:
+        return
+    print(f"\n⚠️ Ошибок: {len(progress.errors)}")
+    for path, error in progress.errors[:limit]:
+        print(f"   {path}: {error}")
+    if len(progress.errors) > limit:
+        print(f"   ... и еще {len(progress.errors) - limit}")
+
+# ========== МЕТРИКИ ДЕЙСТВИЙ ==========
+
+# Верхние границы корзин гистограммы задержек, секунды (как в Prometheus)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRICS_FILES = {'json': "metrics.json", 'prom': "metrics.prom"}
+
+class ActionStats:
+    """Счетчики одного действия на одном томе"""
+    
+    __slots__ = ('calls', 'errors', 'seconds', 'buckets', 'nbytes', 'entries')
+    
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        # Последняя корзина - все, что дольше LATENCY_BUCKETS[-1]
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.nbytes = 0
+        self.entries = 0
+    
+    def observe(self, seconds):
+        self.calls += 1
+        self.seconds += seconds
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    
+    def percentile(self, fraction):
+        """Верхняя граница корзины, в которую попадает доля fraction вызовов"""
+        rank = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+class Metrics:
+    """Метрики действий по паре (действие, том рабочей директории).
+
+    Время ожидания ввода пользователя вычитается из задержки, поэтому
+    гистограмма показывает работу программы, а не паузы человека.
+    Объем обработанных данных сообщает само действие через
+    record_processed(); он относится к самому внутреннему действию
+    текущего потока.
+    """
+    
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.local = threading.local()
+        self.volumes = {}
+        self.directory_volumes = {}
+    
+    def _frames(self):
+        frames = getattr(self.local, 'frames', None)
+        if frames is None:
+            frames = self.local.frames = []
+        return frames
+    
+    def volume_of(self, path):
+        """Точка монтирования тома, на котором лежит path"""
+        try:
+            dev = os.stat(path).st_dev
+        except OSError:
+            return "?"
+        volume = self.volumes.get(dev)
+        if volume is None:
+            volume = os.path.abspath(path)
+            while not os.path.ismount(volume):
+                volume = os.path.dirname(volume)
+            self.volumes[dev] = volume
+        return volume
+    
+    def volume_of_directory(self, directory):
+        """Том рабочей директории; stat выполняется один раз на каждую директорию"""
+        volume = self.directory_volumes.get(directory)
+        if volume is None:
+            volume = self.directory_volumes[directory] = self.volume_of(directory)
+        return volume
+    
+    def call(self, action, func, args, kwargs):
+        """Выполнение func с учетом времени, ошибок и объема обработанного"""
+        frames = self._frames()
+        # [время ожидания ввода, записей, байт, ошибок]
+        frame = [0.0, 0, 0, 0]
+        frames.append(frame)
+        directory = working_directory
+        started = time.perf_counter()
+        failed = False
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = max(0.0, time.perf_counter() - started - frame[0])
+            frames.pop()
+            volume = self.volume_of_directory(directory)
+            with self.lock:
+                stats = self.stats.get((action, volume))
+                if stats is None:
+                    stats = self.stats[(action, volume)] = ActionStats()
+                stats.observe(elapsed)
+                stats.entries += frame[1]
+                stats.nbytes += frame[2]
+                stats.errors += frame[3] + failed
+    
+    def add_wait(self, seconds):
+        for frame in self._frames():
+            frame[0] += seconds
+    
+    def add_processed(self, entries=0, nbytes=0, errors=0):
+        frames = self._frames()
+        if frames:
+            frames[-1][1] += entries
+            frames[-1][2] += nbytes
+            frames[-1][3] += errors
+    
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+    
+    def snapshot(self):
+        """Копия счетчиков, упорядоченная по суммарному времени"""
+        with self.lock:
+            items = [(key, ActionStats.__new__(ActionStats)) for key in self.stats]
+            for (key, copy) in items:
+                original = self.stats[key]
+                for name in ActionStats.__slots__:
+                    value = getattr(original, name)
+                    setattr(copy, name, list(value) if name == 'buckets' else value)
+        return sorted(items, key=lambda item: item[1].seconds, reverse=True)
+    
+    def stats_lines(self):
+        """Строки таблицы для экрана диагностики"""
+        lines = []
+        for (action, volume), stats in self.snapshot():
+            average = stats.seconds / stats.calls * 1000
+            p95 = stats.percentile(0.95)
+            p95_text = f"≤{p95 * 1000:g} мс" if p95 != float('inf') else f">{LATENCY_BUCKETS[-1]:g} с"
+            lines.append(f"{action} [{volume}]")
+            lines.append(f"    вызовов {stats.calls}, ошибок {stats.errors}, среднее {average:.1f} мс, "
+                         f"p95 {p95_text}, записей {stats.entries}, {format_size(stats.nbytes)}")
+        return lines or ["Данных пока нет"]
+    
+    def to_json(self):
+        import json
+        return json.dumps({
+            'buckets': list(LATENCY_BUCKETS),
+            'actions': [{
+                'action': action,
+                'volume': volume,
+                'calls': stats.calls,
+                'errors': stats.errors,
+                'seconds': stats.seconds,
+                'latency_buckets': stats.buckets,
+                'bytes': stats.nbytes,
+                'entries': stats.entries,
+            } for (action, volume), stats in self.snapshot()]
+        }, ensure_ascii=False, indent=2) + "\n"
+    
+    def to_prometheus(self):
+        """Текстовый формат экспозиции Prometheus"""
+        def labels(action, volume, **extra):
+            pairs = dict(action=action, volume=volume, **extra)
+            return "{" + ",".join(f'{k}="{prometheus_escape(v)}"' for k, v in pairs.items()) + "}"
+        
+        snapshot = self.snapshot()
+        lines = []
+        for name, kind, help_text, value in (
+                ("fm_action_calls_total", "counter", "Число вызовов действия", lambda s: s.calls),
+                ("fm_action_errors_total", "counter", "Число ошибок действия", lambda s: s.errors),
+                ("fm_action_bytes_total", "counter", "Обработано байт", lambda s: s.nbytes),
+                ("fm_action_entries_total", "counter", "Обработано записей", lambda s: s.entries)):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for (action, volume), stats in snapshot:
+                lines.append(f"{name}{labels(action, volume)} {value(stats)}")
+        
+        name = "fm_action_latency_seconds"
+        lines.append(f"# HELP {name} Задержка действия без ожидания ввода")
+        lines.append(f"# TYPE {name} histogram")
+        for (action, volume), stats in snapshot:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), stats.buckets):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                lines.append(f"{name}_bucket{labels(action, volume, le=le)} {cumulative}")
+            lines.append(f"{name}_sum{labels(action, volume)} {stats.seconds:.6f}")
+            lines.append(f"{name}_count{labels(action, volume)} {stats.calls}")
+        return "\n".join(lines) + "\n"
+    
+    def dump(self, path):
+        """Сохранение в файл: .prom - формат Prometheus, иначе JSON"""
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        write_file_atomic(path, [text])
+
+def prometheus_escape(value):
+    """Экранирование значения метки: обратная косая черта, кавычка, перевод строки"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+metrics = Metrics(enabled=os.environ.get('FM_METRICS', '1') != '0')
+
+def instrumented(action=None):
+    """Декоратор: учет вызовов, задержки, ошибок и объема обработанного"""
+    def decorate(func):
+        name = action or func.__name__
+        
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            return metrics.call(name, func, args, kwargs)
+        return wrapper
+    return decorate
+
+def record_processed(entries=0, nbytes=0, errors=0):
+    """Учет обработанных записей, байт и ошибок текущим действием"""
+    if metrics.enabled:
+        metrics.add_processed(entries, nbytes, errors)
+
+def record_error():
+    """Учет ошибки, обработанной внутри действия"""
+    record_processed(errors=1)
+
+def prompt_input(prompt=""):
+    """Ввод пользователя; время ожидания не входит в задержку действий"""
+    if not metrics.enabled:
+        return builtins.input(prompt)
+    started = time.perf_counter()
+    try:
+        return builtins.input(prompt)
+    finally:
+        metrics.add_wait(time.perf_counter() - started)
+
+# ========== ДВИЖОК КОПИРОВАНИЯ ==========
+
+# Число потоков копирования
+COPY_WORKERS = min(16, (os.cpu_count() or 1) * 4)
+# Файлы от этого размера копируются средствами ядра (copy_file_range/sendfile)
+ZERO_COPY_THRESHOLD = 1024 * 1024
+# Размер порции для copy_file_range/sendfile и для обычного чтения
+ZERO_COPY_BLOCK = 64 * 1024 * 1024
+COPY_CHUNK_SIZE = 1024 * 1024
+# Недокопированный файл пишется под временным именем и переименовывается в конце
+PARTIAL_SUFFIX = ".fmpart"
+# Допуск сравнения mtime для ФС с грубым временем (у FAT/SMB точность до 2 секунд).
+# По умолчанию mtime сравнивается точно: copystat переносит его в наносекундах.
+MTIME_TOLERANCE = 2.0
+
+def _zero_copy(in_fd, out_fd, progress):
+    """Копирование средствами ядра; возвращает (байт скопировано, достигнут ли конец)"""
+    copied = 0
+    for name in ('copy_file_range', 'sendfile'):
+        func = getattr(os, name, None)
+        if func is None:
+            continue
+        try:
+            if name == 'sendfile':
+                # sendfile пишет с текущей позиции выходного файла
+                os.lseek(out_fd, copied, os.SEEK_SET)
+            while True:
+                if name == 'copy_file_range':
+                    sent = func(in_fd, out_fd, ZERO_COPY_BLOCK, copied, copied)
+                else:
+                    sent = func(out_fd, in_fd, copied, ZERO_COPY_BLOCK)
+                if not sent:
+                    return copied, True
+                copied += sent
+                progress.add(nbytes=sent)
+                progress.check_cancelled()
+        except OSError:
+            # Не поддерживается этой ФС или ядром - пробуем следующий способ
+            continue
+    return copied, False
+
+def copy_file_data(fsrc, fdst, size, progress):
+    """Копирование содержимого файла: zero-copy для больших файлов, иначе порциями"""
+    copied = 0
+    if size >= ZERO_COPY_THRESHOLD:
+        copied, finished = _zero_copy(fsrc.fileno(), fdst.fileno(), progress)
+        if finished:
+            return
+    
+    fsrc.seek(copied)
+    fdst.seek(copied)
+    buffer = bytearray(min(COPY_CHUNK_SIZE, max(size, 1)))
+    view = memoryview(buffer)
+    while True:
+        n = fsrc.readinto(buffer)
+        if not n:
+            break
+        fdst.write(view[:n])
+        progress.add(nbytes=n)
+        progress.check_cancelled()
+
+def mtimes_match(first_ns, second_ns, tolerance=0.0):
+    """mtime совпадает: точно (в наносекундах) или с допуском tolerance секунд"""
+    if tolerance:
+        return abs(first_ns - second_ns) <= tolerance * 1_000_000_000
+    return first_ns == second_ns
+
+def is_copy_complete(src_stat, dst_path, tolerance=0.0):
+    """Файл назначения уже полностью скопирован (размер и mtime совпадают)"""
+    try:
+        dst_stat = os.stat(dst_path)
+    except OSError:
+        return False
+    return (dst_stat.st_size == src_stat.st_size
+            and mtimes_match(dst_stat.st_mtime_ns, src_stat.st_mtime_ns, tolerance))
+
+def copy_one_file(src, dst, progress, force=False):
+    """Копирование одного файла с метаданными, как shutil.copy2.
+
+    Возвращает True, если файл был скопирован. При force файл копируется,
+    даже если размер и mtime копии совпадают с исходным.
+    """
+    import shutil
+    partial = dst + PARTIAL_SUFFIX
+    if progress.cancelled.is_set():
+        return False
+    try:
+        src_stat = os.stat(src)
+        if not force and is_copy_complete(src_stat, dst):
+            progress.add(skipped=1)
+            return False
+        with open(src, 'rb') as fsrc, open(partial, 'wb') as fdst:
+            copy_file_data(fsrc, fdst, src_stat.st_size, progress)
+        shutil.copystat(src, partial)
+        os.replace(partial, dst)
+        progress.add(files=1)
+        return True
+    except Exception as e:
+        if not isinstance(e, OperationCancelled):
+            progress.add_error(src, e)
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        return False
+
+def walk_copy_plan(source, dest, dir_pairs, progress):
+    """Один проход по исходному дереву: создает папки и выдает пары файлов"""
+    stack = [(source, dest)]
+    while stack:
+        src_dir, dst_dir = stack.pop()
+        try:
+            os.makedirs(dst_dir, exist_ok=True)
+            dir_pairs.append((src_dir, dst_dir))
+            with os.scandir(src_dir) as it:
+                for entry in it:
+                    dst_path = os.path.join(dst_dir, entry.name)
+                    if entry.is_dir():
+                        stack.append((entry.path, dst_path))
+                    else:
+                        yield entry.path, dst_path
+        except OSError as e:
+            progress.add_error(src_dir, e)
+
+def copy_tree(source, dest, workers=COPY_WORKERS, progress=None):
+    """Параллельное копирование файла или дерева папок.
+
+    Дерево обходится один раз, файлы копируются пулом потоков. Уже
+    скопированные файлы (совпадают размер и mtime) пропускаются, поэтому
+    прерванное копирование можно продолжить повторным запуском.
+    Метаданные папок копируются в конце, снизу вверх, как в copytree.
+    """
+    progress = progress or Progress()
+    if not os.path.isdir(source):
+        copy_one_file(source, dest, progress)
+        return progress
+    
+    dir_pairs = []
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for src_path, dst_path in walk_copy_plan(source, dest, dir_pairs, progress):
+            if progress.cancelled.is_set():
+                break
+            pending.add(pool.submit(copy_one_file, src_path, dst_path, progress))
+            # Ограничиваем число задач в очереди, чтобы не держать в памяти все дерево
+            if len(pending) >= workers * 4:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+    
+    if progress.cancelled.is_set():
+        return progress
+    import shutil
+    for src_dir, dst_dir in reversed(dir_pairs):
+        try:
+            shutil.copystat(src_dir, dst_dir)
+        except OSError as e:
+            progress.add_error(dst_dir, e)
+    return progress
+
+# ========== ДВИЖОК УДАЛЕНИЯ ==========
+
+# Число потоков удаления и размер пачки (файлов или папок) на одно задание пула
+DELETE_WORKERS = min(16, (os.cpu_count() or 1) * 4)
+DELETE_BATCH = 256
+
+def format_size(nbytes):
+    """Размер в удобных единицах"""
+    for unit in ("байт", "КБ", "МБ", "ГБ"):
+        if nbytes < 1024 or unit == "ГБ":
+            return f"{nbytes} {unit}" if unit == "байт" else f"{nbytes:.1f} {unit}"
+        nbytes /= 1024
+
+def measure_tree(path):
+    """Быстрый подсчет файлов, папок и байт в дереве (символические ссылки не раскрываются)"""
+    files = dirs = total = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        dirs += 1
+                        stack.append(entry.path)
+                    else:
+                        files += 1
+                        try:
+                            total += entry.stat(follow_symlinks=False).st_size
+                        except OSError:
+                            pass
+        except OSError:
+            pass
+    return files, dirs, total
+
+def _unlink_batch(names, dir_fd, root, progress):
+    """Удаление пачки файлов относительно дескриптора папки"""
+    for name in names:
+        try:
+            os.unlink(name, dir_fd=dir_fd)
+            progress.add(files=1)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            progress.add_error(os.path.join(root, name), e)
+
+def _unlink_groups(groups, progress):
+    """Удаление пачки файлов из нескольких папок: [(папка, [имена])]"""
+    for root, names in groups:
+        try:
+            dir_fd = os.open(root, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW)
+        except OSError as e:
+            progress.add_error(root, e)
+            continue
+        try:
+            _unlink_batch(names, dir_fd, root, progress)
+        finally:
+            os.close(dir_fd)
+
+def _remove_dirs(paths, progress):
+    """Удаление пачки опустевших папок"""
+    for path in paths:
+        try:
+            os.rmdir(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            progress.add_error(path, e)
+
+def delete_tree(path, workers=DELETE_WORKERS, progress=None):
+    """Параллельное удаление файла или дерева папок снизу вверх.
+
+    Обход дерева раздает пулу потоков пачки по DELETE_BATCH файлов,
+    собранные из разных папок подряд, поэтому параллельно удаляется и
+    дерево из множества мелких папок. Файлы удаляются по дескриптору
+    своей папки (dir_fd). Затем папки удаляются уровнями, начиная с
+    самых глубоких, - тоже пачками в пуле. Ошибки отдельных файлов не
+    прерывают удаление и собираются в progress.
+    """
+    progress = progress or Progress(show_bytes=False)
+    if os.path.islink(path) or not os.path.isdir(path):
+        try:
+            os.unlink(path)
+            progress.add(files=1)
+        except OSError as e:
+            progress.add_error(path, e)
+        return progress
+    
+    from concurrent.futures import ThreadPoolExecutor, wait
+    
+    # Прочитанные папки по глубине; непрочитанную папку удалить нельзя
+    levels = defaultdict(list)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = []
+        groups, count = [], 0
+        stack = [(path, 0)]
+        while stack and not progress.cancelled.is_set():
+            folder, depth = stack.pop()
+            names = []
+            try:
+                with os.scandir(folder) as it:
+                    for entry in it:
+                        # Символическая ссылка на папку удаляется как файл
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, depth + 1))
+                        else:
+                            names.append(entry.name)
+            except OSError as e:
+                progress.add_error(folder, e)
+                continue
+            levels[depth].append(folder)
+            start = 0
+            while start < len(names):
+                part = names[start:start + DELETE_BATCH - count]
+                start += len(part)
+                groups.append((folder, part))
+                count += len(part)
+                if count == DELETE_BATCH:
+                    futures.append(pool.submit(_unlink_groups, groups, progress))
+                    groups, count = [], 0
+        if groups:
+            futures.append(pool.submit(_unlink_groups, groups, progress))
+        wait(futures)
+        
+        for depth in sorted(levels, reverse=True):
+            if progress.cancelled.is_set():
+                break
+            folders = levels.pop(depth)
+            wait([pool.submit(_remove_dirs, folders[i:i + DELETE_BATCH], progress)
+                  for i in range(0, len(folders), DELETE_BATCH)])
+    return progress
+
+# ========== СИНХРОНИЗАЦИЯ ПАПОК ==========
+
+# Блок сравнения содержимого и блочного обновления файлов
+SYNC_BLOCK = 1024 * 1024
+# Измененные файлы от этого размера обновляются на месте, блоками:
+# перезаписываются только блоки, которые отличаются от исходного файла
+SYNC_DELTA_THRESHOLD = 16 * 1024 * 1024
+# Сколько файлов может ждать копирования, прежде чем обход деревьев приостановится
+SYNC_QUEUE_LIMIT = 10000
+
+def same_metadata(record, other, tolerance=0.0):
+    """Файлы совпадают по размеру и mtime (точно или с допуском tolerance секунд)"""
+    return (record.size == other.size and record.mtime_ns is not None and other.mtime_ns is not None
+            and mtimes_match(record.mtime_ns, other.mtime_ns, tolerance))
+
+def same_content(src, dst, progress):
+    """Побайтовое сравнение двух файлов блоками до первого расхождения"""
+    src_buffer = bytearray(SYNC_BLOCK)
+    dst_buffer = bytearray(SYNC_BLOCK)
+    src_view = memoryview(src_buffer)
+    dst_view = memoryview(dst_buffer)
+    with open(src, 'rb') as fsrc, open(dst, 'rb') as fdst:
+        while True:
+            n = fsrc.readinto(src_buffer)
+            m = fdst.readinto(dst_buffer)
+            if n != m or src_view[:n] != dst_view[:n]:
+                return False
+            if not n:
+                return True
+            progress.add(nbytes=n)
+            progress.check_cancelled()
+
+def delta_update(src, dst, progress):
+    """Блочное обновление копии на месте: записываются только отличающиеся блоки.
+
+    Чтение обоих файлов дешевле перезаписи всего файла, если изменилась
+    малая его часть. mtime копии выставляется только в конце, поэтому
+    прерванное обновление будет повторено при следующей синхронизации.
+    """
+    written = 0
+    src_buffer = bytearray(SYNC_BLOCK)
+    dst_buffer = bytearray(SYNC_BLOCK)
+    src_view = memoryview(src_buffer)
+    dst_view = memoryview(dst_buffer)
+    with open(src, 'rb') as fsrc, open(dst, 'r+b') as fdst:
+        offset = 0
+        while True:
+            n = fsrc.readinto(src_buffer)
+            if not n:
+                break
+            m = fdst.readinto(dst_buffer)
+            if m != n or src_view[:n] != dst_view[:n]:
+                fdst.seek(offset)
+                fdst.write(src_view[:n])
+                written += n
+            offset += n
+            progress.add(nbytes=n)
+            progress.check_cancelled()
+        fdst.truncate(offset)
+    progress.count('delta_written', written)
+
+def sync_one_file(src, dst, dst_record, checksum, tolerance, progress):
+    """Обновление одного файла копии; dst_record - запись о текущей копии или None"""
+    import shutil
+    if progress.cancelled.is_set():
+        return
+    try:
+        if dst_record is not None:
+            src_stat = os.stat(src)
+            if checksum and dst_record.size == src_stat.st_size and same_content(src, dst, progress):
+                if not mtimes_match(dst_record.mtime_ns, src_stat.st_mtime_ns, tolerance):
+                    shutil.copystat(src, dst)
+                    progress.count('touched')
+                progress.add(skipped=1)
+                return
+            # На месте обновляем только большие файлы без жестких ссылок,
+            # чтобы не изменить заодно другие имена того же файла
+            if (dst_record.nlink == 1
+                    and min(src_stat.st_size, dst_record.size) >= SYNC_DELTA_THRESHOLD):
+                delta_update(src, dst, progress)
+                shutil.copystat(src, dst)
+                progress.add(files=1)
+                progress.count('delta')
+                return
+    except Exception as e:
+        if not isinstance(e, OperationCancelled):
+            progress.add_error(src, e)
+        return
+    if copy_one_file(src, dst, progress, force=True):
+        progress.count('updated' if dst_record is not None else 'new')
+
+def remove_from_mirror(path, progress):
+    """Удаление лишнего (или другого типа) элемента копии"""
+    removed = delete_tree(path, 1, Progress(show_bytes=False))
+    progress.count('deleted', removed.files)
+    for error_path, error in removed.errors:
+        progress.add_error(error_path, error)
+    return not removed.errors
+
+def compare_directories(src_dir, dst_dir, checksum, delete_extra, tolerance, dir_pairs, progress):
+    """Сравнение одной пары папок; возвращает (подпапки, файлы для обновления).
+
+    Совпадающие по размеру и mtime файлы отсеиваются сразу (без checksum),
+    так что в очередь копирования попадают только новые и измененные.
+    """
+    try:
+        src_records = {record.name: record for record in scan_directory(src_dir)}
+    except OSError as e:
+        progress.add_error(src_dir, e)
+        return [], []
+    try:
+        # Ссылки в копии не раскрываются, чтобы не писать за ее пределы
+        dst_records = {record.name: record for record in scan_directory(dst_dir, follow_symlinks=False)}
+    except FileNotFoundError:
+        dst_records = {}
+        try:
+            os.makedirs(dst_dir, exist_ok=True)
+            progress.count('dirs')
+        except OSError as e:
+            progress.add_error(dst_dir, e)
+            return [], []
+    except OSError as e:
+        progress.add_error(dst_dir, e)
+        return [], []
+    dir_pairs.append((src_dir, dst_dir))
+    
+    subdirs = []
+    files = []
+    for name, record in src_records.items():
+        src_path = os.path.join(src_dir, name)
+        dst_path = os.path.join(dst_dir, name)
+        other = dst_records.pop(name, None)
+        if record.is_dir:
+            if other is not None and not other.is_dir and not remove_from_mirror(dst_path, progress):
+                continue
+            subdirs.append((src_path, dst_path))
+            continue
+        if other is not None and not other.is_file:
+            if not remove_from_mirror(dst_path, progress):
+                continue
+            other = None
+        if other is not None and not checksum and same_metadata(record, other, tolerance):
+            progress.add(skipped=1)
+            continue
+        files.append((src_path, dst_path, other))
+    
+    if delete_extra:
+        for name in dst_records:
+            remove_from_mirror(os.path.join(dst_dir, name), progress)
+    return subdirs, files
+
+def mirror_tree(source, dest, checksum=False, delete_extra=False, workers=COPY_WORKERS, progress=None,
+                tolerance=0.0):
+    """Односторонняя инкрементальная синхронизация dest с source.
+
+    Исходное дерево и копия обходятся одновременно пулом потоков, по
+    паре папок на задачу. Копируются только новые и измененные файлы
+    (размер или mtime отличаются, а при checksum - и содержимое). mtime
+    сравнивается точно; допуск tolerance секунд нужен только для копий
+    на ФС с грубым временем (FAT/SMB, см. MTIME_TOLERANCE). Большие
+    измененные файлы обновляются блоками. При delete_extra из копии
+    удаляется все, чего нет в исходном дереве. В progress.counters
+    попадают new, updated, delta, delta_written, touched, deleted и dirs.
+    """
+    progress = progress or Progress()
+    if not os.path.isdir(source):
+        try:
+            st = os.lstat(dest)
+            other = DirRecord(os.path.basename(dest), stat.S_ISDIR(st.st_mode), stat.S_ISREG(st.st_mode),
+                              st.st_size, st.st_mtime, st.st_ino, st.st_nlink, st.st_mtime_ns)
+        except FileNotFoundError:
+            other = None
+        if other is not None and not other.is_file:
+            if not remove_from_mirror(dest, progress):
+                return progress
+            other = None
+        if other is not None and not checksum and is_copy_complete(os.stat(source), dest, tolerance):
+            progress.add(skipped=1)
+        else:
+            sync_one_file(source, dest, other, checksum, tolerance, progress)
+        return progress
+    
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    dir_pairs = []
+    dirs = [(source, dest)]
+    queue = deque()
+    scans = set()
+    copies = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while dirs or queue or scans or copies:
+            if progress.cancelled.is_set():
+                dirs.clear()
+                queue.clear()
+            while queue and len(copies) < workers * 4:
+                copies.add(pool.submit(sync_one_file, *queue.popleft(), checksum, tolerance, progress))
+            while dirs and len(scans) < workers and len(queue) < SYNC_QUEUE_LIMIT:
+                src_dir, dst_dir = dirs.pop()
+                scans.add(pool.submit(compare_directories, src_dir, dst_dir,
+                                      checksum, delete_extra, tolerance, dir_pairs, progress))
+            if not (scans or copies):
+                continue
+            done, _ = wait(scans | copies, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in scans:
+                    scans.discard(future)
+                    subdirs, files = future.result()
+                    dirs.extend(subdirs)
+                    queue.extend(files)
+                else:
+                    copies.discard(future)
+    
+    if progress.cancelled.is_set():
+        return progress
+    import shutil
+    # Задача папки добавляется раньше задач ее подпапок - обратный порядок идет снизу вверх
+    for src_dir, dst_dir in reversed(dir_pairs):
+        try:
+            shutil.copystat(src_dir, dst_dir)
+        except OSError as e:
+            progress.add_error(dst_dir, e)
+    return progress
+
+# ========== АРХИВЫ ==========
+
+# Поток архива делится на блоки, которые сжимаются независимо на всех ядрах
+# (как в pigz); блоки склеиваются в один поток deflate
+ARCHIVE_WORKERS = os.cpu_count() or 1
+ARCHIVE_CHUNK = 1024 * 1024
+ARCHIVE_LEVEL = 6
+# Сколько блоков и действий может ждать записи (ограничивает память)
+ARCHIVE_QUEUE = ARCHIVE_WORKERS * 4
+ARCHIVE_FORMATS = {'tar.gz': ".tar.gz", 'zip': ".zip"}
+# Хвост сжатого потока: пустой последний блок deflate
+DEFLATE_END = b'\x03\x00'
+# Окно deflate: блок сжимается со словарем из конца предыдущего блока
+DEFLATE_WINDOW = 32 * 1024
+
+def deflate_block(data, window=b'', level=ARCHIVE_LEVEL):
+    """Сжатие блока в сырой deflate без последнего блока (завершается sync flush).
+
+    Такие блоки можно сжимать параллельно и склеивать подряд: вместе с
+    DEFLATE_END получается обычный поток deflate. Словарь из конца
+    предыдущего блока сохраняет степень сжатия на границах блоков.
+    """
+    import zlib
+    if window:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=window)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+class ArchiveStream:
+    """Упорядоченная запись архива со сжатием блоков на пуле потоков.
+
+    В очередь ставятся действия записи по порядку: готовые байты, блоки
+    на сжатии и служебные действия (например, исправление заголовка zip
+    после данных файла). Действия выполняются строго по порядку, и
+    когда очередь заполнена, запись ждет самого старого из них, поэтому
+    в памяти не больше ARCHIVE_QUEUE блоков.
+    """
+    
+    def __init__(self, fileobj, pool, progress, level=ARCHIVE_LEVEL, limit=ARCHIVE_QUEUE):
+        self.fileobj = fileobj
+        self.pool = pool
+        self.progress = progress
+        self.level = level
+        self.limit = limit
+        self.pending = deque()
+        self.window = b''
+    
+    def _push(self, action):
+        self.pending.append(action)
+        while len(self.pending) > self.limit:
+            self.pending.popleft()()
+    
+    def literal(self, data):
+        """Запись байт как есть (заголовки)"""
+        self._push(functools.partial(self.fileobj.write, data))
+    
+    def call(self, func):
+        """Действие в момент, когда все поставленное раньше уже записано"""
+        self._push(func)
+    
+    def compress(self, data):
+        """Сжатие блока на пуле; результат будет записан в свою очередь"""
+        self.progress.check_cancelled()
+        future = self.pool.submit(deflate_block, data, self.window, self.level)
+        self.window = data[-DEFLATE_WINDOW:]
+        self.progress.add(nbytes=len(data))
+        self._push(lambda: self.fileobj.write(future.result()))
+    
+    def end_deflate(self):
+        """Завершение текущего потока deflate; следующий начинается без словаря"""
+        self.literal(DEFLATE_END)
+        self.window = b''
+    
+    def flush(self):
+        while self.pending:
+            self.pending.popleft()()
+
+def iter_archive_members(source, progress):
+    """Элементы архива: (путь, имя в архиве, DirEntry или None для корня).
+
+    Папка идет раньше своего содержимого; ссылки на папки не раскрываются.
+    """
+    root_name = os.path.basename(os.path.abspath(source))
+    yield source, root_name, None
+    if os.path.islink(source) or not os.path.isdir(source):
+        return
+    stack = [(source, root_name)]
+    while stack:
+        path, arcname = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    member_name = f"{arcname}/{entry.name}"
+                    yield entry.path, member_name, entry
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, member_name))
+        except OSError as e:
+            progress.add_error(path, e)
+
+class GzipChunker:
+    """Файловый объект для tarfile: режет поток tar на блоки и пишет gzip"""
+    
+    def __init__(self, stream, mtime):
+        self.stream = stream
+        self.buffer = bytearray()
+        self.crc = 0
+        self.size = 0
+        stream.literal(struct.pack('<BBBBLBB', 0x1f, 0x8b, 8, 0, int(mtime), 0, 3))
+    
+    def write(self, data):
+        import zlib
+        self.crc = zlib.crc32(data, self.crc)
+        self.size += len(data)
+        self.buffer += data
+        while len(self.buffer) >= ARCHIVE_CHUNK:
+            self.stream.compress(bytes(self.buffer[:ARCHIVE_CHUNK]))
+            del self.buffer[:ARCHIVE_CHUNK]
+        return len(data)
+    
+    def close(self):
+        if self.buffer:
+            self.stream.compress(bytes(self.buffer))
+            self.buffer.clear()
+        self.stream.end_deflate()
+        self.stream.literal(struct.pack('<LL', self.crc, self.size & 0xFFFFFFFF))
+
+def write_tar_gz(fileobj, source, stream, progress):
+    """Потоковая запись tar.gz: tarfile пишет в GzipChunker, сжатие - блоками на пуле"""
+    import tarfile
+    chunker = GzipChunker(stream, time.time())
+    with tarfile.open(fileobj=chunker, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+        for path, arcname, _ in iter_archive_members(source, progress):
+            try:
+                info = tar.gettarinfo(path, arcname)
+                if info is None:
+                    # Сокеты и другие элементы, которые tar не хранит
+                    continue
+                if info.isreg():
+                    with open(path, 'rb') as f:
+                        tar.addfile(info, f)
+                else:
+                    tar.addfile(info)
+                progress.add(files=1)
+            except OperationCancelled:
+                raise
+            except OSError as e:
+                progress.add_error(path, e)
+    chunker.close()
+
+# Флаг "имена в UTF-8" и граница, после которой нужны поля zip64
+ZIP_UTF8_FLAG = 0x800
+ZIP64_LIMIT = (1 << 31) - 1
+
+class ZipEntry:
+    """Запись о файле zip для центрального каталога"""
+    
+    def __init__(self, name, st, is_dir):
+        self.name = name.encode('utf-8', 'surrogateescape') + (b'/' if is_dir else b'')
+        year, month, day, hour, minute, second = time.localtime(st.st_mtime)[:6]
+        if not 1980 <= year <= 2107:
+            # Формат даты MS-DOS хранит годы только с 1980 по 2107
+            year, month, day, hour, minute, second = (1980, 1, 1, 0, 0, 0) if year < 1980 else (2107, 12, 31, 23, 59, 58)
+        self.dos_time = hour << 11 | minute << 5 | second // 2
+        self.dos_date = (year - 1980) << 9 | month << 5 | day
+        self.external = (st.st_mode & 0xFFFF) << 16 | (0x10 if is_dir else 0)
+        self.method = 0 if is_dir else 8
+        # zip64 - заранее, по размеру файла (сжатие может немного увеличить данные)
+        self.zip64 = not is_dir and st.st_size * 1.05 > ZIP64_LIMIT
+        self.crc = 0
+        self.size = 0
+        self.compressed = 0
+        self.offset = 0
+    
+    def version(self):
+        return 45 if self.zip64 else 20
+    
+    def local_header(self):
+        extra = b''
+        sizes = (self.compressed, self.size)
+        if self.zip64:
+            extra = struct.pack('<HHQQ', 1, 16, self.size, self.compressed)
+            sizes = (0xFFFFFFFF, 0xFFFFFFFF)
+        return struct.pack('<4sHHHHHLLLHH', b'PK\x03\x04', self.version(), ZIP_UTF8_FLAG, self.method,
+                           self.dos_time, self.dos_date, self.crc, *sizes,
+                           len(self.name), len(extra)) + self.name + extra
+    
+    def central_header(self):
+        values = []
+        sizes = [self.compressed, self.size]
+        offset = self.offset
+        if self.zip64:
+            values += [self.size, self.compressed]
+            sizes = [0xFFFFFFFF, 0xFFFFFFFF]
+        if offset >= 0xFFFFFFFF:
+            values.append(offset)
+            offset = 0xFFFFFFFF
+        extra = struct.pack(f'<HH{len(values)}Q', 1, 8 * len(values), *values) if values else b''
+        version = max(self.version(), 45 if values else 20)
+        return struct.pack('<4sBBHHHHHLLLHHHHHLL', b'PK\x01\x02', version, 3, version, ZIP_UTF8_FLAG,
+                           self.method, self.dos_time, self.dos_date, self.crc, sizes[0], sizes[1],
+                           len(self.name), len(extra), 0, 0, 0, self.external, offset) + self.name + extra
+
+def write_zip(fileobj, source, stream, progress):
+    """Потоковая запись zip: данные каждого файла сжимаются блоками на пуле.
+
+    Заголовок файла пишется с нулевыми CRC и размерами и исправляется
+    после записи данных (архив пишется в обычный файл с произвольным
+    доступом), центральный каталог - в конце.
+    """
+    import zlib
+    entries = []
+    
+    def begin(entry):
+        entry.offset = fileobj.tell()
+        fileobj.write(entry.local_header())
+    
+    def finish(entry):
+        end = fileobj.tell()
+        entry.compressed = end - entry.offset - len(entry.local_header())
+        if not entry.zip64 and max(entry.size, entry.compressed) >= 0xFFFFFFFF:
+            raise ValueError(f"'{entry.name.decode('utf-8', 'surrogateescape')}' вырос во время архивации")
+        fileobj.seek(entry.offset)
+        fileobj.write(entry.local_header())
+        fileobj.seek(end)
+    
+    buffer = bytearray(ARCHIVE_CHUNK)
+    for path, arcname, dir_entry in iter_archive_members(source, progress):
+        try:
+            if dir_entry is not None and dir_entry.is_symlink() and not os.path.exists(path):
+                continue
+            st = os.stat(path)
+            is_dir = stat.S_ISDIR(st.st_mode)
+            entry = ZipEntry(arcname, st, is_dir)
+            if not is_dir:
+                with open(path, 'rb') as f:
+                    stream.call(functools.partial(begin, entry))
+                    while True:
+                        n = f.readinto(buffer)
+                        if not n:
+                            break
+                        data = bytes(buffer[:n])
+                        entry.crc = zlib.crc32(data, entry.crc)
+                        entry.size += n
+                        stream.compress(data)
+                    stream.end_deflate()
+                    stream.call(functools.partial(finish, entry))
+            else:
+                stream.call(functools.partial(begin, entry))
+            entries.append(entry)
+            progress.add(files=1)
+        except OperationCancelled:
+            raise
+        except OSError as e:
+            progress.add_error(path, e)
+    
+    stream.flush()
+    directory_start = fileobj.tell()
+    for entry in entries:
+        fileobj.write(entry.central_header())
+    directory_end = fileobj.tell()
+    count = len(entries)
+    size = directory_end - directory_start
+    if count >= 0xFFFF or directory_start >= 0xFFFFFFFF:
+        fileobj.write(struct.pack('<4sQHHLLQQQQ', b'PK\x06\x06', 44, 45, 45, 0, 0,
+                                  count, count, size, directory_start))
+        fileobj.write(struct.pack('<4sLQL', b'PK\x06\x07', 0, directory_end, 1))
+        count = min(count, 0xFFFF)
+        directory_start = min(directory_start, 0xFFFFFFFF)
+    fileobj.write(struct.pack('<4sHHHHLLH', b'PK\x05\x06', 0, 0, count, count,
+                              size, directory_start, 0))
+
+ARCHIVE_WRITERS = {
+    'tar.gz': write_tar_gz,
+    'zip': write_zip,
+}
+
+def archive_format(path):
+    """Формат архива по имени файла (None, если не поддерживается)"""
+    name = path.lower()
+    if name.endswith((".tar.gz", ".tgz")):
+        return 'tar.gz'
+    if name.endswith(".zip"):
+        return 'zip'
+    return None
+
+def create_archive(source, archive_path, fmt='tar.gz', workers=ARCHIVE_WORKERS, progress=None):
+    """Потоковая упаковка файла или папки в tar.gz/zip с параллельным сжатием.
+
+    Данные читаются один раз и сразу уходят в архив, без промежуточной
+    копии. Архив пишется под временным именем и переименовывается в
+    конце; при ошибке или отмене временный файл удаляется.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    progress = progress or Progress()
+    partial = archive_path + PARTIAL_SUFFIX
+    try:
+        with open(partial, 'wb') as fileobj, ThreadPoolExecutor(max_workers=workers) as pool:
+            stream = ArchiveStream(fileobj, pool, progress, limit=max(workers, 1) * 4)
+            ARCHIVE_WRITERS[fmt](fileobj, source, stream, progress)
+            stream.flush()
+        os.replace(partial, archive_path)
+    except BaseException as e:
+        try:
+            os.remove(partial)
+        except OSError:
+            pass
+        if not isinstance(e, OperationCancelled):
+            raise
+    return progress
+
+class CancellableReader:
+    """Чтение файла с проверкой отмены перед каждой порцией"""
+    
+    def __init__(self, fileobj, progress):
+        self.fileobj = fileobj
+        self.progress = progress
+    
+    def read(self, size=-1):
+        self.progress.check_cancelled()
+        return self.fileobj.read(size)
+
+def _extract_zip_member(archive, member, dest, progress):
+    """Распаковка одного файла zip (выполняется в пуле потоков)"""
+    if progress.cancelled.is_set():
+        return
+    try:
+        try:
+            archive.extract(member, dest)
+        except FileExistsError:
+            # Общую папку одновременно создал другой поток - повторяем
+            archive.extract(member, dest)
+        progress.add(files=1, nbytes=member.file_size)
+    except Exception as e:
+        progress.add_error(member.filename, e)
+
+class ArchiveError(Exception):
+    """Архив поврежден или не является архивом своего формата"""
+
+def _extract_tar_gz(archive_path, dest, workers, progress):
+    """Распаковка tar.gz одним проходом (tarfile в потоковом режиме)"""
+    import tarfile
+    with open(archive_path, 'rb') as f, \
+            tarfile.open(fileobj=CancellableReader(f, progress), mode='r|gz') as tar:
+        def members():
+            for member in tar:
+                progress.add(files=1, nbytes=member.size)
+                yield member
+        tar.extractall(dest, members=members(), filter='data')
+
+def _extract_zip(archive_path, dest, workers, progress):
+    """Параллельная распаковка файлов zip пулом потоков"""
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    with zipfile.ZipFile(archive_path) as archive, ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for member in archive.infolist():
+            if progress.cancelled.is_set():
+                break
+            if member.is_dir():
+                _extract_zip_member(archive, member, dest, progress)
+                continue
+            pending.add(pool.submit(_extract_zip_member, archive, member, dest, progress))
+            if len(pending) >= workers * 4:
+                _, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+ARCHIVE_EXTRACTORS = {
+    'tar.gz': _extract_tar_gz,
+    'zip': _extract_zip,
+}
+
+def extract_archive(archive_path, dest, workers=ARCHIVE_WORKERS, progress=None):
+    """Потоковая распаковка tar.gz/zip в папку dest.
+
+    tar.gz читается одним проходом (фильтр 'data' не дает записать файлы
+    за пределы dest). Файлы zip сжаты независимо, поэтому распаковываются
+    параллельно. Поврежденный архив дает ArchiveError; папка dest, если
+    ее создала эта распаковка, при этом удаляется.
+    """
+    import tarfile
+    import zipfile
+    import zlib
+    progress = progress or Progress()
+    fmt = archive_format(archive_path)
+    if fmt is None:
+        raise ArchiveError(f"неизвестный формат архива: {os.path.basename(archive_path)}")
+    created = not os.path.exists(dest)
+    os.makedirs(dest, exist_ok=True)
+    try:
+        ARCHIVE_EXTRACTORS[fmt](archive_path, dest, workers, progress)
+    except OperationCancelled:
+        pass
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError, zlib.error) as e:
+        if created:
+            delete_tree(dest, 1, Progress(show_bytes=False))
+        raise ArchiveError(f"'{os.path.basename(archive_path)}' поврежден или не является архивом {fmt}: {e}")
+    return progress
+
+# ========== ФОНОВЫЕ ЗАДАНИЯ ==========
+
+# Число одновременно выполняемых заданий (у каждого свой пул потоков)
+JOB_WORKERS = 4
+
+class Job:
+    """Фоновая операция с файлами: описание, прогресс и состояние"""
+    
+    QUEUED = "в очереди"
+    RUNNING = "выполняется"
+    DONE = "готово"
+    DONE_WITH_ERRORS = "с ошибками"
+    CANCELLED = "отменено"
+    FAILED = "сбой"
+    
+    def __init__(self, number, title, paths, progress, func, args):
+        self.number = number
+        self.title = title
+        self.paths = paths
+        self.progress = progress
+        self.func = func
+        self.args = args
+        self.status = Job.QUEUED
+        self.future = None
+    
+    def is_active(self):
+        return self.status in (Job.QUEUED, Job.RUNNING)
+    
+    def run(self):
+        progress = self.progress
+        if progress.cancelled.is_set():
+            self.status = Job.CANCELLED
+            return
+        self.status = Job.RUNNING
+        progress.restart()
+        try:
+            self.func(*self.args, progress)
+        except Exception as e:
+            progress.add_error(self.title, e)
+            self.status = Job.FAILED
+            return
+        finally:
+            progress.finish()
+        if progress.cancelled.is_set():
+            self.status = Job.CANCELLED
+        elif progress.errors:
+            self.status = Job.DONE_WITH_ERRORS
+        else:
+            self.status = Job.DONE
+    
+    def cancel(self):
+        """Отмена: задание в очереди не запустится, выполняемое остановится"""
+        self.progress.cancelled.set()
+        if self.future is not None and self.future.cancel():
+            self.status = Job.CANCELLED
+    
+    def summary_line(self):
+        line = f"#{self.number} [{self.status}] {self.title}"
+        if self.status != Job.QUEUED:
+            line += f"\n     {self.progress.status_line()}, {self.progress.elapsed():.1f} с"
+        return line
+
+def paths_overlap(first, second):
+    """Один путь совпадает с другим или вложен в него"""
+    first, second = os.path.abspath(first), os.path.abspath(second)
+    return os.path.commonpath([first, second]) in (first, second)
+
+class JobManager:
+    """Очередь фоновых заданий на пуле потоков"""
+    
+    def __init__(self, workers=JOB_WORKERS):
+        self.workers = workers
+        self.pool = None
+        self.jobs = []
+        self.next_number = 1
+        self.lock = threading.Lock()
+    
+    def conflicting(self, paths):
+        """Активное задание, затрагивающее те же файлы, или None"""
+        for job in self.active():
+            if any(paths_overlap(a, b) for a in paths for b in job.paths):
+                return job
+        return None
+    
+    def submit(self, title, paths, func, *args, progress=None):
+        """Постановка задания в очередь; func вызывается как func(*args, progress)"""
+        with self.lock:
+            conflict = self.conflicting(paths)
+            if conflict is not None:
+                raise ValueError(f"те же файлы обрабатывает задание #{conflict.number}")
+            if self.pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+                self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="fm_job")
+            job = Job(self.next_number, title, paths, progress or Progress(), func, args)
+            self.next_number += 1
+            self.jobs.append(job)
+            job.future = self.pool.submit(job.run)
+        return job
+    
+    def active(self):
+        return [job for job in self.jobs if job.is_active()]
+    
+    def find(self, number):
+        for job in self.jobs:
+            if job.number == number:
+                return job
+        return None
+    
+    def clear_finished(self):
+        with self.lock:
+            self.jobs = [job for job in self.jobs if job.is_active()]
+    
+    def shutdown(self, cancel=True):
+        """Остановка пула; при cancel выполняемые задания прерываются"""
+        if cancel:
+            for job in self.active():
+                job.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+job_manager = JobManager()
 
 # ========== ФУНКЦИИ ДЛЯ РАБОТЫ С ФАЙЛАМИ ==========
 
+@instrumented("delete_tree")
+def run_delete(item_path, progress, workers=DELETE_WORKERS):
+    """Удаление с обновлением кэша директорий"""
+    delete_tree(item_path, workers, progress)
+    update_cache_removed(item_path)
+    record_processed(progress.files, 0, len(progress.errors))
+
+@instrumented("copy_tree")
+def run_copy(source_path, dest_path, progress, workers=COPY_WORKERS):
+    """Копирование с обновлением кэша директорий"""
+    copy_tree(source_path, dest_path, workers, progress)
+    update_cache_added(dest_path)
+    record_processed(progress.files, progress.bytes, len(progress.errors))
+
+@instrumented("mirror_tree")
+def run_mirror(source_path, dest_path, checksum, delete_extra, tolerance, progress, workers=COPY_WORKERS):
+    """Синхронизация с обновлением кэша директорий"""
+    mirror_tree(source_path, dest_path, checksum, delete_extra, workers, progress, tolerance)
+    directory_cache.drop_tree(os.path.abspath(dest_path))
+    update_cache_added(dest_path)
+    record_processed(progress.files + progress.skipped, progress.bytes, len(progress.errors))
+
+@instrumented("create_archive")
+def run_archive(source_path, archive_path, fmt, progress, workers=ARCHIVE_WORKERS):
+    """Архивация с обновлением кэша директорий"""
+    create_archive(source_path, archive_path, fmt, workers, progress)
+    if os.path.exists(archive_path):
+        update_cache_added(archive_path)
+    record_processed(progress.files, progress.bytes, len(progress.errors))
+
+@instrumented("extract_archive")
+def run_extract(archive_path, dest_path, progress, workers=ARCHIVE_WORKERS):
+    """Распаковка с обновлением кэша директорий"""
+    extract_archive(archive_path, dest_path, workers, progress)
+    directory_cache.drop_tree(os.path.abspath(dest_path))
+    update_cache_added(dest_path)
+    record_processed(progress.files, progress.bytes, len(progress.errors))
+
+def archive_summary(progress, archive_path=None):
+    """Итог архивации или распаковки: объем, время и скорость"""
+    elapsed = max(progress.elapsed(), 1e-6)
+    line = (f"Файлов: {progress.files}, данных: {format_size(progress.bytes)}, "
+            f"время: {elapsed:.1f} с, скорость: {progress.bytes / elapsed / (1024 * 1024):.1f} МБ/с")
+    if archive_path is not None and progress.bytes:
+        size = os.path.getsize(archive_path)
+        line += f", архив: {format_size(size)} ({size / progress.bytes * 100:.0f}%)"
+    return line
+
+def mirror_summary(progress):
+    """Итог синхронизации одной строкой"""
+    counters = progress.counters
+    parts = [f"новых: {counters['new']}", f"обновлено: {counters['updated'] + counters['delta']}"]
+    if counters['delta']:
+        parts.append(f"из них блочно: {counters['delta']} "
+                     f"(записано {format_size(counters['delta_written'])})")
+    if counters['touched']:
+        parts.append(f"только метаданные: {counters['touched']}")
+    parts.append(f"без изменений: {progress.skipped}")
+    if counters['deleted']:
+        parts.append(f"удалено: {counters['deleted']}")
+    return ", ".join(parts)
+
+def ask_background():
+    """Выбор: выполнить операцию в фоне или дождаться ее здесь"""
+    return prompt_input("Выполнить в фоне? (y/n) [y]: ").strip().lower() != 'n'
+
+def submit_job(title, paths, func, *args, progress=None):
+    """Постановка фонового задания с сообщением для пользователя"""
+    try:
+        job = job_manager.submit(title, paths, func, *args, progress=progress)
+        print(f"✅ Задание #{job.number} запущено. Ход выполнения - в меню 'Задания'.")
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+
+@instrumented()
 def create_folder():
     """Создание папки в рабочей директории"""
     clear_screen()
     print_header("СОЗДАНИЕ ПАПКИ")
-    folder_name = input("Введите название папки: ").strip()
+    folder_name = prompt_input("Введите название папки: ").strip()
     
     if not folder_name:
         print("Ошибка: Название папки не может быть пустым!")
@@ -69,19 +1602,30 @@ def create_folder():
     
     try:
         os.makedirs(folder_path, exist_ok=False)
+        update_cache_added(folder_path)
         print(f"Папка '{folder_name}' успешно создана!")
     except FileExistsError:
+        record_error()
         print(f"Ошибка: Папка '{folder_name}' уже существует!")
     except Exception as e:
+        record_error()
         print(f"Ошибка при создании папки: {e}")
     
     wait_for_enter()
 
-def delete_item():
-    """Удаление файла или папки"""
+@instrumented()
+def delete_item(item_name=None, background=True):
+    """Удаление файла или папки (имя можно передать, например из поиска дубликатов).
+
+    При background=False удаление не ставится в фон, и после возврата
+    элемент уже удален (если пользователь подтвердил).
+    """
     clear_screen()
     print_header("УДАЛЕНИЕ")
-    item_name = input("Введите название файла или папки для удаления: ").strip()
+    if item_name is None:
+        item_name = prompt_input("Введите название файла или папки для удаления: ").strip()
+    else:
+        print(f"Удаляется: {item_name}")
     
     if not item_name:
         print("Ошибка: Имя не может быть пустым!")
@@ -95,30 +1639,47 @@ def delete_item():
         wait_for_enter()
         return
     
+    # Предварительный подсчет, чтобы было видно масштаб удаления
+    if os.path.isdir(item_path) and not os.path.islink(item_path):
+        files, dirs, total = measure_tree(item_path)
+        print(f"Будет удалено: файлов {files}, папок {dirs + 1}, {format_size(total)}")
+    
     # Подтверждение удаления
-    confirm = input(f"Вы уверены, что хотите удалить '{item_name}'? (y/n): ").strip().lower()
+    confirm = prompt_input(f"Вы уверены, что хотите удалить '{item_name}'? (y/n): ").strip().lower()
     if confirm != 'y':
         print("Удаление отменено.")
         wait_for_enter()
         return
     
+    if background and ask_background():
+        submit_job(f"Удаление '{item_name}'", [item_path], run_delete, item_path,
+                   progress=Progress(show_bytes=False))
+        wait_for_enter()
+        return
+    
     try:
-        if os.path.isfile(item_path):
-            os.remove(item_path)
-            print(f"Файл '{item_name}' успешно удален!")
-        elif os.path.isdir(item_path):
-            shutil.rmtree(item_path)
+        is_folder = os.path.isdir(item_path) and not os.path.islink(item_path)
+        progress = Progress(show_bytes=False)
+        run_with_progress(progress, run_delete, item_path, progress)
+        if progress.errors:
+            print(f"Удаление '{item_name}' завершено с ошибками.")
+        elif is_folder:
             print(f"Папка '{item_name}' успешно удалена!")
+        else:
+            print(f"Файл '{item_name}' успешно удален!")
+        print_errors(progress)
     except Exception as e:
+        record_error()
         print(f"Ошибка при удалении: {e}")
     
     wait_for_enter()
 
+@instrumented()
 def copy_item():
     """Копирование файла или папки"""
     clear_screen()
     print_header("КОПИРОВАНИЕ")
-    source_name = input("Введите название исходного файла/папки: ").strip()
+    source_name = prompt_input("Введите название исходного файла/папки: ").strip()
     
     if not source_name:
         print("Ошибка: Имя не может быть пустым!")
@@ -132,157 +1693,2183 @@ def copy_item():
         wait_for_enter()
         return
     
-    dest_name = input("Введите новое название (для копии): ").strip()
+    dest_name = prompt_input("Введите новое название (для копии): ").strip()
     
     if not dest_name:
         print("Ошибка: Новое имя не может быть пустым!")
         wait_for_enter()
         return
     
-    dest_path = os.path.join(working_directory, dest_name)
+    dest_path = os.path.join(working_directory, dest_name)
+    
+    if os.path.isdir(source_path) and os.path.commonpath(
+            [os.path.abspath(source_path), os.path.abspath(dest_path)]) == os.path.abspath(source_path):
+        print("Ошибка: нельзя копировать папку внутрь самой себя!")
+        wait_for_enter()
+        return
+    
+    if os.path.exists(dest_path):
+        # Папку можно докопировать после прерывания - готовые файлы пропускаются
+        if not (os.path.isdir(source_path) and os.path.isdir(dest_path)):
+            print(f"Ошибка: '{dest_name}' уже существует!")
+            wait_for_enter()
+            return
+        confirm = prompt_input(f"'{dest_name}' уже существует. Продолжить прерванное копирование? (y/n): ").strip().lower()
+        if confirm != 'y':
+            print("Копирование отменено.")
+            wait_for_enter()
+            return
+    
+    if ask_background():
+        submit_job(f"Копирование '{source_name}' -> '{dest_name}'", [source_path, dest_path],
+                   run_copy, source_path, dest_path)
+        wait_for_enter()
+        return
+    
+    try:
+        progress = Progress()
+        run_with_progress(progress, run_copy, source_path, dest_path, progress)
+        if os.path.isdir(source_path):
+            print(f"Папка '{source_name}' скопирована в '{dest_name}'!")
+        else:
+            print(f"Файл '{source_name}' скопирован в '{dest_name}'!")
+        print(f"Скопировано файлов: {progress.files}, пропущено готовых: {progress.skipped}, "
+              f"время: {progress.elapsed():.1f} с")
+        print_errors(progress)
+    except Exception as e:
+        record_error()
+        print(f"Ошибка при копировании: {e}")
+    
+    wait_for_enter()
+
+@instrumented()
+def mirror_directory():
+    """Односторонняя синхронизация папки с ее копией"""
+    clear_screen()
+    print_header("СИНХРОНИЗАЦИЯ ПАПОК")
+    source_name = prompt_input("Введите исходную папку: ").strip()
+    
+    if not source_name:
+        print("Ошибка: Имя не может быть пустым!")
+        wait_for_enter()
+        return
+    
+    source_path = os.path.join(working_directory, source_name)
+    
+    if not os.path.isdir(source_path):
+        print(f"Ошибка: папка '{source_name}' не найдена!")
+        wait_for_enter()
+        return
+    
+    dest_name = prompt_input("Введите папку-копию (будет создана, если нет): ").strip()
+    
+    if not dest_name:
+        print("Ошибка: Имя не может быть пустым!")
+        wait_for_enter()
+        return
+    
+    dest_path = os.path.join(working_directory, dest_name)
+    
+    if paths_overlap(source_path, dest_path):
+        print("Ошибка: папки не должны быть вложены одна в другую!")
+        wait_for_enter()
+        return
+    
+    if os.path.exists(dest_path) and not os.path.isdir(dest_path):
+        print(f"Ошибка: '{dest_name}' не является папкой!")
+        wait_for_enter()
+        return
+    
+    checksum = prompt_input("Сверять содержимое файлов с одинаковым размером и датой? (y/n) [n]: ").strip().lower() == 'y'
+    delete_extra = prompt_input(f"Удалять из '{dest_name}' то, чего нет в '{source_name}'? (y/n) [n]: ").strip().lower() == 'y'
+    coarse = prompt_input("Копия на FAT/SMB (время сравнивать с допуском 2 с)? (y/n) [n]: ").strip().lower() == 'y'
+    tolerance = MTIME_TOLERANCE if coarse else 0.0
+    
+    if ask_background():
+        submit_job(f"Синхронизация '{source_name}' -> '{dest_name}'", [source_path, dest_path],
+                   run_mirror, source_path, dest_path, checksum, delete_extra, tolerance)
+        wait_for_enter()
+        return
+    
+    try:
+        progress = Progress()
+        run_with_progress(progress, run_mirror, source_path, dest_path, checksum, delete_extra, tolerance,
+                          progress)
+        print(f"Папка '{dest_name}' синхронизирована с '{source_name}'!")
+        print(f"{mirror_summary(progress)}, время: {progress.elapsed():.1f} с")
+        print_errors(progress)
+    except Exception as e:
+        record_error()
+        print(f"Ошибка при синхронизации: {e}")
+    
+    wait_for_enter()
+
+@instrumented()
+def archive_item():
+    """Упаковка файла или папки в архив tar.gz/zip"""
+    clear_screen()
+    print_header("АРХИВАЦИЯ")
+    source_name = prompt_input("Введите название файла/папки: ").strip()
+    
+    if not source_name:
+        print("Ошибка: Имя не может быть пустым!")
+        wait_for_enter()
+        return
+    
+    source_path = os.path.join(working_directory, source_name)
+    
+    if not os.path.lexists(source_path):
+        print(f"Ошибка: '{source_name}' не найден!")
+        wait_for_enter()
+        return
+    
+    fmt = 'zip' if prompt_input("Формат: 1 - tar.gz, 2 - zip [1]: ").strip() == '2' else 'tar.gz'
+    default_name = os.path.basename(os.path.abspath(source_path)) + ARCHIVE_FORMATS[fmt]
+    archive_name = prompt_input(f"Имя архива [{default_name}]: ").strip() or default_name
+    archive_path = os.path.join(working_directory, archive_name)
+    
+    if os.path.isdir(source_path) and paths_overlap(source_path, archive_path):
+        print("Ошибка: нельзя сохранить архив внутри архивируемой папки!")
+        wait_for_enter()
+        return
+    
+    if os.path.exists(archive_path):
+        confirm = prompt_input(f"'{archive_name}' уже существует. Перезаписать? (y/n): ").strip().lower()
+        if confirm != 'y':
+            print("Архивация отменена.")
+            wait_for_enter()
+            return
+    
+    if ask_background():
+        submit_job(f"Архивация '{source_name}' -> '{archive_name}'", [source_path, archive_path],
+                   run_archive, source_path, archive_path, fmt)
+        wait_for_enter()
+        return
+    
+    try:
+        progress = Progress()
+        run_with_progress(progress, run_archive, source_path, archive_path, fmt, progress)
+        print(f"Архив '{archive_name}' создан!")
+        print(archive_summary(progress, archive_path))
+        print_errors(progress)
+    except Exception as e:
+        record_error()
+        print(f"Ошибка при архивации: {e}")
+    
+    wait_for_enter()
+
+@instrumented()
+def extract_item():
+    """Распаковка архива tar.gz/zip в папку"""
+    clear_screen()
+    print_header("РАСПАКОВКА АРХИВА")
+    archive_name = prompt_input("Введите название архива (.tar.gz, .tgz, .zip): ").strip()
+    
+    if not archive_name:
+        print("Ошибка: Имя не может быть пустым!")
+        wait_for_enter()
+        return
+    
+    archive_path = os.path.join(working_directory, archive_name)
+    
+    if not os.path.isfile(archive_path):
+        print(f"Ошибка: '{archive_name}' не найден!")
+        wait_for_enter()
+        return
+    
+    fmt = archive_format(archive_path)
+    if fmt is None:
+        print("Ошибка: поддерживаются только архивы .tar.gz, .tgz и .zip!")
+        wait_for_enter()
+        return
+    
+    default_name = os.path.basename(archive_path)
+    default_name = default_name[:-len(".tgz")] if default_name.lower().endswith(".tgz") else \
+        default_name[:-len(ARCHIVE_FORMATS[fmt])]
+    dest_name = prompt_input(f"Папка для распаковки [{default_name}]: ").strip() or default_name
+    dest_path = os.path.join(working_directory, dest_name)
+    
+    if os.path.exists(dest_path) and not os.path.isdir(dest_path):
+        print(f"Ошибка: '{dest_name}' не является папкой!")
+        wait_for_enter()
+        return
+    
+    if ask_background():
+        submit_job(f"Распаковка '{archive_name}' -> '{dest_name}'", [archive_path, dest_path],
+                   run_extract, archive_path, dest_path)
+        wait_for_enter()
+        return
+    
+    try:
+        progress = Progress()
+        run_with_progress(progress, run_extract, archive_path, dest_path, progress)
+        print(f"Архив '{archive_name}' распакован в '{dest_name}'!")
+        print(archive_summary(progress))
+        print_errors(progress)
+    except Exception as e:
+        record_error()
+        print(f"Ошибка при распаковке: {e}")
+    
+    wait_for_enter()
+
+def show_jobs():
+    """Фоновые задания: состояние, прогресс, ошибки и отмена"""
+    while True:
+        lines = header_lines("ФОНОВЫЕ ЗАДАНИЯ")
+        if not job_manager.jobs:
+            lines.append("Заданий нет")
+        for job in job_manager.jobs:
+            lines.append(job.summary_line())
+        lines.append("-" * 60)
+        lines.append(f"Выполняется или ждет: {len(job_manager.active())}")
+        command = screen.prompt(
+            lines, "[Enter] обновить, [c номер] отменить, [e номер] ошибки, [x] убрать завершенные, [q] выход: "
+        ).strip().lower()
+        
+        if command == 'q':
+            return
+        elif command == 'x':
+            job_manager.clear_finished()
+        elif command[:1] in ('c', 'e'):
+            number = command[1:].strip()
+            job = job_manager.find(int(number)) if number.isdigit() else None
+            if job is None:
+                print("❌ Задание не найдено!")
+                wait_for_enter()
+            elif command[0] == 'c':
+                if job.is_active():
+                    job.cancel()
+            else:
+                print(f"\nЗадание #{job.number}: {job.title}")
+                if job.progress.errors:
+                    print_errors(job.progress, limit=50)
+                else:
+                    print("Ошибок нет")
+                wait_for_enter()
+
+# ========== ДВИЖОК ЧТЕНИЯ ДИРЕКТОРИЙ ==========
+
+# Компактная запись об элементе директории.
+# size и mtime равны None, если stat для элемента не выполнялся;
+# nlink известно только после stat (иначе 1), mtime_ns - точное время изменения.
+DirRecord = namedtuple('DirRecord', ['name', 'is_dir', 'is_file', 'size', 'mtime', 'inode', 'nlink', 'mtime_ns'],
+                       defaults=(1, None))
+
+def scan_directory(path, stat_files=True, stat_dirs=False, follow_symlinks=True):
+    """Однопроходное чтение директории через os.scandir.
+
+    Тип элемента берется из кэша DirEntry (без лишних системных вызовов),
+    stat выполняется не более одного раза и только там, где он нужен.
+    """
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir(follow_symlinks=follow_symlinks)
+                is_file = not is_dir and entry.is_file(follow_symlinks=follow_symlinks)
+            except OSError:
+                is_dir = is_file = False
+            
+            size = mtime = mtime_ns = None
+            nlink = 1
+            if (is_file and stat_files) or (not is_file and stat_dirs):
+                try:
+                    st = entry.stat(follow_symlinks=follow_symlinks)
+                    size = st.st_size
+                    mtime = st.st_mtime
+                    mtime_ns = st.st_mtime_ns
+                    nlink = st.st_nlink
+                except OSError:
+                    pass
+            
+            try:
+                inode = entry.inode()
+            except OSError:
+                inode = 0
+            yield DirRecord(entry.name, is_dir, is_file, size, mtime, inode, nlink, mtime_ns)
+
+def collect_contents(path, stat_files=True):
+    """Файлы и остальные элементы директории, отсортированные по имени"""
+    files = []
+    dirs = []
+    for record in scan_directory(path, stat_files=stat_files):
+        if record.is_file:
+            files.append(record)
+        else:
+            dirs.append(record)
+    files.sort(key=attrgetter('name'))
+    dirs.sort(key=attrgetter('name'))
+    return files, dirs
+
+def collect_folders(path):
+    """Только папки директории, отсортированные по имени"""
+    folders = [r for r in scan_directory(path, stat_files=False) if r.is_dir]
+    folders.sort(key=attrgetter('name'))
+    return folders
+
+def collect_files(path):
+    """Только файлы директории (с размерами), отсортированные по имени"""
+    files = [r for r in scan_directory(path) if r.is_file]
+    files.sort(key=attrgetter('name'))
+    return files
+
+# ========== КЭШ ДИРЕКТОРИЙ ==========
+
+# Бюджет памяти кэша директорий и примерная стоимость одной записи
+DIR_CACHE_BUDGET = 64 * 1024 * 1024
+RECORD_OVERHEAD = 160
+
+class DirectoryCache:
+    """LRU-кэш записей директорий с проверкой mtime.
+
+    Хранит имена и типы элементов - то, изменение чего меняет mtime
+    директории. Размеры файлов не кэшируются: они меняются без изменения
+    mtime директории и считаются только для видимой страницы.
+    """
+    
+    def __init__(self, budget=DIR_CACHE_BUDGET):
+        self.lock = threading.Lock()
+        self.budget = budget
+        self.used = 0
+        # path -> [mtime_ns, {name: DirRecord}, занятый объем]
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def _cost(records):
+        return sum(RECORD_OVERHEAD + len(r.name) for r in records)
+    
+    def lookup(self, path):
+        """Записи из кэша или None, если их нет или директория изменилась"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        with self.lock:
+            cached = self.entries.get(path)
+            if cached is None:
+                self.misses += 1
+                return None
+            if cached[0] != mtime_ns:
+                self._drop(path)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return list(cached[1].values())
+    
+    def store(self, path, mtime_ns, records):
+        """Сохранение записей с вытеснением давно не использованных"""
+        cost = self._cost(records)
+        if cost > self.budget:
+            return
+        with self.lock:
+            self._drop(path)
+            self.entries[path] = [mtime_ns, {r.name: r for r in records}, cost]
+            self.used += cost
+            while self.used > self.budget:
+                oldest = next(iter(self.entries))
+                self._drop(oldest)
+                self.evictions += 1
+    
+    def _drop(self, path):
+        cached = self.entries.pop(path, None)
+        if cached is not None:
+            self.used -= cached[2]
+    
+    def apply(self, path, added=(), removed=()):
+        """Инкрементальное обновление после собственных операций программы.
+
+        Новое mtime директории принимается как актуальное: изменения,
+        сделанные другим процессом в ту же долю секунды, не будут замечены
+        до следующего изменения директории.
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            cached = self.entries.get(path)
+            if cached is None:
+                return
+            try:
+                cached[0] = os.stat(path).st_mtime_ns
+            except OSError:
+                self._drop(path)
+                return
+            records = cached[1]
+            for name in removed:
+                record = records.pop(name, None)
+                if record is not None:
+                    cached[2] -= RECORD_OVERHEAD + len(name)
+                    self.used -= RECORD_OVERHEAD + len(name)
+            for record in added:
+                if record.name not in records:
+                    cached[2] += RECORD_OVERHEAD + len(record.name)
+                    self.used += RECORD_OVERHEAD + len(record.name)
+                records[record.name] = record
+    
+    def drop_tree(self, path):
+        """Удаление из кэша директории и всех вложенных"""
+        path = os.path.abspath(path)
+        prefix = path.rstrip(os.sep) + os.sep
+        with self.lock:
+            for cached_path in [p for p in self.entries if p == path or p.startswith(prefix)]:
+                self._drop(cached_path)
+    
+    def stats_lines(self):
+        """Строки статистики для экрана диагностики"""
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0.0
+        return [
+            f"Директорий в кэше: {len(self.entries)}",
+            f"Память: {format_size(self.used)} из {format_size(self.budget)}",
+            f"Попаданий: {self.hits}, промахов: {self.misses} ({ratio:.1f}% попаданий)",
+            f"Устарело по mtime: {self.invalidations}, вытеснено: {self.evictions}",
+        ]
+
+directory_cache = DirectoryCache()
+
+def update_cache_added(path):
+    """Учет в кэше созданного программой файла или папки"""
+    parent = os.path.dirname(os.path.abspath(path))
+    try:
+        directory_cache.apply(parent, added=[record_for(path)])
+    except OSError:
+        directory_cache.drop_tree(parent)
+
+def update_cache_removed(path):
+    """Учет в кэше удаленного программой файла или папки"""
+    path = os.path.abspath(path)
+    directory_cache.drop_tree(path)
+    if os.path.lexists(path):
+        # Удалено не все - содержимое родителя не меняем, mtime проверит сам кэш
+        return
+    directory_cache.apply(os.path.dirname(path), removed=[os.path.basename(path)])
+
+def directory_records(path):
+    """Записи директории (без stat): из кэша или новым сканированием.
+
+    При промахе записи выдаются по мере чтения и попадают в кэш, только
+    если директория прочитана целиком и укладывается в бюджет памяти.
+    """
+    path = os.path.abspath(path)
+    watcher = directory_watcher
+    if watcher is not None and watcher.path == path:
+        watcher.sync()
+    cached = directory_cache.lookup(path)
+    if cached is not None:
+        return iter(cached)
+    return _scan_and_cache(path)
+
+def _scan_and_cache(path):
+    """Сканирование директории с сохранением результата в кэш"""
+    # mtime берется до чтения: изменения во время чтения сделают запись устаревшей
+    mtime_ns = os.stat(path).st_mtime_ns
+    limit = directory_cache.budget // RECORD_OVERHEAD
+    collected = []
+    for record in scan_directory(path, stat_files=False):
+        if collected is not None:
+            collected.append(record)
+            if len(collected) > limit:
+                collected = None
+        yield record
+    if collected is not None:
+        directory_cache.store(path, mtime_ns, collected)
+
+def record_for(path):
+    """Запись DirRecord для одного пути"""
+    st = os.stat(path)
+    is_dir = stat.S_ISDIR(st.st_mode)
+    is_file = stat.S_ISREG(st.st_mode)
+    return DirRecord(os.path.basename(path), is_dir, is_file, None, None, st.st_ino)
+
+# ========== НАБЛЮДЕНИЕ ЗА ДИРЕКТОРИЕЙ ==========
+
+# Маски событий inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+              | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+INOTIFY_EVENT = struct.Struct('iIII')
+INOTIFY_BUFFER = 64 * 1024
+
+class DirectoryWatcher:
+    """Наблюдение за одной директорией с применением изменений к кэшу.
+
+    События читаются при каждом обращении к директории (без отдельного
+    потока) и применяются к записям кэша через DirectoryCache.apply,
+    поэтому повторный просмотр обходится без сканирования директории.
+    Размеры файлов в кэше не хранятся, так что изменение содержимого
+    файла только учитывается в статистике.
+    """
+    
+    kind = ""
+    
+    def __init__(self, path, cache):
+        self.path = os.path.abspath(path)
+        self.cache = cache
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.events = 0
+        self.added = 0
+        self.removed = 0
+        self.modified = 0
+        self.overflows = 0
+        self.syncs = 0
+        self.apply_time = 0.0
+        self.gone = False
+        self.closed = False
+    
+    def read_changes(self):
+        """Новые события: список (тип, имя) и признак потери событий"""
+        raise NotImplementedError
+    
+    def sync(self):
+        """Применение накопленных событий к кэшу"""
+        with self.lock:
+            if self.closed:
+                return
+            started = time.perf_counter()
+            changes, lost = self.read_changes()
+            # Сворачиваем события по имени: создание и удаление одного файла взаимно гасятся
+            added = {}
+            removed = set()
+            for kind, name in changes:
+                if kind == 'add':
+                    added[name] = True
+                    removed.discard(name)
+                elif kind == 'remove':
+                    added.pop(name, None)
+                    removed.add(name)
+                else:
+                    self.modified += 1
+            self.events += len(changes)
+            
+            if lost:
+                self.overflows += 1
+                self.cache.drop_tree(self.path)
+                # При переполнении очереди событие об удалении самой директории тоже теряется
+                self.gone = self.gone or not os.path.isdir(self.path)
+            elif added or removed:
+                records = []
+                for name in added:
+                    try:
+                        records.append(record_for(os.path.join(self.path, name)))
+                    except OSError:
+                        removed.add(name)
+                self.cache.apply(self.path, added=records, removed=removed)
+                self.added += len(records)
+                self.removed += len(removed)
+            self.syncs += 1
+            self.apply_time += time.perf_counter() - started
+            if self.gone:
+                self.close()
+    
+    def close(self):
+        self.closed = True
+    
+    def stats_lines(self):
+        """Строки статистики для экрана диагностики"""
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        per_event = self.apply_time / self.events * 1e6 if self.events else 0.0
+        return [
+            f"Наблюдение ({self.kind}): {self.path}",
+            f"Событий: {self.events} ({self.events / elapsed:.2f} в секунду)",
+            f"Добавлено: {self.added}, удалено: {self.removed}, изменено: {self.modified}",
+            f"Применений: {self.syncs}, время: {self.apply_time * 1000:.1f} мс "
+            f"({per_event:.1f} мкс на событие)",
+            f"Потеряно очередей событий: {self.overflows}",
+        ]
+
+class InotifyWatcher(DirectoryWatcher):
+    """События ядра Linux через inotify (вызовы libc через ctypes)"""
+    
+    kind = "inotify"
+    
+    def __init__(self, path, cache):
+        super().__init__(path, cache)
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify недоступен")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        if libc.inotify_add_watch(self.fd, os.fsencode(self.path), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch", self.path)
+    
+    def read_changes(self):
+        changes = []
+        lost = False
+        while True:
+            try:
+                data = os.read(self.fd, INOTIFY_BUFFER)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    lost = True
+                elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                    # Директория удалена или переименована - наблюдать больше нечего
+                    lost = True
+                    self.gone = True
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    changes.append(('add', name))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    changes.append(('remove', name))
+                elif mask & (IN_MODIFY | IN_ATTRIB) and name:
+                    changes.append(('modify', name))
+        return changes, lost
+    
+    def close(self):
+        if not self.closed:
+            os.close(self.fd)
+        super().close()
+
+class PollingWatcher(DirectoryWatcher):
+    """Запасной вариант без inotify: проверка mtime директории и сравнение имен"""
+    
+    kind = "опрос mtime"
+    
+    def __init__(self, path, cache):
+        super().__init__(path, cache)
+        self.mtime_ns = os.stat(self.path).st_mtime_ns
+        self.names = {record.name for record in scan_directory(self.path, stat_files=False)}
+    
+    def read_changes(self):
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except OSError:
+            self.gone = True
+            return [], True
+        if mtime_ns == self.mtime_ns:
+            return [], False
+        # mtime запоминается до чтения: изменения во время чтения заметит следующий опрос
+        self.mtime_ns = mtime_ns
+        names = {record.name for record in scan_directory(self.path, stat_files=False)}
+        changes = [('add', name) for name in names - self.names]
+        changes += [('remove', name) for name in self.names - names]
+        self.names = names
+        return changes, False
+
+directory_watcher = None
+
+def start_watching(path):
+    """Включение наблюдения за директорией (inotify, иначе опрос mtime)"""
+    global directory_watcher
+    stop_watching()
+    try:
+        directory_watcher = InotifyWatcher(path, directory_cache)
+    except (OSError, AttributeError):
+        directory_watcher = PollingWatcher(path, directory_cache)
+    return directory_watcher
+
+def stop_watching():
+    """Выключение наблюдения"""
+    global directory_watcher
+    if directory_watcher is not None:
+        directory_watcher.close()
+        directory_watcher = None
+
+# ========== ПОСТРАНИЧНЫЙ ПРОСМОТР ==========
+
+# Количество строк на одной странице просмотра
+PAGE_SIZE = 40
+# Сколько записей сортируется в памяти за раз; большие директории
+# сортируются внешним слиянием отсортированных порций через heapq.merge
+SORT_CHUNK_SIZE = 50_000
+
+def files_first_key(record):
+    """Ключ сортировки: сначала файлы, затем папки, внутри - по имени"""
+    return (not record.is_file, record.name)
+
+def name_key(record):
+    """Ключ сортировки по имени"""
+    return record.name
+
+def size_key(record):
+    """Ключ сортировки по размеру: сначала крупные (у папок размер не известен)"""
+    return (-(record.size or 0), record.name)
+
+def mtime_key(record):
+    """Ключ сортировки по времени изменения: сначала новые"""
+    return (-(record.mtime or 0), record.name)
+
+def extension_key(record):
+    """Ключ сортировки по расширению, затем по имени"""
+    return (os.path.splitext(record.name)[1].lower(), record.name)
+
+# Порядки просмотра списков: (код, название, ключ); ключ None - порядок диска
+LIST_ORDERS = (
+    ('name', "по имени", name_key),
+    ('size', "по размеру", size_key),
+    ('mtime', "по дате изменения", mtime_key),
+    ('ext', "по расширению", extension_key),
+    ('disk', "как на диске", None),
+)
+LIST_ORDER_NAMES = tuple(name for _, name, _ in LIST_ORDERS)
+# Ключи, которым нужны размер и mtime файлов
+STAT_SORT_KEYS = (size_key, mtime_key)
+
+def files_first(key):
+    """Ключ: сначала файлы, затем папки, внутри групп - по key"""
+    def grouped_key(record):
+        return (not record.is_file, key(record))
+    return grouped_key
+
+def _dump_run(records, run_dir, number):
+    """Запись отсортированной порции во временный файл"""
+    import pickle
+    run_path = os.path.join(run_dir, f"run_{number:05d}")
+    with open(run_path, 'wb') as f:
+        for record in records:
+            pickle.dump(tuple(record), f, pickle.HIGHEST_PROTOCOL)
+    return run_path
+
+def _load_run(f):
+    """Ленивое чтение порции из временного файла"""
+    import pickle
+    while True:
+        try:
+            yield DirRecord(*pickle.load(f))
+        except EOFError:
+            return
+
+def sorted_scan(path, key=name_key, select=None, chunk_size=SORT_CHUNK_SIZE, stat_files=False):
+    """Отсортированный поток записей директории с ограниченной памятью.
+
+    Кэш директорий хранит записи без stat; при stat_files директория
+    читается заново с размерами и mtime файлов (для сортировки по ним).
+    """
+    records = scan_directory(path) if stat_files else directory_records(path)
+    if select is not None:
+        records = filter(select, records)
+    yield from sorted_records(records, key, chunk_size)
+
+def sorted_records(records, key=name_key, chunk_size=SORT_CHUNK_SIZE):
+    """Внешняя сортировка потока записей.
+
+    Поток читается порциями по chunk_size записей. Если хватило
+    одной порции, она сортируется в памяти. Иначе каждая порция
+    сортируется и сбрасывается во временный файл, а результат выдается
+    k-путевым слиянием (heapq.merge), так что в памяти одновременно
+    находится не больше одной порции.
+    """
+    records = iter(records)
+    chunk = sorted(islice(records, chunk_size), key=key)
+    if len(chunk) < chunk_size:
+        yield from chunk
+        return
+    
+    import tempfile
+    with tempfile.TemporaryDirectory(prefix="fm_sort_") as run_dir:
+        runs = []
+        while chunk:
+            runs.append(_dump_run(chunk, run_dir, len(runs)))
+            chunk = sorted(islice(records, chunk_size), key=key)
+        
+        run_files = [open(run_path, 'rb') for run_path in runs]
+        try:
+            yield from heapq.merge(*(_load_run(f) for f in run_files), key=key)
+        finally:
+            for f in run_files:
+                f.close()
+
+def iter_pages(items, page_size=PAGE_SIZE):
+    """Разбиение потока на страницы"""
+    items = iter(items)
+    while True:
+        page = list(islice(items, page_size))
+        if not page:
+            return
+        yield page
+
+def number_groups(records):
+    """Нумерация записей заново для каждой группы (файлы / папки)"""
+    number = 0
+    previous = None
+    for record in records:
+        number = number + 1 if record.is_file == previous else 1
+        previous = record.is_file
+        yield number, record, "ФАЙЛЫ" if record.is_file else "ПАПКИ"
+
+def record_size(path, record):
+    """Размер файла; stat выполняется только для видимых записей"""
+    if record.size is not None:
+        return record.size
+    try:
+        return os.stat(os.path.join(path, record.name)).st_size
+    except OSError:
+        return '?'
+
+def show_paged(title, open_records, format_page, empty_message,
+               page_size=PAGE_SIZE, orders=("по имени", "как на диске")):
+    """Постраничный просмотр потока записей.
+
+    open_records(order) возвращает генератор записей в порядке с номером
+    order из orders. Страницы читаются из него по мере листания, уже
+    просмотренные страницы запоминаются для перехода назад. Порядок
+    "как на диске" выводит первую страницу сразу, независимо от размера
+    директории. Команда [o] переключает порядки по кругу.
+    """
+    order = 0
+    pages = iter_pages(open_records(order), page_size)
+    seen = []
+    exhausted = False
+    current = 0
+    
+    try:
+        while True:
+            # Подгружаем на одну страницу вперед, чтобы знать, есть ли следующая
+            while len(seen) <= current + 1 and not exhausted:
+                try:
+                    seen.append(next(pages))
+                    record_processed(entries=len(seen[-1]))
+                except StopIteration:
+                    exhausted = True
+            
+            lines = header_lines(title)
+            if not seen:
+                screen.render(lines + [empty_message])
+                wait_for_enter()
+                return
+            
+            current = min(current, len(seen) - 1)
+            lines.extend(format_page(seen[current]))
+            
+            total = str(len(seen)) if exhausted else f"{len(seen)}+"
+            lines.append("-" * 60)
+            lines.append(f"Страница {current + 1} из {total} | Порядок: {orders[order]}")
+            command = screen.prompt(
+                lines, "[Enter] далее, [p] назад, [номер] перейти, [o] порядок, [q] выход: ").strip().lower()
+            
+            if command == 'q':
+                return
+            elif command == 'p':
+                current = max(0, current - 1)
+            elif command == 'o':
+                pages.close()
+                order = (order + 1) % len(orders)
+                pages = iter_pages(open_records(order), page_size)
+                seen = []
+                exhausted = False
+                current = 0
+            elif command.isdigit():
+                target = max(0, int(command) - 1)
+                # Переход вперед - дочитываем поток до нужной страницы
+                while len(seen) <= target and not exhausted:
+                    try:
+                        seen.append(next(pages))
+                        record_processed(entries=len(seen[-1]))
+                    except StopIteration:
+                        exhausted = True
+                current = min(target, len(seen) - 1)
+            elif exhausted and current == len(seen) - 1:
+                return
+            else:
+                current += 1
+    finally:
+        pages.close()
+
+def content_lines(path, items, show_mtime=False):
+    """Строки списка содержимого: (номер, запись, раздел) -> строки с заголовками разделов"""
+    for index, (number, record, group) in enumerate(items):
+        if group and (number == 1 or index == 0):
+            section = f"{group}:" if number == 1 else f"{group} (продолжение):"
+            yield section if index == 0 else "\n" + section
+        if record.is_file:
+            yield file_line(path, number, record, show_mtime)
+        else:
+            yield folder_line(number, record)
+
+def file_line(path, number, record, show_mtime=False):
+    """Строка списка для файла (размер считается при выводе)"""
+    line = f"{number:3}. 📄 {record.name} ({record_size(path, record)} байт"
+    if show_mtime and record.mtime is not None:
+        line += f", изменен {datetime.fromtimestamp(record.mtime).strftime('%Y-%m-%d %H:%M')}"
+    return line + ")"
+
+def folder_line(number, record):
+    """Строка списка для папки"""
+    return f"{number:3}. 📁 {record.name}"
+
+@instrumented()
+def list_contents():
+    """Просмотр всего содержимого рабочей директории"""
+    path = working_directory
+    
+    current = LIST_ORDERS[0]
+    
+    def open_records(order):
+        nonlocal current
+        current = LIST_ORDERS[order]
+        key = current[2]
+        if key is not None:
+            return number_groups(sorted_scan(path, key=files_first(key), stat_files=key in STAT_SORT_KEYS))
+        # Порядок диска: файлы и папки вперемешку, общая нумерация без разделов
+        records = directory_records(path)
+        return ((number, record, None) for number, record in enumerate(records, 1))
+    
+    def format_page(page):
+        return list(content_lines(path, page, show_mtime=current[0] == 'mtime'))
+    
+    try:
+        show_paged("СОДЕРЖИМОЕ ДИРЕКТОРИИ", open_records, format_page, "Директория пуста",
+                   orders=LIST_ORDER_NAMES)
+    except Exception as e:
+        record_error()
+        print(f"Ошибка при чтении директории: {e}")
+        wait_for_enter()
+
+@instrumented()
+def list_folders():
+    """Просмотр только папок"""
+    path = working_directory
+    
+    def is_folder(record):
+        return record.is_dir
+    
+    def open_records(order):
+        if order == 0:
+            records = sorted_scan(path, select=is_folder)
+        else:
+            records = filter(is_folder, directory_records(path))
+        return enumerate(records, 1)
+    
+    def format_page(page):
+        return [folder_line(i, record) for i, record in page]
+    
+    try:
+        show_paged("ТОЛЬКО ПАПКИ", open_records, format_page, "Папки не найдены")
+    except Exception as e:
+        record_error()
+        print(f"Ошибка при чтении директории: {e}")
+        wait_for_enter()
+
+@instrumented()
+def list_files():
+    """Просмотр только файлов"""
+    path = working_directory
+    
+    def is_file(record):
+        return record.is_file
+    
+    current = LIST_ORDERS[0]
+    
+    def open_records(order):
+        nonlocal current
+        current = LIST_ORDERS[order]
+        key = current[2]
+        if key is not None:
+            records = sorted_scan(path, key=key, select=is_file, stat_files=key in STAT_SORT_KEYS)
+        else:
+            records = filter(is_file, directory_records(path))
+        return enumerate(records, 1)
+    
+    def format_page(page):
+        show_mtime = current[0] == 'mtime'
+        return [file_line(path, i, record, show_mtime) for i, record in page]
+    
+    try:
+        show_paged("ТОЛЬКО ФАЙЛЫ", open_records, format_page, "Файлы не найдены",
+                   orders=LIST_ORDER_NAMES)
+    except Exception as e:
+        record_error()
+        print(f"Ошибка при чтении директории: {e}")
+        wait_for_enter()
+
+# ========== АНАЛИЗ ЗАНЯТОГО МЕСТА ==========
+
+# Число потоков обхода дерева
+DU_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+DiskUsage = namedtuple('DiskUsage', ['total', 'files', 'dirs', 'top_dirs', 'top_files'])
+
+def _scan_usage_dir(path):
+    """Чтение одной папки: файлы с размерами и вложенные папки (ссылки не раскрываются)"""
+    dev = os.stat(path, follow_symlinks=False).st_dev
+    files = []
+    subdirs = []
+    for record in scan_directory(path, stat_files=True, follow_symlinks=False):
+        if record.is_dir:
+            subdirs.append(os.path.join(path, record.name))
+        elif record.is_file and record.size is not None:
+            files.append(record)
+    return dev, files, subdirs
+
+def disk_usage(root, top_n=10, workers=DU_WORKERS, progress=None):
+    """Рекурсивный подсчет размеров папок параллельным обходом дерева.
+
+    Каждая папка читается отдельной задачей пула потоков, результаты
+    собираются в одном потоке. Жесткие ссылки (nlink > 1) учитываются
+    один раз по паре (устройство, inode), символические ссылки не
+    раскрываются. Считается видимый размер файлов (st_size).
+    """
+    progress = progress or Progress()
+    own_sizes = {}
+    parents = {root: None}
+    seen_links = set()
+    top_files = []
+    files_count = 0
+    
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_usage_dir, root): root}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                own_sizes[path] = 0
+                try:
+                    dev, files, subdirs = future.result()
+                except OSError as e:
+                    progress.add_error(path, e)
+                    continue
+                
+                size = 0
+                for record in files:
+                    if record.nlink > 1:
+                        key = (dev, record.inode)
+                        if key in seen_links:
+                            continue
+                        seen_links.add(key)
+                    size += record.size
+                    if top_n <= 0:
+                        continue
+                    item = (record.size, os.path.join(path, record.name))
+                    if len(top_files) < top_n:
+                        heapq.heappush(top_files, item)
+                    elif item > top_files[0]:
+                        heapq.heapreplace(top_files, item)
+                own_sizes[path] = size
+                files_count += len(files)
+                progress.add(files=len(files), nbytes=size)
+                
+                if progress.cancelled.is_set():
+                    continue
+                for subdir in subdirs:
+                    parents[subdir] = path
+                    pending[pool.submit(_scan_usage_dir, subdir)] = subdir
+    
+    # Суммируем размеры снизу вверх: сначала самые глубокие папки
+    totals = own_sizes
+    for path in sorted(totals, key=lambda p: p.count(os.sep), reverse=True):
+        parent = parents.get(path)
+        if parent is not None:
+            totals[parent] += totals[path]
+    
+    subfolders = ((size, path) for path, size in totals.items() if path != root)
+    return DiskUsage(totals.get(root, 0), files_count, len(totals) - 1,
+                     heapq.nlargest(top_n, subfolders), sorted(top_files, reverse=True))
+
+def disk_usage_lines(usage, root):
+    """Строки отчета о занятом месте"""
+    yield f"Общий размер: {format_size(usage.total)}"
+    yield f"Файлов: {usage.files}, папок: {usage.dirs}"
+    
+    yield "\nСАМЫЕ БОЛЬШИЕ ПАПКИ:"
+    for i, (size, path) in enumerate(usage.top_dirs, 1):
+        yield f"{i:3}. 📁 {os.path.relpath(path, root)} ({format_size(size)})"
+    
+    yield "\nСАМЫЕ БОЛЬШИЕ ФАЙЛЫ:"
+    for i, (size, path) in enumerate(usage.top_files, 1):
+        yield f"{i:3}. 📄 {os.path.relpath(path, root)} ({format_size(size)})"
+
+@instrumented()
+def analyze_disk_usage():
+    """Анализ занятого места в рабочей директории"""
+    clear_screen()
+    print_header("АНАЛИЗ ЗАНЯТОГО МЕСТА")
+    
+    try:
+        top_n = int(prompt_input("Сколько самых больших элементов показать? [10]: ").strip() or 10)
+    except ValueError:
+        top_n = 0
+    if top_n < 1:
+        print("❌ Некорректное число!")
+        wait_for_enter()
+        return
+    
+    try:
+        root = working_directory
+        progress = Progress()
+        usage = run_with_progress(progress, disk_usage, root, top_n, DU_WORKERS, progress)
+        record_processed(usage.files + usage.dirs, usage.total, len(progress.errors))
+        
+        print()
+        for line in disk_usage_lines(usage, root):
+            print(line)
+        print(f"Время: {progress.elapsed():.1f} с")
+        print_errors(progress)
+    except Exception as e:
+        record_error()
+        print(f"Ошибка при анализе: {e}")
+    
+    wait_for_enter()
+
+# ========== ПОИСК ФАЙЛОВ ==========
+
+# Файл индекса поиска и число потоков его построения
+SEARCH_INDEX_FILE = "search_index.sqlite"
+SEARCH_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Фиксировать изменения индекса каждые N папок
+SEARCH_COMMIT_EVERY = 500
+
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS roots (path TEXT PRIMARY KEY);
+CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    ext TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_dir ON entries(dir);
+CREATE INDEX IF NOT EXISTS entries_ext ON entries(ext);
+"""
+
+# Полнотекстовый индекс имен по триграммам (SQLite 3.34+ с FTS5)
+SEARCH_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS entry_names
+    USING fts5(name, content='entries', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entry_names(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entry_names(entry_names, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+"""
+
+@functools.lru_cache(maxsize=None)
+def search_index_class():
+    """Класс соединения с индексом (создается при первом поиске вместе с импортом sqlite3)"""
+    import sqlite3
+    
+    class SearchIndex(sqlite3.Connection):
+        """Соединение с индексом поиска; has_fts - доступен ли триграммный индекс"""
+        has_fts = False
+    
+    return SearchIndex
+
+def open_search_index(db_path=SEARCH_INDEX_FILE):
+    """Открытие (и при необходимости создание) индекса поиска"""
+    import sqlite3
+    conn = sqlite3.connect(db_path, factory=search_index_class())
+    conn.executescript(SEARCH_SCHEMA)
+    try:
+        conn.executescript(SEARCH_FTS_SCHEMA)
+        conn.has_fts = True
+    except sqlite3.OperationalError:
+        # Нет FTS5 или триграмм - поиск подстроки будет полным просмотром
+        conn.has_fts = False
+    return conn
+
+def path_scope(root, column="e.dir"):
+    """Условие 'путь равен root или вложен в него', использующее индекс по column"""
+    prefix = root.rstrip(os.sep) + os.sep
+    upper = prefix[:-1] + chr(ord(os.sep) + 1)
+    return f"({column} = ? OR ({column} >= ? AND {column} < ?))", (root, prefix, upper)
+
+def indexed_root(conn, path):
+    """Проиндексированный корень, которому принадлежит path, или None"""
+    path = os.path.abspath(path)
+    for (root,) in conn.execute("SELECT path FROM roots"):
+        if path == root or path.startswith(root.rstrip(os.sep) + os.sep):
+            return root
+    return None
+
+def file_extension(name):
+    """Расширение файла без точки в нижнем регистре"""
+    return os.path.splitext(name)[1][1:].lower() or None
+
+def _scan_index_dir(path, known_mtime):
+    """Чтение папки для индекса; None вместо записей, если mtime не изменилось"""
+    mtime_ns = os.stat(path, follow_symlinks=False).st_mtime_ns
+    if mtime_ns == known_mtime:
+        return mtime_ns, None
+    return mtime_ns, list(scan_directory(path, stat_files=False, follow_symlinks=False))
+
+def refresh_search_index(conn, root, workers=SEARCH_WORKERS, progress=None):
+    """Построение или инкрементальное обновление индекса поиска.
+
+    Папки читаются параллельно пулом потоков, запись в SQLite идет в
+    вызывающем потоке. Папка, mtime которой не изменилось, повторно не
+    читается: ее подпапки берутся из индекса. Папки, которых больше нет,
+    удаляются из индекса.
+    """
+    progress = progress or Progress(show_bytes=False)
+    root = os.path.abspath(root)
+    scope, args = path_scope(root, "path")
+    known = dict(conn.execute(f"SELECT path, mtime_ns FROM dirs WHERE {scope}", args))
+    visited = set()
+    changed = 0
+    
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_index_dir, root, known.get(root)): root}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    mtime_ns, records = future.result()
+                except OSError as e:
+                    progress.add_error(path, e)
+                    continue
+                visited.add(path)
+                
+                if records is None:
+                    subdirs = [name for (name,) in conn.execute(
+                        "SELECT name FROM entries WHERE dir = ? AND is_dir = 1", (path,))]
+                    progress.add(skipped=1)
+                else:
+                    conn.execute("DELETE FROM entries WHERE dir = ?", (path,))
+                    conn.executemany(
+                        "INSERT INTO entries (dir, name, is_dir, ext) VALUES (?, ?, ?, ?)",
+                        ((path, r.name, int(r.is_dir), None if r.is_dir else file_extension(r.name))
+                         for r in records))
+                    conn.execute("INSERT OR REPLACE INTO dirs (path, mtime_ns) VALUES (?, ?)", (path, mtime_ns))
+                    subdirs = [r.name for r in records if r.is_dir]
+                    progress.add(files=len(records))
+                    changed += 1
+                    if changed % SEARCH_COMMIT_EVERY == 0:
+                        conn.commit()
+                
+                if progress.cancelled.is_set():
+                    continue
+                for name in subdirs:
+                    subdir = os.path.join(path, name)
+                    pending[pool.submit(_scan_index_dir, subdir, known.get(subdir))] = subdir
+    
+    if not progress.cancelled.is_set():
+        for path in known.keys() - visited:
+            conn.execute("DELETE FROM entries WHERE dir = ?", (path,))
+            conn.execute("DELETE FROM dirs WHERE path = ?", (path,))
+        conn.execute("INSERT OR IGNORE INTO roots (path) VALUES (?)", (root,))
+    conn.commit()
+    return progress
+
+def search_index(conn, root, query, ordered=True):
+    """Поиск по индексу: генератор (папка, имя, является ли папкой).
+
+    ext:py - по расширению (обычный индекс), маски с * ? [ - GLOB по
+    имени, остальное - подстрока без учета регистра. GLOB и подстроки
+    от 3 символов используют триграммный индекс FTS5.
+    """
+    scope, args = path_scope(os.path.abspath(root))
+    order = " ORDER BY e.dir, e.name" if ordered else ""
+    
+    if query.lower().startswith("ext:"):
+        sql = f"SELECT e.dir, e.name, e.is_dir FROM entries e WHERE e.ext = ? AND {scope}"
+        params = (query[4:].strip().lstrip('.').lower(),)
+    elif any(c in query for c in "*?["):
+        if conn.has_fts:
+            sql = (f"SELECT e.dir, e.name, e.is_dir FROM entry_names f JOIN entries e ON e.id = f.rowid "
+                   f"WHERE f.name GLOB ? AND {scope}")
+        else:
+            sql = f"SELECT e.dir, e.name, e.is_dir FROM entries e WHERE e.name GLOB ? AND {scope}"
+        params = (query,)
+    elif conn.has_fts and len(query) >= 3:
+        sql = (f"SELECT e.dir, e.name, e.is_dir FROM entry_names f JOIN entries e ON e.id = f.rowid "
+               f"WHERE f.name MATCH ? AND {scope}")
+        params = ('"' + query.replace('"', '""') + '"',)
+    else:
+        escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        sql = f"SELECT e.dir, e.name, e.is_dir FROM entries e WHERE e.name LIKE ? ESCAPE '\\' AND {scope}"
+        params = (f"%{escaped}%",)
+    
+    yield from conn.execute(sql + order, params + args)
+
+def search_result_line(base, number, row):
+    """Строка результата поиска с путем относительно base"""
+    folder, name, is_dir = row
+    return f"{number:3}. {'📁' if is_dir else '📄'} {os.path.relpath(os.path.join(folder, name), base)}"
+
+@instrumented()
+def search_files():
+    """Поиск файлов и папок по индексу"""
+    clear_screen()
+    print_header("ПОИСК ФАЙЛОВ")
+    
+    conn = None
+    try:
+        conn = open_search_index()
+        root = indexed_root(conn, working_directory)
+        refresh = root is None
+        if refresh:
+            root = working_directory
+            print("Индекс для этой папки еще не построен - строим...")
+        else:
+            print(f"Индекс: {root}")
+            refresh = prompt_input("Обновить индекс (перечитываются только измененные папки)? (y/n) [n]: ").strip().lower() == 'y'
+        
+        if refresh:
+            progress = Progress(show_bytes=False)
+            run_with_progress(progress, refresh_search_index, conn, root, SEARCH_WORKERS, progress)
+            record_processed(entries=progress.files, errors=len(progress.errors))
+            print_errors(progress)
+        
+        query = prompt_input("\nЧто ищем (подстрока, маска *.py или ext:py): ").strip()
+        if not query:
+            print("❌ Запрос не может быть пустым!")
+            wait_for_enter()
+            return
+        
+        base = working_directory
+        
+        def open_records(order):
+            return enumerate(search_index(conn, base, query, order == 0), 1)
+        
+        def format_page(page):
+            return [search_result_line(base, i, row) for i, row in page]
+        
+        show_paged(f"ПОИСК: {query}", open_records, format_page, "Ничего не найдено")
+    except Exception as e:
+        record_error()
+        print(f"Ошибка поиска: {e}")
+        wait_for_enter()
+    finally:
+        if conn is not None:
+            conn.close()
+
+# ========== ПОИСК ДУБЛИКАТОВ ==========
+
+# Кэш хэшей: (устройство, inode) -> хэши, действительные при тех же размере и mtime
+HASH_CACHE_FILE = "hash_cache.sqlite"
+HASH_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS hashes (
+    dev INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    partial BLOB,
+    full BLOB,
+    PRIMARY KEY (dev, inode)
+) WITHOUT ROWID;
+"""
+# Размер блока в начале и в конце файла для предварительного хэша
+DUP_BLOCK = 64 * 1024
+# Порция чтения для файлов, которые не удалось отобразить в память
+DUP_READ_SIZE = 4 * 1024 * 1024
+# Потоки для чтения блоков и процессы для полных хэшей
+DUP_SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+DUP_HASH_WORKERS = os.cpu_count() or 1
+
+DuplicateFile = namedtuple('DuplicateFile', ['path', 'dev', 'inode', 'size', 'mtime'])
+DuplicateGroup = namedtuple('DuplicateGroup', ['size', 'digest', 'paths'])
+
+def new_hash():
+    import hashlib
+    return hashlib.blake2b(digest_size=20)
+
+def partial_hash(path, size):
+    """Хэш первого и последнего блоков; для файлов до 2*DUP_BLOCK это хэш всего файла"""
+    digest = new_hash()
+    with open(path, 'rb') as f:
+        digest.update(f.read(DUP_BLOCK))
+        if size > DUP_BLOCK:
+            f.seek(max(DUP_BLOCK, size - DUP_BLOCK))
+            digest.update(f.read(DUP_BLOCK))
+    return digest.digest()
+
+def full_hash(path):
+    """Хэш всего файла: (путь, хэш, ошибка). Выполняется в процессе пула."""
+    import mmap
+    digest = new_hash()
+    try:
+        with open(path, 'rb') as f:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    digest.update(mapped)
+            except (ValueError, OSError):
+                # Пустой файл или ФС без mmap - читаем большими порциями
+                buffer = bytearray(DUP_READ_SIZE)
+                view = memoryview(buffer)
+                while True:
+                    n = f.readinto(buffer)
+                    if not n:
+                        break
+                    digest.update(view[:n])
+    except OSError as e:
+        return path, None, str(e)
+    return path, digest.digest(), None
+
+def walk_tree_files(root, workers=DUP_SCAN_WORKERS, progress=None):
+    """Параллельный обход дерева: (путь, устройство, запись) для каждого файла"""
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {pool.submit(_scan_usage_dir, root): root}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                try:
+                    dev, files, subdirs = future.result()
+                except OSError as e:
+                    if progress is not None:
+                        progress.add_error(path, e)
+                    continue
+                for record in files:
+                    yield os.path.join(path, record.name), dev, record
+                if progress is None or not progress.cancelled.is_set():
+                    for subdir in subdirs:
+                        pending[pool.submit(_scan_usage_dir, subdir)] = subdir
+
+def group_candidates(files, key):
+    """Группировка по key с отбрасыванием групп из одного файла"""
+    groups = defaultdict(list)
+    for item in files:
+        groups[key(item)].append(item)
+    return [group for group in groups.values() if len(group) > 1]
+
+def find_duplicates(root, progress=None, cache_path=HASH_CACHE_FILE,
+                    workers=DUP_SCAN_WORKERS, hash_workers=DUP_HASH_WORKERS):
+    """Поиск одинаковых файлов в три этапа.
+
+    1. Группировка по размеру - файлы уникального размера отбрасываются
+       без чтения. Жесткие ссылки на один inode считаются одним файлом.
+    2. Хэш первого и последнего блоков (пул потоков) - отсеивает файлы,
+       различающиеся в начале или в конце.
+    3. Полный хэш оставшихся файлов (пул процессов, чтение через mmap).
+    Хэши сохраняются в кэше по (устройство, inode) и переиспользуются,
+    пока не изменились размер и mtime. Возвращает группы по убыванию
+    лишнего места.
+    """
+    progress = progress or Progress()
+    seen = set()
+    by_size = defaultdict(list)
+    for path, dev, record in walk_tree_files(root, workers, progress):
+        if record.size == 0 or (dev, record.inode) in seen:
+            continue
+        seen.add((dev, record.inode))
+        by_size[record.size].append(DuplicateFile(path, dev, record.inode, record.size, record.mtime))
+    candidates = [f for group in by_size.values() if len(group) > 1 for f in group]
+    del by_size, seen
+    
+    import sqlite3
+    conn = sqlite3.connect(cache_path)
+    try:
+        conn.executescript(HASH_CACHE_SCHEMA)
+        partial = {}
+        full = {}
+        for f in candidates:
+            row = conn.execute("SELECT size, mtime, partial, full FROM hashes WHERE dev = ? AND inode = ?",
+                               (f.dev, f.inode)).fetchone()
+            if row is not None and row[0] == f.size and row[1] == f.mtime:
+                partial[f] = row[2]
+                if row[3] is not None:
+                    full[f] = row[3]
+        cached_partial = set(partial)
+        cached_full = set(full)
+        
+        # Этап 2: блоки в начале и в конце файла
+        def read_blocks(f):
+            try:
+                return f, partial_hash(f.path, f.size)
+            except OSError as e:
+                progress.add_error(f.path, e)
+                return f, None
+        
+        missing = [f for f in candidates if f not in partial]
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for f, digest in pool.map(read_blocks, missing):
+                if digest is not None:
+                    partial[f] = digest
+                    progress.add(files=1, nbytes=min(f.size, 2 * DUP_BLOCK))
+        progress.check_cancelled()
+        
+        # Этап 3: полный хэш там, где блоки не покрыли файл целиком
+        groups = group_candidates((f for f in candidates if f in partial), lambda f: (f.size, partial[f]))
+        for group in groups:
+            for f in group:
+                if f.size <= 2 * DUP_BLOCK:
+                    full[f] = partial[f]
+        missing = {f.path: f for group in groups for f in group if f not in full}
+        if hash_workers > 1 and len(missing) > 1:
+            from concurrent.futures import ProcessPoolExecutor
+            pool = ProcessPoolExecutor(max_workers=hash_workers)
+            results = pool.map(full_hash, list(missing), chunksize=16)
+        else:
+            pool = None
+            results = map(full_hash, list(missing))
+        try:
+            for path, digest, error in results:
+                f = missing[path]
+                if error is not None:
+                    progress.add_error(path, error)
+                    continue
+                full[f] = digest
+                progress.add(files=1, nbytes=f.size)
+                progress.check_cancelled()
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+        
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO hashes (dev, inode, size, mtime, partial, full) VALUES (?, ?, ?, ?, ?, ?)",
+                [(f.dev, f.inode, f.size, f.mtime, digest, full.get(f))
+                 for f, digest in partial.items()
+                 if f not in cached_partial or (f in full and f not in cached_full)])
+    finally:
+        conn.close()
+    
+    duplicates = [DuplicateGroup(group[0].size, full[group[0]], sorted(f.path for f in group))
+                  for group in group_candidates((f for f in candidates if f in full),
+                                                lambda f: (f.size, full[f]))]
+    duplicates.sort(key=lambda g: (g.size * (len(g.paths) - 1), g.size), reverse=True)
+    return duplicates
+
+def duplicate_lines(base, duplicates, deleted=(), reverse=False):
+    """Строки просмотра: заголовок группы и ее файлы со сквозными номерами.
+
+    Номера не зависят от порядка вывода, чтобы номер для удаления
+    всегда указывал на один и тот же файл.
+    """
+    starts = []
+    number = 1
+    for group in duplicates:
+        starts.append(number)
+        number += len(group.paths)
+    order = range(len(duplicates) - 1, -1, -1) if reverse else range(len(duplicates))
+    for index in order:
+        group = duplicates[index]
+        wasted = group.size * (len(group.paths) - 1)
+        yield (f"Группа {index + 1}: файлов {len(group.paths)} по {format_size(group.size)}, "
+               f"лишние копии: {format_size(wasted)}")
+        for number, path in enumerate(group.paths, starts[index]):
+            mark = " (удален)" if path in deleted else ""
+            yield f"{number:5}. 📄 {os.path.relpath(path, base)}{mark}"
+
+@instrumented()
+def find_duplicate_files():
+    """Поиск дубликатов в рабочей директории с удалением лишних копий"""
+    clear_screen()
+    print_header("ПОИСК ДУБЛИКАТОВ")
+    base = working_directory
+    print(f"Папка: {base}")
+    
+    try:
+        progress = Progress()
+        duplicates = run_with_progress(progress, find_duplicates, base, progress)
+        record_processed(progress.files, progress.bytes, len(progress.errors))
+        print_errors(progress)
+    except OperationCancelled:
+        print("Поиск прерван.")
+        wait_for_enter()
+        return
+    except Exception as e:
+        record_error()
+        print(f"Ошибка поиска дубликатов: {e}")
+        wait_for_enter()
+        return
+    
+    wasted = sum(g.size * (len(g.paths) - 1) for g in duplicates)
+    print(f"Групп одинаковых файлов: {len(duplicates)}, лишнее место: {format_size(wasted)}")
+    if not duplicates:
+        wait_for_enter()
+        return
+    wait_for_enter()
+    
+    paths = [path for group in duplicates for path in group.paths]
+    deleted = set()
+    
+    def open_records(order):
+        return duplicate_lines(base, duplicates, deleted, reverse=order != 0)
+    
+    def format_page(page):
+        return page
+    
+    while True:
+        show_paged("ДУБЛИКАТЫ", open_records, format_page, "Дубликаты не найдены",
+                   orders=("сначала крупные", "сначала мелкие"))
+        choice = prompt_input("\nНомер файла для удаления (Enter - выход): ").strip()
+        screen.invalidate()
+        if not choice:
+            return
+        if not choice.isdigit() or not 1 <= int(choice) <= len(paths):
+            print("❌ Нет файла с таким номером!")
+            wait_for_enter()
+            continue
+        path = paths[int(choice) - 1]
+        # Синхронно: файл считается удаленным, только когда его уже нет
+        delete_item(os.path.relpath(path, base), background=False)
+        if not os.path.lexists(path):
+            deleted.add(path)
+
+# ========== КРУПНЫЕ И НОВЫЕ ФАЙЛЫ ==========
+
+# Виды выборки: (заголовок, ключ отбора)
+TOP_MODES = {
+    'size': ("САМЫЕ БОЛЬШИЕ ФАЙЛЫ", lambda item: item[1].size or 0),
+    'mtime': ("САМЫЕ НОВЫЕ ФАЙЛЫ", lambda item: item[1].mtime or 0),
+}
+# Сколько расширений показывать в сводной таблице
+EXTENSION_ROWS = 15
+NO_EXTENSION = "(без расширения)"
+
+def iter_files(root, recursive=False, progress=None):
+    """Поток (путь, запись) файлов папки; при recursive - всего дерева (параллельный обход)"""
+    if recursive:
+        for path, _, record in walk_tree_files(root, DU_WORKERS, progress):
+            yield path, record
+        return
+    for record in scan_directory(root):
+        if record.is_file:
+            yield os.path.join(root, record.name), record
+
+def count_extensions(items, summary, progress=None):
+    """Подсчет файлов и байт по расширениям попутно с передачей потока дальше"""
+    for path, record in items:
+        size = record.size or 0
+        extension = os.path.splitext(record.name)[1].lower() or NO_EXTENSION
+        totals = summary[extension]
+        totals[0] += 1
+        totals[1] += size
+        if progress is not None:
+            # Содержимое не читается: скорость считается в записях, а не в байтах
+            progress.add(files=1)
+        yield path, record
+
+def top_files(root, n=20, mode='size', recursive=False, progress=None):
+    """Выбор n самых больших (или новых) файлов за один проход по потоку.
+
+    heapq.nlargest держит кучу из n элементов, поэтому выбор из N файлов
+    стоит O(N log n) времени и O(n) памяти вместо полной сортировки.
+    Попутно собирается сводка по расширениям: {расширение: [файлов, байт]}.
+    Возвращает (список (путь, запись), сводка).
+    """
+    summary = defaultdict(lambda: [0, 0])
+    items = count_extensions(iter_files(root, recursive, progress), summary, progress)
+    top = heapq.nlargest(n, items, key=TOP_MODES[mode][1])
+    return top, summary
+
+def top_file_lines(root, top, mode):
+    """Строки списка выбранных файлов"""
+    yield f"{TOP_MODES[mode][0]}:"
+    for i, (path, record) in enumerate(top, 1):
+        changed = datetime.fromtimestamp(record.mtime or 0).strftime('%Y-%m-%d %H:%M')
+        yield f"{i:3}. 📄 {os.path.relpath(path, root)} ({format_size(record.size or 0)}, изменен {changed})"
+
+def extension_summary_lines(summary, rows=EXTENSION_ROWS):
+    """Таблица расширений по занятому месту"""
+    total_files = sum(files for files, _ in summary.values())
+    total_bytes = sum(nbytes for _, nbytes in summary.values())
+    yield f"{'Расширение':<20} {'Файлов':>10} {'Размер':>12} {'Доля':>7}"
+    yield "-" * 52
+    largest = heapq.nlargest(rows, summary.items(), key=lambda item: item[1][1])
+    for extension, (files, nbytes) in largest:
+        share = nbytes / total_bytes * 100 if total_bytes else 0
+        yield f"{extension:<20} {files:>10} {format_size(nbytes):>12} {share:>6.1f}%"
+    if len(summary) > rows:
+        yield f"... и еще расширений: {len(summary) - rows}"
+    yield "-" * 52
+    yield f"{'Всего':<20} {total_files:>10} {format_size(total_bytes):>12}"
+
+@instrumented()
+def show_top_files():
+    """Самые большие или самые новые файлы рабочей директории"""
+    clear_screen()
+    print_header("КРУПНЫЕ И НОВЫЕ ФАЙЛЫ")
+    
+    modes = {'': 'size', '1': 'size', '2': 'mtime'}
+    choice = prompt_input("Показать: 1 - самые большие, 2 - самые новые [1]: ").strip()
+    if choice not in modes:
+        print("❌ Неверный пункт!")
+        wait_for_enter()
+        return
+    try:
+        n = int(prompt_input("Сколько файлов показать? [20]: ").strip() or 20)
+    except ValueError:
+        print("❌ Некорректное число!")
+        wait_for_enter()
+        return
+    recursive = prompt_input("Включая вложенные папки? (y/n) [n]: ").strip().lower() == 'y'
+    
+    try:
+        root = working_directory
+        mode = modes[choice]
+        progress = Progress(show_bytes=False)
+        if recursive:
+            top, summary = run_with_progress(progress, top_files, root, n, mode, True, progress)
+        else:
+            top, summary = top_files(root, n, mode, False, progress)
+        record_processed(progress.files, errors=len(progress.errors))
+        
+        print()
+        for line in top_file_lines(root, top, mode):
+            print(line)
+        if recursive:
+            print("\nПО РАСШИРЕНИЯМ:")
+            for line in extension_summary_lines(summary):
+                print(line)
+        print_errors(progress)
+    except Exception as e:
+        record_error()
+        print(f"Ошибка при чтении директории: {e}")
+    
+    wait_for_enter()
+
+# ========== ЭКСПОРТ СОДЕРЖИМОГО ==========
+
+# Имена файлов экспорта по форматам и размер буфера записи
+EXPORT_FILES = {
+    'txt': LISTDIR_FILE,
+    'jsonl': "listdir.jsonl",
+    'csv': "listdir.csv",
+}
+EXPORT_BUFFER = 1024 * 1024
+
+def record_kind(record):
+    """Тип элемента для экспорта"""
+    return "file" if record.is_file else "dir" if record.is_dir else "other"
+
+def record_stat(path, record):
+    """Размер и время изменения элемента (для ссылок без цели - самой ссылки)"""
+    full_path = os.path.join(path, record.name)
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        try:
+            st = os.lstat(full_path)
+        except OSError:
+            return None, None
+    mtime = datetime.fromtimestamp(st.st_mtime).isoformat(timespec='seconds')
+    return st.st_size, mtime
+
+def _write_txt(out, path, records):
+    """Текстовый формат listdir.txt: раздел files, затем раздел dirs"""
+    files = dirs = 0
+    out.write("files:")
+    for record in records:
+        if not record.is_file and not dirs:
+            out.write("\n\ndirs:")
+        out.write("\n" + record.name)
+        if record.is_file:
+            files += 1
+        else:
+            dirs += 1
+    if not dirs:
+        out.write("\n\ndirs:")
+    return files, dirs
+
+def _write_jsonl(out, path, records):
+    """JSON Lines: одна запись на строку"""
+    import json
+    files = dirs = 0
+    for record in records:
+        size, mtime = record_stat(path, record)
+        out.write(json.dumps({'name': record.name, 'type': record_kind(record),
+                              'size': size, 'mtime': mtime}, ensure_ascii=False))
+        out.write("\n")
+        if record.is_file:
+            files += 1
+        else:
+            dirs += 1
+    return files, dirs
+
+def _write_csv(out, path, records):
+    """CSV с колонками name, type, size, mtime"""
+    import csv
+    files = dirs = 0
+    writer = csv.writer(out)
+    writer.writerow(['name', 'type', 'size', 'mtime'])
+    for record in records:
+        size, mtime = record_stat(path, record)
+        writer.writerow([record.name, record_kind(record), size, mtime])
+        if record.is_file:
+            files += 1
+        else:
+            dirs += 1
+    return files, dirs
+
+EXPORT_WRITERS = {
+    'txt': _write_txt,
+    'jsonl': _write_jsonl,
+    'csv': _write_csv,
+}
+
+def export_directory(path, fmt='txt', compress=False):
+    """Потоковый экспорт содержимого директории.
+
+    Записи читаются в отсортированном порядке (файлы, затем папки) и сразу
+    пишутся через буферизованный поток, поэтому память не растет с размером
+    директории. Результат пишется во временный файл и атомарно
+    переименовывается, так что читатели никогда не видят неполный файл.
+    Возвращает (имя файла, число файлов, число папок).
+    """
+    import io
+    if compress:
+        import gzip
+    target_name = EXPORT_FILES[fmt] + (".gz" if compress else "")
+    target_path = os.path.join(path, target_name)
+    # Временный файл создается с обычными правами (с учетом umask), как open()
+    temp_name = f".{target_name}.{os.getpid()}.{threading.get_ident()}.tmp"
+    temp_path = os.path.join(path, temp_name)
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+    
+    def is_exported(record):
+        return record.name != temp_name
+    
+    try:
+        with open(fd, 'wb', buffering=EXPORT_BUFFER) as raw:
+            stream = gzip.GzipFile(fileobj=raw, mode='wb') if compress else raw
+            with io.TextIOWrapper(stream, encoding='utf-8', errors='surrogateescape',
+                                  newline='' if fmt == 'csv' else None) as out:
+                records = sorted_scan(path, key=files_first_key, select=is_exported)
+                files, dirs = EXPORT_WRITERS[fmt](out, path, records)
+                out.flush()
+                if compress:
+                    stream.close()
+                raw.flush()
+                os.fsync(raw.fileno())
+        os.replace(temp_path, target_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    
+    update_cache_added(target_path)
+    record_processed(entries=files + dirs, nbytes=os.path.getsize(target_path))
+    return target_name, files, dirs
+
+# Снимок дерева (путь, тип, размер, mtime, inode) для сравнения между экспортами
+SNAPSHOT_FILE = "listdir.snap"
+SNAPSHOT_DIFF_FILE = "listdir.diff"
+SNAPSHOT_MAGIC = b"FMSNAP1\n"
+# Заголовок записи: длина общего с предыдущим путем префикса, длина остатка
+# пути, тип, размер, mtime, inode. За ним - остаток пути в байтах ФС.
+SNAPSHOT_RECORD = struct.Struct('<HHBqdQ')
+SNAPSHOT_FILE_KIND, SNAPSHOT_DIR_KIND, SNAPSHOT_OTHER_KIND = range(3)
+
+SnapshotEntry = namedtuple('SnapshotEntry', ['path', 'kind', 'size', 'mtime', 'inode'])
+SnapshotChange = namedtuple('SnapshotChange', ['change', 'old', 'new'])
+# Сколько удаленных и добавленных записей ждут пару для переименования
+SNAPSHOT_RENAME_WINDOW = 100000
+
+def snapshot_key(entry):
+    """Порядок путей снимка: по компонентам пути, папка сразу перед своим содержимым"""
+    return entry.path.replace(b'/', b'\0')
+
+def snapshot_name_key(record):
+    return os.fsencode(record.name)
+
+def is_snapshot_excluded(name):
+    """Файлы экспорта и снимков в корне меняются при каждом запуске - в снимок не входят"""
+    return (name.startswith((SNAPSHOT_FILE, SNAPSHOT_DIFF_FILE))
+            or any(name in (export_name, export_name + ".gz") for export_name in EXPORT_FILES.values()))
+
+def walk_snapshot(root, progress):
+    """Обход дерева в порядке snapshot_key без раскрытия ссылок.
+
+    Записи каждой папки сортируются внешней сортировкой (sorted_records),
+    а обход идет в глубину, поэтому весь поток упорядочен и память
+    ограничена одной порцией на уровень вложенности.
+    """
+    def sorted_dir(path):
+        records = scan_directory(path, stat_files=True, stat_dirs=True, follow_symlinks=False)
+        return sorted_records(records, key=snapshot_name_key)
+    
+    stack = [(b'', root, sorted_dir(root))]
+    while stack:
+        prefix, dir_path, records = stack[-1]
+        try:
+            record = next(records, None)
+        except OSError as e:
+            progress.add_error(dir_path, e)
+            record = None
+        if record is None:
+            stack.pop()
+            continue
+        if not prefix and is_snapshot_excluded(record.name):
+            continue
+        
+        path = prefix + os.fsencode(record.name)
+        kind = (SNAPSHOT_DIR_KIND if record.is_dir else
+                SNAPSHOT_FILE_KIND if record.is_file else SNAPSHOT_OTHER_KIND)
+        yield SnapshotEntry(path, kind, record.size or 0, record.mtime or 0.0, record.inode)
+        progress.add(files=1)
+        if record.is_dir:
+            child = os.path.join(dir_path, record.name)
+            stack.append((path + b'/', child, sorted_dir(child)))
+
+def shared_prefix_length(first, second):
+    """Длина общего префикса двух строк байт (двоичный поиск сравнением срезов)"""
+    low, high = 0, min(len(first), len(second), 0xFFFF)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if first[:middle] == second[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def write_snapshot(path, entries):
+    """Запись снимка с префиксным сжатием путей; возвращает число записей"""
+    count = 0
+    pack = SNAPSHOT_RECORD.pack
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'wb', buffering=EXPORT_BUFFER) as f:
+            f.write(SNAPSHOT_MAGIC)
+            previous = b''
+            for entry in entries:
+                shared = shared_prefix_length(previous, entry.path)
+                suffix = entry.path[shared:]
+                f.write(pack(shared, len(suffix), entry.kind, entry.size, entry.mtime, entry.inode))
+                f.write(suffix)
+                previous = entry.path
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return count
+
+def read_snapshot(path):
+    """Потоковое чтение снимка"""
+    unpack = SNAPSHOT_RECORD.unpack
+    header_size = SNAPSHOT_RECORD.size
+    with open(path, 'rb', buffering=EXPORT_BUFFER) as f:
+        if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"'{path}' не является снимком содержимого")
+        previous = b''
+        while True:
+            header = f.read(header_size)
+            if not header:
+                return
+            if len(header) < header_size:
+                raise ValueError(f"снимок '{path}' поврежден")
+            shared, length, kind, size, mtime, inode = unpack(header)
+            previous = previous[:shared] + f.read(length)
+            yield SnapshotEntry(previous, kind, size, mtime, inode)
+
+def is_entry_modified(old, new):
+    """Изменение записи с тем же путем; mtime и размер папок меняются вместе с содержимым"""
+    if old.kind != new.kind or old.inode != new.inode:
+        return True
+    return new.kind != SNAPSHOT_DIR_KIND and (old.size != new.size or old.mtime != new.mtime)
+
+def is_same_object(old, new):
+    """Удаленная и добавленная записи - один и тот же переименованный объект"""
+    return old.kind == new.kind and (new.kind == SNAPSHOT_DIR_KIND or old.mtime == new.mtime)
+
+def diff_snapshots(old_entries, new_entries, rename_window=SNAPSHOT_RENAME_WINDOW):
+    """Сравнение двух снимков слиянием отсортированных потоков.
+
+    Оба потока идут в порядке snapshot_key, поэтому сравнение линейно и
+    измененные записи выдаются сразу. Удаленные и добавленные записи ждут
+    пару с тем же inode (и тем же mtime у файлов): найденная пара сразу
+    выдается как переименование. Ожидающих записей каждого вида не больше
+    rename_window - самые старые выдаются как удаленные или добавленные,
+    поэтому память ограничена, а переименование между далекими путями
+    большого дерева может попасть в отчет как удаление и добавление.
+    """
+    # Ключ исчерпанного потока больше ключа любого пути (пути короче 64 КБ)
+    end_key = b'\xff' * 0x10000
+    
+    def advance(entries):
+        entry = next(entries, None)
+        return entry, end_key if entry is None else snapshot_key(entry)
     
-    if os.path.exists(dest_path):
-        print(f"Ошибка: '{dest_name}' уже существует!")
-        wait_for_enter()
-        return
+    # inode -> запись в порядке поступления
+    removed = OrderedDict()
+    added = OrderedDict()
     
-    try:
-        if os.path.isfile(source_path):
-            shutil.copy2(source_path, dest_path)
-            print(f"Файл '{source_name}' скопирован в '{dest_name}'!")
-        elif os.path.isdir(source_path):
-            shutil.copytree(source_path, dest_path)
-            print(f"Папка '{source_name}' скопирована в '{dest_name}'!")
-    except Exception as e:
-        print(f"Ошибка при копировании: {e}")
+    def unpaired(change, entry):
+        return SnapshotChange(change, entry, None) if change == 'removed' else SnapshotChange(change, None, entry)
     
-    wait_for_enter()
-
-def list_contents():
-    """Просмотр всего содержимого рабочей директории"""
-    clear_screen()
-    print_header("СОДЕРЖИМОЕ ДИРЕКТОРИИ")
+    def match(change, entry, pending, other):
+        """Пара для entry среди ожидающих записей другого вида или постановка в ожидание"""
+        changes = []
+        candidate = other.pop(entry.inode, None)
+        if candidate is not None:
+            pair = (entry, candidate) if change == 'removed' else (candidate, entry)
+            if is_same_object(*pair):
+                return [SnapshotChange('renamed', *pair)]
+            # inode занят другим объектом: у ожидавшей записи пары нет
+            changes.append(unpaired('added' if change == 'removed' else 'removed', candidate))
+        # При жестких ссылках ждет первая, остальные выдаются сразу
+        if pending.setdefault(entry.inode, entry) is not entry:
+            changes.append(unpaired(change, entry))
+        while len(pending) > rename_window:
+            changes.append(unpaired(change, pending.popitem(last=False)[1]))
+        return changes
     
-    try:
-        items = os.listdir(working_directory)
-        if not items:
-            print("Директория пуста")
+    old, old_key = advance(old_entries)
+    new, new_key = advance(new_entries)
+    while old is not None or new is not None:
+        if old_key < new_key:
+            yield from match('removed', old, removed, added)
+            old, old_key = advance(old_entries)
+        elif new_key < old_key:
+            yield from match('added', new, added, removed)
+            new, new_key = advance(new_entries)
         else:
-            files = []
-            dirs = []
-            
-            for item in sorted(items):
-                item_path = os.path.join(working_directory, item)
-                if os.path.isfile(item_path):
-                    files.append(item)
-                else:
-                    dirs.append(item)
-            
-            print("ФАЙЛЫ:")
-            for i, file in enumerate(files, 1):
-                file_path = os.path.join(working_directory, file)
-                size = os.path.getsize(file_path)
-                print(f"{i:3}. 📄 {file} ({size} байт)")
-            
-            print("\nПАПКИ:")
-            for i, dir_name in enumerate(dirs, 1):
-                print(f"{i:3}. 📁 {dir_name}")
-    except Exception as e:
-        print(f"Ошибка при чтении директории: {e}")
+            if is_entry_modified(old, new):
+                yield SnapshotChange('modified', old, new)
+            old, old_key = advance(old_entries)
+            new, new_key = advance(new_entries)
     
-    wait_for_enter()
+    for new in added.values():
+        yield unpaired('added', new)
+    for old in removed.values():
+        yield unpaired('removed', old)
 
-def list_folders():
-    """Просмотр только папок"""
-    clear_screen()
-    print_header("ТОЛЬКО ПАПКИ")
-    
-    try:
-        items = os.listdir(working_directory)
-        folders = [item for item in items if os.path.isdir(os.path.join(working_directory, item))]
-        
-        if not folders:
-            print("Папки не найдены")
-        else:
-            for i, folder in enumerate(sorted(folders), 1):
-                print(f"{i:3}. 📁 {folder}")
-    except Exception as e:
-        print(f"Ошибка при чтении директории: {e}")
-    
-    wait_for_enter()
+def snapshot_change_line(change):
+    """Строка списка изменений: + добавлено, - удалено, ~ изменено, > переименовано"""
+    if change.change == 'added':
+        return f"+ {os.fsdecode(change.new.path)}"
+    if change.change == 'removed':
+        return f"- {os.fsdecode(change.old.path)}"
+    if change.change == 'renamed':
+        return f"> {os.fsdecode(change.old.path)} -> {os.fsdecode(change.new.path)}"
+    old, new = change.old, change.new
+    details = []
+    if old.kind != new.kind:
+        details.append("тип изменен")
+    if old.size != new.size:
+        details.append(f"размер {old.size} -> {new.size}")
+    if old.mtime != new.mtime and new.kind != SNAPSHOT_DIR_KIND:
+        details.append(f"изменен {datetime.fromtimestamp(new.mtime).isoformat(timespec='seconds')}")
+    if old.inode != new.inode and not details:
+        details.append("заменен")
+    return f"~ {os.fsdecode(new.path)} ({', '.join(details)})"
 
-def list_files():
-    """Просмотр только файлов"""
-    clear_screen()
-    print_header("ТОЛЬКО ФАЙЛЫ")
+def snapshot_directory(path, progress=None):
+    """Снимок дерева path и сравнение с предыдущим снимком в той же папке.
+
+    Новый снимок пишется рядом со старым; если старый есть, потоки обоих
+    снимков сравниваются, а список изменений пишется в SNAPSHOT_DIFF_FILE.
+    Только после этого новый снимок заменяет старый. Возвращает
+    (число записей, счетчики изменений или None без предыдущего снимка).
+    """
+    progress = progress or Progress(show_bytes=False)
+    snapshot_path = os.path.join(path, SNAPSHOT_FILE)
+    new_path = f"{snapshot_path}.new"
+    entries = write_snapshot(new_path, walk_snapshot(path, progress))
     
+    counts = None
     try:
-        items = os.listdir(working_directory)
-        files = [item for item in items if os.path.isfile(os.path.join(working_directory, item))]
-        
-        if not files:
-            print("Файлы не найдены")
-        else:
-            for i, file in enumerate(sorted(files), 1):
-                file_path = os.path.join(working_directory, file)
-                size = os.path.getsize(file_path)
-                print(f"{i:3}. 📄 {file} ({size} байт)")
-    except Exception as e:
-        print(f"Ошибка при чтении директории: {e}")
+        if os.path.exists(snapshot_path):
+            counts = defaultdict(int)
+            
+            def diff_lines():
+                for change in diff_snapshots(read_snapshot(snapshot_path), read_snapshot(new_path)):
+                    counts[change.change] += 1
+                    yield snapshot_change_line(change) + "\n"
+            
+            diff_path = os.path.join(path, SNAPSHOT_DIFF_FILE)
+            write_file_atomic(diff_path, diff_lines())
+            update_cache_added(diff_path)
+        os.replace(new_path, snapshot_path)
+    except BaseException:
+        try:
+            os.remove(new_path)
+        except OSError:
+            pass
+        raise
     
-    wait_for_enter()
+    update_cache_added(snapshot_path)
+    record_processed(entries=entries)
+    return entries, counts
 
+def snapshot_summary(counts):
+    """Итог сравнения снимков одной строкой"""
+    return (f"добавлено: {counts['added']}, удалено: {counts['removed']}, "
+            f"изменено: {counts['modified']}, переименовано: {counts['renamed']}")
+
+@instrumented()
 def save_directory_contents():
     """Сохранение содержимого директории в файл"""
     clear_screen()
     print_header("СОХРАНЕНИЕ СОДЕРЖИМОГО ДИРЕКТОРИИ")
+    print("Форматы: 1 - txt (только имена), 2 - jsonl, 3 - csv (с размером, датой и типом)")
+    
+    formats = {'': 'txt', '1': 'txt', '2': 'jsonl', '3': 'csv'}
+    choice = prompt_input("Выберите формат [1]: ").strip()
+    if choice not in formats:
+        print("❌ Неверный формат!")
+        wait_for_enter()
+        return
+    compress = prompt_input("Сжать gzip? (y/n) [n]: ").strip().lower() == 'y'
+    snapshot = prompt_input("Сохранить снимок дерева и сравнить с предыдущим? (y/n) [n]: ").strip().lower() == 'y'
     
     try:
-        items = os.listdir(working_directory)
-        files = []
-        dirs = []
+        file_name, files, dirs = export_directory(working_directory, formats[choice], compress)
+        print(f"Содержимое успешно сохранено в файл: {file_name}")
+        print(f"Найдено файлов: {files}, папок: {dirs}")
         
-        for item in sorted(items):
-            item_path = os.path.join(working_directory, item)
-            if os.path.isfile(item_path):
-                files.append(item)
+        if snapshot:
+            progress = Progress(show_bytes=False)
+            entries, counts = run_with_progress(progress, snapshot_directory, working_directory, progress)
+            print(f"Снимок сохранен в {SNAPSHOT_FILE}, записей: {entries}")
+            print_errors(progress)
+            if counts is None:
+                print("Предыдущего снимка нет - сравнение будет при следующем сохранении.")
             else:
-                dirs.append(item)
-        
-        # Создаем содержимое для файла
-        content = []
-        content.append("files:")
-        for file in files:
-            content.append(file)
-        
-        content.append("\ndirs:")
-        for dir_name in dirs:
-            content.append(dir_name)
-        
-        # Записываем в файл
-        file_path = os.path.join(working_directory, LISTDIR_FILE)
-        with open(file_path, 'w', encoding='utf-8') as f:
-            f.write('\n'.join(content))
-        
-        print(f"Содержимое успешно сохранено в файл: {LISTDIR_FILE}")
-        print(f"Найдено файлов: {len(files)}, папок: {len(dirs)}")
+                print(f"С прошлого снимка {snapshot_summary(counts)}")
+                if sum(counts.values()):
+                    with open(os.path.join(working_directory, SNAPSHOT_DIFF_FILE), encoding='utf-8') as f:
+                        for line in islice(f, PAGE_SIZE):
+                            print(f"  {line.rstrip()}")
+                    print(f"Полный список изменений: {SNAPSHOT_DIFF_FILE}")
         
     except Exception as e:
+        record_error()
         print(f"Ошибка при сохранении: {e}")
     
     wait_for_enter()
 
+@functools.lru_cache(maxsize=None)
+def system_info_lines():
+    """Сведения о системе; platform (и его внешние вызовы) - один раз за сеанс"""
+    import platform
+    return (
+        f"Операционная система: {platform.system()} {platform.release()}",
+        f"Версия: {platform.version()}",
+        f"Архитектура: {platform.machine()}",
+        f"Процессор: {platform.processor()}",
+        f"Имя компьютера: {platform.node()}",
+        f"Пользователь: {os.getenv('USERNAME') or os.getenv('USER') or 'Неизвестно'}",
+    )
+
 def system_info():
     """Информация об операционной системе"""
     clear_screen()
     print_header("ИНФОРМАЦИЯ О СИСТЕМЕ")
     
-    print(f"Операционная система: {platform.system()} {platform.release()}")
-    print(f"Версия: {platform.version()}")
-    print(f"Архитектура: {platform.machine()}")
-    print(f"Процессор: {platform.processor()}")
-    print(f"Имя компьютера: {platform.node()}")
-    print(f"Пользователь: {os.getenv('USERNAME') or os.getenv('USER') or 'Неизвестно'}")
+    for line in system_info_lines():
+        print(line)
     print(f"Текущее время: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
     wait_for_enter()
@@ -309,6 +3896,62 @@ def show_creator():
     
     wait_for_enter()
 
+def show_diagnostics():
+    """Диагностика: статистика внутренних кэшей и метрики действий"""
+    clear_screen()
+    print_header("ДИАГНОСТИКА")
+    
+    print("Кэш директорий:")
+    for line in directory_cache.stats_lines():
+        print(f"  {line}")
+    
+    print("\nЭкран:")
+    for line in screen.stats_lines():
+        print(f"  {line}")
+    
+    print("\nНаблюдение за рабочей директорией:")
+    if directory_watcher is None:
+        print("  выключено")
+    else:
+        for line in directory_watcher.stats_lines():
+            print(f"  {line}")
+    
+    print(f"\nМетрики действий ({'включены' if metrics.enabled else 'выключены'}):")
+    for line in metrics.stats_lines():
+        print(f"  {line}")
+    
+    watch_action = "выключить" if directory_watcher else "включить"
+    metrics_action = "выключить" if metrics.enabled else "включить"
+    command = prompt_input(f"\n[w] {watch_action} наблюдение, [m] {metrics_action} метрики, "
+                    f"[s] сохранить метрики в файл, [r] сбросить метрики, [Enter] назад: ").strip().lower()
+    if command == 'm':
+        metrics.enabled = not metrics.enabled
+        print(f"✅ Метрики {'включены' if metrics.enabled else 'выключены'}")
+        wait_for_enter()
+    elif command == 'r':
+        metrics.reset()
+        print("✅ Метрики сброшены")
+        wait_for_enter()
+    elif command == 's':
+        fmt = 'prom' if prompt_input("Формат: 1 - JSON, 2 - Prometheus [1]: ").strip() == '2' else 'json'
+        try:
+            metrics.dump(METRICS_FILES[fmt])
+            print(f"✅ Метрики сохранены в {os.path.abspath(METRICS_FILES[fmt])}")
+        except OSError as e:
+            print(f"Ошибка при сохранении метрик: {e}")
+        wait_for_enter()
+    elif command == 'w':
+        try:
+            if directory_watcher is None:
+                watcher = start_watching(working_directory)
+                print(f"✅ Наблюдение включено ({watcher.kind})")
+            else:
+                stop_watching()
+                print("✅ Наблюдение выключено")
+        except OSError as e:
+            print(f"Ошибка при включении наблюдения: {e}")
+        wait_for_enter()
+
 # ========== ИГРА ВИКТОРИНА ==========
 
 def play_quiz():
@@ -353,7 +3996,7 @@ def play_quiz():
             print(option)
         
         try:
-            answer = int(input("Ваш ответ (номер варианта): "))
+            answer = int(prompt_input("Ваш ответ (номер варианта): "))
             if answer == q['answer']:
                 print("✅ Правильно!")
                 score += 1
@@ -368,136 +4011,574 @@ def play_quiz():
 
 # ========== БАНКОВСКИЙ СЧЕТ (ОБНОВЛЕННАЯ ВЕРСИЯ) ==========
 
-def load_bank_data():
-    """Загрузка данных банковского счета из JSON файла"""
-    if os.path.exists(BANK_ACCOUNT_FILE):
-        try:
-            with open(BANK_ACCOUNT_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('balance', 0.0), data.get('purchases', [])
-        except (json.JSONDecodeError, IOError):
-            return 0.0, []
-    return 0.0, []
+# Начало отсчета для целочисленных отметок времени покупок. Даты в файле
+# счета - местное время без зоны, поэтому они переводятся в секунды "как есть",
+# без учета часового пояса: так преобразование обратимо и не зависит от DST.
+EPOCH = datetime(1970, 1, 1)
+SECONDS_PER_DAY = 86400
 
-def save_bank_data(balance, purchases):
-    """Сохранение данных банковского счета в JSON файл"""
+def to_kopecks(amount):
+    """Сумма в рублях (число из JSON) -> целое число копеек"""
+    return int(round(amount * 100))
+
+def parse_amount(text):
+    """Ввод суммы пользователем -> целое число копеек без ошибок округления float"""
+    from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
     try:
-        data = {
-            'balance': balance,
-            'purchases': purchases,
-            'last_updated': datetime.now().isoformat()
+        value = Decimal(text.strip().replace(',', '.'))
+    except InvalidOperation:
+        raise ValueError(f"некорректная сумма: {text!r}")
+    if not value.is_finite():
+        raise ValueError(f"некорректная сумма: {text!r}")
+    return int((value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+def format_money(kopecks):
+    """Копейки -> строка с двумя знаками после запятой"""
+    sign = "-" if kopecks < 0 else ""
+    rubles, rest = divmod(abs(kopecks), 100)
+    return f"{sign}{rubles}.{rest:02d}"
+
+def parse_timestamp(date):
+    """'ГГГГ-ММ-ДД ЧЧ:ММ:СС' -> целое число секунд"""
+    return (datetime.fromisoformat(date) - EPOCH) // timedelta(seconds=1)
+
+def normalize_date(text):
+    """Дата пользователя ('2024-1-1') -> 'ГГГГ-ММ-ДД'; ValueError, если дата некорректна.
+
+    Фильтры периода сравнивают даты с сохраненными ключами, поэтому
+    дальше передается только каноническая запись с ведущими нулями.
+    """
+    return datetime.strptime(text, '%Y-%m-%d').strftime('%Y-%m-%d')
+
+def format_timestamp(timestamp):
+    """Целое число секунд -> 'ГГГГ-ММ-ДД ЧЧ:ММ:СС'"""
+    return (EPOCH + timedelta(seconds=timestamp)).isoformat(' ')
+
+def format_day(day):
+    """Номер дня -> 'ГГГГ-ММ-ДД'"""
+    return (EPOCH + timedelta(days=day)).strftime('%Y-%m-%d')
+
+def format_month(month):
+    """Номер месяца (год * 12 + месяц - 1) -> 'ГГГГ-ММ'"""
+    year, month_index = divmod(month, 12)
+    return f"{year:04d}-{month_index + 1:02d}"
+
+def day_to_month(day):
+    """Номер дня -> номер месяца"""
+    date = EPOCH + timedelta(days=day)
+    return date.year * 12 + date.month - 1
+
+class PurchaseHistory:
+    """История покупок в компактном колоночном виде.
+
+    Каждое поле хранится отдельным массивом array: время - целые секунды,
+    суммы - целые копейки (без накопления ошибки float), название - номер
+    в таблице уникальных названий. Это около 30 байт на покупку вместо
+    нескольких сотен у словаря со строками.
+
+    Итоги (сумма, количество, суммы по дням и месяцам) обновляются при
+    каждом добавлении, а не пересчитываются. Период выбирается двоичным
+    поиском по времени, фильтр по названию использует списки номеров
+    покупок для каждого названия.
+    """
+    
+    def __init__(self, purchases=()):
+        self.clear()
+        for purchase in purchases:
+            self.append(purchase)
+    
+    def clear(self):
+        self.timestamps = array('q')
+        self.amounts = array('q')
+        self.balances = array('q')
+        self.name_ids = array('I')
+        # Уникальные названия, их номера и номера покупок для каждого названия
+        self.names = []
+        self.names_lower = []
+        self.name_lookup = {}
+        self.name_positions = []
+        # Итоги в копейках; дни и месяцы - целые номера (см. format_day/format_month)
+        self.total = 0
+        self.by_day = defaultdict(int)
+        self.by_month = defaultdict(int)
+        self._last_day = None
+        self._last_month = None
+        # Отдельный индекс времени появляется, только если покупки добавлялись не по порядку
+        self.date_keys = None
+        self.date_positions = None
+    
+    def __len__(self):
+        return len(self.amounts)
+    
+    def __iter__(self):
+        return (self.record(position) for position in range(len(self)))
+    
+    def append(self, purchase):
+        """Добавление покупки в формате JSON-файла счета"""
+        self.add(purchase['name'], parse_timestamp(purchase['date']),
+                 to_kopecks(purchase['amount']), to_kopecks(purchase['balance_after']))
+    
+    def add(self, name, timestamp, amount, balance_after):
+        """Добавление покупки: время в секундах, суммы в копейках"""
+        position = len(self.amounts)
+        name_id = self.name_lookup.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self.names.append(name)
+            self.names_lower.append(name.lower())
+            self.name_lookup[name] = name_id
+            self.name_positions.append(array('I'))
+        
+        if self.date_keys is not None:
+            i = bisect.bisect_right(self.date_keys, timestamp)
+            self.date_keys.insert(i, timestamp)
+            self.date_positions.insert(i, position)
+        elif self.timestamps and timestamp < self.timestamps[-1]:
+            # Первая покупка не по порядку времени - строим отдельный индекс
+            order = sorted(range(position + 1),
+                           key=lambda p: self.timestamps[p] if p < position else timestamp)
+            self.date_positions = array('I', order)
+            self.date_keys = array('q', (self.timestamps[p] if p < position else timestamp for p in order))
+        
+        self.timestamps.append(timestamp)
+        self.amounts.append(amount)
+        self.balances.append(balance_after)
+        self.name_ids.append(name_id)
+        self.name_positions[name_id].append(position)
+        
+        day = timestamp // SECONDS_PER_DAY
+        if day != self._last_day:
+            self._last_day = day
+            self._last_month = day_to_month(day)
+        self.total += amount
+        self.by_day[day] += amount
+        self.by_month[self._last_month] += amount
+    
+    def record(self, position):
+        """Покупка в формате JSON-файла счета"""
+        return {
+            'name': self.names[self.name_ids[position]],
+            'amount': self.amounts[position] / 100,
+            'date': format_timestamp(self.timestamps[position]),
+            'balance_after': self.balances[position] / 100
         }
-        with open(BANK_ACCOUNT_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+    
+    def to_dicts(self):
+        """Все покупки в формате JSON-файла счета"""
+        return list(self)
+    
+    def positions_in_range(self, date_from=None, date_to=None):
+        """Номера покупок за период (даты ГГГГ-ММ-ДД включительно), по времени"""
+        keys = self.timestamps if self.date_keys is None else self.date_keys
+        lo = bisect.bisect_left(keys, parse_timestamp(date_from)) if date_from else 0
+        hi = (bisect.bisect_left(keys, parse_timestamp(date_to) + SECONDS_PER_DAY)
+              if date_to else len(keys))
+        if self.date_positions is None:
+            return range(lo, hi)
+        return self.date_positions[lo:hi]
+    
+    def positions_by_name(self, text, newest_first=False):
+        """Номера покупок, название которых содержит text (без учета регистра).
+
+        Просматриваются только различные названия; списки номеров уже
+        упорядочены и сливаются лениво.
+        """
+        text = text.lower()
+        lists = [self.name_positions[name_id]
+                 for name_id, name in enumerate(self.names_lower) if text in name]
+        if newest_first:
+            return heapq.merge(*(reversed(positions) for positions in lists), reverse=True)
+        return heapq.merge(*lists)
+    
+    def select(self, name=None, date_from=None, date_to=None, newest_first=True):
+        """Генератор (номер, покупка) по фильтрам в порядке времени"""
+        if name:
+            positions = self.positions_by_name(name, newest_first)
+            if date_from or date_to:
+                lo = parse_timestamp(date_from) if date_from else None
+                hi = parse_timestamp(date_to) + SECONDS_PER_DAY if date_to else None
+                timestamps = self.timestamps
+                positions = (p for p in positions
+                             if (lo is None or timestamps[p] >= lo) and (hi is None or timestamps[p] < hi))
+        else:
+            positions = self.positions_in_range(date_from, date_to)
+            if newest_first:
+                positions = reversed(positions)
+        for position in positions:
+            yield position + 1, self.record(position)
+
+# Снимок счета переписывается каждые N операций журнала
+BANK_SNAPSHOT_EVERY = 1000
+# Границы списка покупок в построчном формате снимка
+SNAPSHOT_PURCHASES_START = ', "purchases": [\n'
+SNAPSHOT_PURCHASES_END = "]}"
+
+class BankStorageError(Exception):
+    """Данные счета повреждены и не могут быть загружены"""
+
+def write_file_atomic(path, chunks):
+    """Атомарная запись частей текста: временный файл, fsync и переименование"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.writelines(chunks)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+class BankStorage:
+    """Журналируемое хранилище банковского счета.
+
+    Каждая операция дописывается одной строкой JSON в журнал с fsync,
+    поэтому сохранение не зависит от длины истории. Раз в
+    BANK_SNAPSHOT_EVERY операций состояние записывается атомарным снимком
+    (формат прежнего bank_account.json) и журнал очищается. При загрузке
+    читается снимок и воспроизводятся записи журнала с номером больше
+    номера снимка. Старый bank_account.json без журнала читается как снимок.
+
+    Снимок пишется по одной покупке на строку и читается построчно прямо
+    в PurchaseHistory, без промежуточного списка словарей. Баланс хранится
+    в копейках.
+    """
+    
+    def __init__(self, snapshot_path=BANK_ACCOUNT_FILE, journal_path=BANK_JOURNAL_FILE):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.seq = 0
+        self.pending = 0
+    
+    @instrumented("bank_load")
+    def load(self):
+        """Загрузка состояния: (баланс в копейках, PurchaseHistory)"""
+        balance, purchases = 0, PurchaseHistory()
+        self.seq = 0
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                    balance, self.seq = self._read_snapshot(f, purchases)
+            except (ValueError, KeyError, TypeError) as e:
+                raise BankStorageError(f"{self.snapshot_path}: {e}") from e
+        
+        self.pending = 0
+        if os.path.exists(self.journal_path):
+            balance, purchases = self._replay(balance, purchases)
+        record_processed(entries=len(purchases))
+        return balance, purchases
+    
+    @staticmethod
+    def _read_snapshot(f, purchases):
+        """Чтение снимка в purchases; возвращает (баланс в копейках, seq)"""
+        import json
+        header = f.readline()
+        if header.endswith(SNAPSHOT_PURCHASES_START):
+            # Построчный формат снимка: заголовок, по покупке на строку, конец списка
+            data = json.loads(header[:-len(SNAPSHOT_PURCHASES_START)] + "}")
+            for line in f:
+                line = line.rstrip().rstrip(',')
+                if line == SNAPSHOT_PURCHASES_END:
+                    break
+                purchases.append(json.loads(line))
+            else:
+                raise ValueError("снимок оборван")
+        else:
+            # Прежний формат bank_account.json (с отступами) - читаем целиком
+            data = json.loads(header + f.read())
+            for purchase in data.get('purchases', []):
+                purchases.append(purchase)
+        return to_kopecks(data.get('balance', 0.0)), data.get('seq', 0)
+    
+    def _replay(self, balance, purchases):
+        """Воспроизведение журнала поверх снимка"""
+        import json
+        good_size = 0
+        with open(self.journal_path, 'rb') as f:
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("неполная запись")
+                    record = json.loads(line)
+                except ValueError:
+                    # Оборванная последняя запись (сбой во время записи) отбрасывается,
+                    # испорченная запись в середине журнала - ошибка
+                    if f.read(1):
+                        raise BankStorageError(f"{self.journal_path}: поврежденная запись после байта {good_size}")
+                    break
+                good_size += len(line)
+                if record['seq'] <= self.seq:
+                    continue
+                balance, purchases = apply_bank_record(balance, purchases, record)
+                self.seq = record['seq']
+                self.pending += 1
+        
+        if good_size != os.path.getsize(self.journal_path):
+            with open(self.journal_path, 'r+b') as f:
+                f.truncate(good_size)
+        return balance, purchases
+    
+    @instrumented("bank_journal_append")
+    def append(self, record, balance, purchases):
+        """Запись одной операции в журнал; время не зависит от длины истории"""
+        import json
+        try:
+            record = dict(record, seq=self.seq + 1)
+            line = json.dumps(record, ensure_ascii=False) + "\n"
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self.seq += 1
+            self.pending += 1
+            record_processed(entries=1, nbytes=len(line.encode('utf-8')))
+        except OSError:
+            record_error()
+            return False
+        if self.pending >= BANK_SNAPSHOT_EVERY:
+            self.compact(balance, purchases)
         return True
-    except Exception:
-        return False
+    
+    @staticmethod
+    def _snapshot_lines(header, purchases):
+        """Снимок по частям: заголовок, покупки по одной на строку, конец"""
+        import json
+        yield header[:-1] + SNAPSHOT_PURCHASES_START
+        last = len(purchases) - 1
+        for i, purchase in enumerate(purchases):
+            yield json.dumps(purchase, ensure_ascii=False) + (",\n" if i < last else "\n")
+        yield SNAPSHOT_PURCHASES_END + "\n"
+    
+    @instrumented("bank_snapshot")
+    def compact(self, balance, purchases):
+        """Запись снимка состояния и очистка журнала"""
+        import json
+        try:
+            header = json.dumps({
+                'balance': balance / 100,
+                'last_updated': datetime.now().isoformat(),
+                'seq': self.seq
+            }, ensure_ascii=False)
+            write_file_atomic(self.snapshot_path, self._snapshot_lines(header, purchases))
+            # Сбой до очистки журнала безопасен: записи с номером <= seq пропускаются при загрузке
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, 'w', encoding='utf-8'):
+                    pass
+            self.pending = 0
+            record_processed(entries=len(purchases), nbytes=os.path.getsize(self.snapshot_path))
+            return True
+        except Exception:
+            record_error()
+            return False
+
+def apply_bank_record(balance, purchases, record):
+    """Применение одной операции журнала к состоянию счета (баланс в копейках)"""
+    op = record['op']
+    if op == 'deposit':
+        balance += to_kopecks(record['amount'])
+    elif op == 'purchase':
+        balance -= to_kopecks(record['amount'])
+        purchases.append(record)
+    elif op == 'clear':
+        purchases.clear()
+    return balance, purchases
+
+@instrumented()
+def load_bank_data():
+    """Загрузка данных банковского счета (снимок JSON + журнал операций)"""
+    balance, purchases = BankStorage().load()
+    return balance / 100, purchases.to_dicts()
+
+@instrumented()
+def save_bank_data(balance, purchases):
+    """Сохранение полного снимка банковского счета в JSON файл"""
+    storage = BankStorage()
+    try:
+        # Номер последней операции нужен, чтобы журнал не применился поверх снимка
+        storage.load()
+    except BankStorageError:
+        pass
+    return storage.compact(to_kopecks(balance), PurchaseHistory(purchases))
+
+def read_date(prompt):
+    """Ввод даты ГГГГ-ММ-ДД (повтор до корректной); пустая строка - без ограничения"""
+    while True:
+        value = prompt_input(prompt).strip()
+        if not value:
+            return None
+        try:
+            return normalize_date(value)
+        except ValueError:
+            print("❌ Некорректная дата! Формат: ГГГГ-ММ-ДД")
+
+@instrumented()
+def show_purchase_history(purchases):
+    """Постраничная история покупок с фильтрами по названию и периоду"""
+    clear_screen()
+    print_header("ИСТОРИЯ ПОКУПОК")
+    if not purchases:
+        print("История покупок пуста")
+        wait_for_enter()
+        return
+    
+    print(f"Всего потрачено: {format_money(purchases.total)} руб. (покупок: {len(purchases)})\n")
+    name = prompt_input("Фильтр по названию (Enter - все): ").strip()
+    date_from = read_date("Период с (ГГГГ-ММ-ДД, Enter - без ограничения): ")
+    date_to = read_date("Период по (ГГГГ-ММ-ДД, Enter - без ограничения): ")
+    
+    def open_records(order):
+        return purchases.select(name, date_from, date_to, order == 0)
+    
+    def format_page(page):
+        lines = []
+        for i, purchase in page:
+            lines.append(f"{i}. {purchase['date']}")
+            lines.append(f"   {purchase['name']} - {purchase['amount']:.2f} руб.")
+            lines.append(f"   Баланс после: {purchase['balance_after']:.2f} руб.")
+        return lines
+    
+    show_paged("ИСТОРИЯ ПОКУПОК", open_records, format_page, "Покупки не найдены",
+               page_size=10, orders=("новые сначала", "старые сначала"))
+
+@instrumented()
+def show_purchase_totals(purchases):
+    """Итоги покупок по месяцам и по дням (из поддерживаемых агрегатов)"""
+    def open_records(order):
+        month = None
+        for day, day_total in sorted(purchases.by_day.items(), reverse=order == 0):
+            if day_to_month(day) != month:
+                month = day_to_month(day)
+                yield f"{format_month(month)}: {format_money(purchases.by_month[month])} руб."
+            yield f"   {format_day(day)}: {format_money(day_total)} руб."
+    
+    def format_page(page):
+        return [f"Всего потрачено: {format_money(purchases.total)} руб. (покупок: {len(purchases)})", ""] + page
+    
+    show_paged("ИТОГИ ПОКУПОК", open_records, format_page, "История покупок пуста",
+               orders=("новые сначала", "старые сначала"))
+
+@instrumented()
+def bank_deposit(storage, balance, purchases):
+    """Пополнение счета; возвращает новый баланс в копейках"""
+    try:
+        amount = parse_amount(prompt_input("Введите сумму пополнения: "))
+        if amount > 0:
+            balance += amount
+            if storage.append({'op': 'deposit', 'amount': amount / 100}, balance, purchases):
+                print(f"✅ Счет пополнен на {format_money(amount)} руб.")
+            else:
+                print("⚠️ Счет пополнен, но данные не сохранены!")
+        else:
+            print("❌ Сумма должна быть положительной!")
+    except ValueError:
+        print("❌ Некорректная сумма!")
+    return balance
+
+@instrumented()
+def bank_purchase(storage, balance, purchases):
+    """Покупка с записью в историю; возвращает новый баланс в копейках"""
+    try:
+        amount = parse_amount(prompt_input("Введите стоимость покупки: "))
+        if amount <= 0:
+            print("❌ Стоимость должна быть положительной!")
+        elif amount > balance:
+            print("❌ Недостаточно средств!")
+        else:
+            purchase_name = prompt_input("Введите название покупки: ").strip()
+            if not purchase_name:
+                purchase_name = "Покупка"
+            
+            balance -= amount
+            purchase_record = {
+                'name': purchase_name,
+                'amount': amount / 100,
+                'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'balance_after': balance / 100
+            }
+            purchases.append(purchase_record)
+            
+            if storage.append(dict(purchase_record, op='purchase'), balance, purchases):
+                print(f"✅ Покупка совершена!")
+            else:
+                print("⚠️ Покупка совершена, но данные не сохранены!")
+    
+    except ValueError:
+        print("❌ Некорректная сумма!")
+    return balance
+
+BANK_MENU_ITEMS = [
+    "1. Пополнить счет",
+    "2. Совершить покупку",
+    "3. История покупок",
+    "4. Очистить историю",
+    "5. Итоги по месяцам и дням",
+    "6. Выход в главное меню",
+]
 
 def bank_account():
-    """Управление банковским счетом с сохранением в JSON"""
-    balance, purchases = load_bank_data()
+    """Управление банковским счетом с журналом операций"""
+    storage = BankStorage()
+    try:
+        balance, purchases = storage.load()
+    except (BankStorageError, OSError) as e:
+        # Не продолжаем с нулевым балансом, чтобы не затереть данные при сохранении
+        print(f"❌ Не удалось загрузить данные счета: {e}")
+        print("Файлы счета не изменены.")
+        wait_for_enter()
+        return
     
     while True:
-        clear_screen()
-        print_header("МОЙ БАНКОВСКИЙ СЧЕТ")
-        print(f"Текущий баланс: {balance:.2f} руб.")
-        print(f"Всего покупок: {len(purchases)}")
-        print("-" * 60)
-        print("1. Пополнить счет")
-        print("2. Совершить покупку")
-        print("3. История покупок")
-        print("4. Очистить историю")
-        print("5. Выход в главное меню")
-        print("-" * 60)
-        
-        choice = input("Выберите действие: ").strip()
+        lines = header_lines("МОЙ БАНКОВСКИЙ СЧЕТ")
+        lines.append(f"Текущий баланс: {format_money(balance)} руб.")
+        lines.append(f"Всего покупок: {len(purchases)}")
+        lines.append("-" * 60)
+        lines.extend(BANK_MENU_ITEMS)
+        lines.append("-" * 60)
+        
+        choice = screen.prompt(lines, "Выберите действие: ").strip()
         
         if choice == "1":
-            try:
-                amount = float(input("Введите сумму пополнения: "))
-                if amount > 0:
-                    balance += amount
-                    print(f"✅ Счет пополнен на {amount:.2f} руб.")
-                    save_bank_data(balance, purchases)
-                else:
-                    print("❌ Сумма должна быть положительной!")
-            except ValueError:
-                print("❌ Некорректная сумма!")
+            balance = bank_deposit(storage, balance, purchases)
         
         elif choice == "2":
-            try:
-                amount = float(input("Введите стоимость покупки: "))
-                if amount <= 0:
-                    print("❌ Стоимость должна быть положительной!")
-                    continue
-                
-                if amount > balance:
-                    print("❌ Недостаточно средств!")
-                    continue
-                
-                purchase_name = input("Введите название покупки: ").strip()
-                if not purchase_name:
-                    purchase_name = "Покупка"
-                
-                balance -= amount
-                purchase_record = {
-                    'name': purchase_name,
-                    'amount': amount,
-                    'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'balance_after': balance
-                }
-                purchases.append(purchase_record)
-                
-                if save_bank_data(balance, purchases):
-                    print(f"✅ Покупка совершена!")
-                else:
-                    print("⚠️ Покупка совершена, но данные не сохранены!")
-                
-            except ValueError:
-                print("❌ Некорректная сумма!")
+            balance = bank_purchase(storage, balance, purchases)
         
         elif choice == "3":
-            clear_screen()
-            print_header("ИСТОРИЯ ПОКУПОК")
-            if purchases:
-                total_spent = sum(p['amount'] for p in purchases)
-                print(f"Всего потрачено: {total_spent:.2f} руб.\n")
-                
-                for i, purchase in enumerate(purchases, 1):
-                    print(f"{i}. {purchase['date']}")
-                    print(f"   {purchase['name']} - {purchase['amount']:.2f} руб.")
-                    print(f"   Баланс после: {purchase['balance_after']:.2f} руб.\n")
-            else:
-                print("История покупок пуста")
-            wait_for_enter()
+            show_purchase_history(purchases)
             continue
         
         elif choice == "4":
-            confirm = input("Вы уверены, что хотите очистить историю? (y/n): ").strip().lower()
+            confirm = prompt_input("Вы уверены, что хотите очистить историю? (y/n): ").strip().lower()
             if confirm == 'y':
-                purchases = []
-                if save_bank_data(balance, purchases):
+                purchases.clear()
+                if storage.append({'op': 'clear'}, balance, purchases):
                     print("✅ История очищена!")
                 else:
                     print("❌ Ошибка при сохранении!")
             wait_for_enter()
         
         elif choice == "5":
-            if save_bank_data(balance, purchases):
-                print("✅ Данные сохранены!")
-            else:
-                print("❌ Ошибка сохранения данных!")
+            show_purchase_totals(purchases)
+            continue
+        
+        elif choice == "6":
+            # Все операции уже записаны в журнал, снимок обновляется по BANK_SNAPSHOT_EVERY
+            print("✅ Данные сохранены!")
             wait_for_enter()
             break
         
         else:
             print("❌ Неверный пункт меню!")
         
-        if choice in ["1", "2", "4"]:
+        if choice not in ["3", "5", "6"]:
             wait_for_enter()
 
 # ========== СМЕНА РАБОЧЕЙ ДИРЕКТОРИИ ==========
 
+@instrumented()
 def change_directory():
     """Смена рабочей директории"""
     global working_directory
@@ -511,7 +4592,7 @@ def change_directory():
     print("  • '.' - текущая папка")
     print("-" * 60)
     
-    new_path = input("Введите новый путь: ").strip()
+    new_path = prompt_input("Введите новый путь: ").strip()
     
     if not new_path:
         print("❌ Путь не может быть пустым!")
@@ -531,17 +4612,529 @@ def change_directory():
     if os.path.exists(target_path) and os.path.isdir(target_path):
         working_directory = target_path
         print(f"✅ Рабочая директория изменена на:\n{working_directory}")
+        if directory_watcher is not None:
+            try:
+                start_watching(working_directory)
+            except OSError as e:
+                stop_watching()
+                print(f"Наблюдение выключено: {e}")
     else:
         print(f"❌ Путь не существует или не является папкой!")
     
     wait_for_enter()
 
+# ========== КОМАНДНАЯ СТРОКА И ПАКЕТНЫЙ РЕЖИМ ==========
+
+class CommandError(Exception):
+    """Ошибка выполнения команды в неинтерактивном режиме"""
+
+def resolve_path(name):
+    """Путь относительно рабочей директории (абсолютные пути не меняются)"""
+    if not name:
+        raise CommandError("имя не может быть пустым")
+    return os.path.normpath(os.path.join(working_directory, name))
+
+def report_errors(progress):
+    """Вывод ошибок длительной операции в stderr; True, если ошибок не было"""
+    for path, error in progress.errors:
+        print(f"Ошибка: {path}: {error}", file=sys.stderr)
+    return not progress.errors
+
+def cmd_cd(args):
+    """Смена рабочей директории для следующих команд пакета"""
+    global working_directory
+    target_path = resolve_path(args.path)
+    if not os.path.isdir(target_path):
+        raise CommandError(f"'{args.path}' не существует или не является папкой")
+    working_directory = target_path
+    return True
+
+def cmd_mkdir(args):
+    """Создание папок"""
+    for name in args.names:
+        folder_path = resolve_path(name)
+        try:
+            os.makedirs(folder_path, exist_ok=args.parents)
+        except FileExistsError:
+            raise CommandError(f"папка '{name}' уже существует")
+        update_cache_added(folder_path)
+    return True
+
+def cmd_rm(args):
+    """Удаление файлов и папок без подтверждения"""
+    ok = True
+    for name in args.names:
+        item_path = resolve_path(name)
+        if not os.path.lexists(item_path):
+            if args.force:
+                continue
+            raise CommandError(f"'{name}' не найден")
+        progress = Progress(show_bytes=False)
+        run_delete(item_path, progress, args.workers)
+        ok = report_errors(progress) and ok
+    return ok
+
+def cmd_cp(args):
+    """Копирование файла или папки"""
+    source_path = resolve_path(args.source)
+    dest_path = resolve_path(args.dest)
+    if not os.path.exists(source_path):
+        raise CommandError(f"'{args.source}' не найден")
+    if os.path.isdir(source_path) and os.path.commonpath(
+            [os.path.abspath(source_path), os.path.abspath(dest_path)]) == os.path.abspath(source_path):
+        raise CommandError("нельзя копировать папку внутрь самой себя")
+    if os.path.exists(dest_path):
+        if not (os.path.isdir(source_path) and os.path.isdir(dest_path)):
+            raise CommandError(f"'{args.dest}' уже существует")
+        if not args.resume:
+            raise CommandError(f"'{args.dest}' уже существует (--resume докопирует папку)")
+    
+    progress = Progress()
+    run_copy(source_path, dest_path, progress, args.workers)
+    if args.verbose:
+        print(progress.status_line())
+    return report_errors(progress)
+
+def cmd_sync(args):
+    """Односторонняя синхронизация папки с копией"""
+    source_path = resolve_path(args.source)
+    dest_path = resolve_path(args.dest)
+    if not os.path.isdir(source_path):
+        raise CommandError(f"папка '{args.source}' не найдена")
+    if paths_overlap(source_path, dest_path):
+        raise CommandError("папки не должны быть вложены одна в другую")
+    if os.path.exists(dest_path) and not os.path.isdir(dest_path):
+        raise CommandError(f"'{args.dest}' не является папкой")
+    
+    progress = Progress()
+    tolerance = MTIME_TOLERANCE if args.fat_mtime else 0.0
+    run_mirror(source_path, dest_path, args.checksum, args.delete, tolerance, progress, args.workers)
+    if args.verbose:
+        print(mirror_summary(progress))
+        print(progress.status_line())
+    return report_errors(progress)
+
+def sort_key_for(args):
+    """Ключ сортировки списка из --sort / -U (None - порядок диска)"""
+    if args.unsorted:
+        return None
+    return next(key for code, _, key in LIST_ORDERS if code == args.sort)
+
+def cmd_archive(args):
+    """Упаковка файла или папки в tar.gz/zip"""
+    source_path = resolve_path(args.source)
+    if not os.path.lexists(source_path):
+        raise CommandError(f"'{args.source}' не найден")
+    fmt = 'zip' if args.zip else 'tar.gz'
+    archive_path = resolve_path(args.output or os.path.basename(os.path.abspath(source_path))
+                                + ARCHIVE_FORMATS[fmt])
+    if os.path.isdir(source_path) and paths_overlap(source_path, archive_path):
+        raise CommandError("нельзя сохранить архив внутри архивируемой папки")
+    
+    progress = Progress()
+    run_archive(source_path, archive_path, fmt, progress, args.workers)
+    if args.verbose:
+        print(archive_summary(progress, archive_path))
+    return report_errors(progress)
+
+def cmd_extract(args):
+    """Распаковка архива tar.gz/zip"""
+    archive_path = resolve_path(args.archive)
+    if not os.path.isfile(archive_path):
+        raise CommandError(f"'{args.archive}' не найден")
+    if archive_format(archive_path) is None:
+        raise CommandError("поддерживаются только архивы .tar.gz, .tgz и .zip")
+    dest_path = resolve_path(args.dest)
+    if os.path.exists(dest_path) and not os.path.isdir(dest_path):
+        raise CommandError(f"'{args.dest}' не является папкой")
+    
+    progress = Progress()
+    try:
+        run_extract(archive_path, dest_path, progress, args.workers)
+    except ArchiveError as e:
+        raise CommandError(str(e))
+    if args.verbose:
+        print(archive_summary(progress))
+    return report_errors(progress)
+
+def cmd_ls(args):
+    """Содержимое рабочей директории (файлы, затем папки)"""
+    path = working_directory
+    key = sort_key_for(args)
+    if key is None:
+        records = directory_records(path)
+        lines = content_lines(path, ((number, record, None) for number, record in enumerate(records, 1)))
+    else:
+        records = sorted_scan(path, key=files_first(key), stat_files=key in STAT_SORT_KEYS)
+        lines = content_lines(path, number_groups(records), show_mtime=args.sort == 'mtime')
+    for line in lines:
+        print(line)
+    return True
+
+def cmd_dirs(args):
+    """Только папки рабочей директории"""
+    select = attrgetter('is_dir')
+    path = working_directory
+    key = sort_key_for(args)
+    records = filter(select, directory_records(path)) if key is None else sorted_scan(path, key, select)
+    for i, record in enumerate(records, 1):
+        print(folder_line(i, record))
+    return True
+
+def cmd_files(args):
+    """Только файлы рабочей директории"""
+    select = attrgetter('is_file')
+    path = working_directory
+    key = sort_key_for(args)
+    if key is None:
+        records = filter(select, directory_records(path))
+    else:
+        records = sorted_scan(path, key, select, stat_files=key in STAT_SORT_KEYS)
+    for i, record in enumerate(records, 1):
+        print(file_line(path, i, record, args.sort == 'mtime'))
+    return True
+
+def cmd_top(args):
+    """Самые большие или самые новые файлы"""
+    root = resolve_path(args.path)
+    if not os.path.isdir(root):
+        raise CommandError(f"'{args.path}' не является папкой")
+    progress = Progress(show_bytes=False)
+    top, summary = top_files(root, args.n, args.by, args.recursive, progress)
+    record_processed(progress.files, errors=len(progress.errors))
+    for line in top_file_lines(root, top, args.by):
+        print(line)
+    if args.recursive:
+        print()
+        for line in extension_summary_lines(summary):
+            print(line)
+    return report_errors(progress)
+
+def cmd_export(args):
+    """Экспорт содержимого рабочей директории в файл"""
+    file_name, files, dirs = export_directory(working_directory, args.format, args.gzip)
+    print(f"{file_name}: файлов {files}, папок {dirs}")
+    if not args.snapshot:
+        return True
+    progress = Progress(show_bytes=False)
+    entries, counts = snapshot_directory(working_directory, progress)
+    print(f"{SNAPSHOT_FILE}: записей {entries}")
+    if counts is not None:
+        print(f"{SNAPSHOT_DIFF_FILE}: {snapshot_summary(counts)}")
+    return report_errors(progress)
+
+def cmd_du(args):
+    """Отчет о занятом месте"""
+    root = resolve_path(args.path)
+    if not os.path.isdir(root):
+        raise CommandError(f"'{args.path}' не является папкой")
+    progress = Progress(show_bytes=False)
+    usage = disk_usage(root, args.top, DU_WORKERS, progress)
+    for line in disk_usage_lines(usage, root):
+        print(line)
+    return report_errors(progress)
+
+def cmd_find(args):
+    """Поиск по индексу файлов"""
+    import sqlite3
+    conn = None
+    try:
+        conn = open_search_index()
+        root = indexed_root(conn, working_directory)
+        if root is None or args.refresh:
+            root = root or working_directory
+            progress = Progress(show_bytes=False)
+            refresh_search_index(conn, root, SEARCH_WORKERS, progress)
+            report_errors(progress)
+        rows = search_index(conn, working_directory, args.query)
+        for i, row in enumerate(islice(rows, args.limit), 1):
+            print(search_result_line(working_directory, i, row))
+    except sqlite3.Error as e:
+        raise CommandError(f"индекс поиска: {e}")
+    finally:
+        if conn is not None:
+            conn.close()
+    return True
+
+def open_bank():
+    """Загрузка счета для команды bank"""
+    storage = BankStorage()
+    try:
+        balance, purchases = storage.load()
+    except BankStorageError as e:
+        raise CommandError(f"не удалось загрузить данные счета: {e}")
+    return storage, balance, purchases
+
+def read_cli_amount(text):
+    """Положительная сумма в копейках из аргумента команды"""
+    try:
+        amount = parse_amount(text)
+    except ValueError:
+        raise CommandError(f"некорректная сумма '{text}'")
+    if amount <= 0:
+        raise CommandError("сумма должна быть положительной")
+    return amount
+
+def cmd_bank_balance(args):
+    """Текущий баланс"""
+    _, balance, purchases = open_bank()
+    print(f"Баланс: {format_money(balance)} руб. (покупок: {len(purchases)})")
+    return True
+
+def cmd_bank_deposit(args):
+    """Пополнение счета"""
+    storage, balance, purchases = open_bank()
+    amount = read_cli_amount(args.amount)
+    balance += amount
+    if not storage.append({'op': 'deposit', 'amount': amount / 100}, balance, purchases):
+        raise CommandError("данные счета не сохранены")
+    print(f"Баланс: {format_money(balance)} руб.")
+    return True
+
+def cmd_bank_purchase(args):
+    """Покупка"""
+    storage, balance, purchases = open_bank()
+    amount = read_cli_amount(args.amount)
+    if amount > balance:
+        raise CommandError("недостаточно средств")
+    balance -= amount
+    purchase_record = {
+        'name': args.name or "Покупка",
+        'amount': amount / 100,
+        'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'balance_after': balance / 100
+    }
+    purchases.append(purchase_record)
+    if not storage.append(dict(purchase_record, op='purchase'), balance, purchases):
+        raise CommandError("данные счета не сохранены")
+    print(f"Баланс: {format_money(balance)} руб.")
+    return True
+
+def cmd_bank_history(args):
+    """История покупок с фильтрами"""
+    dates = []
+    for value in (args.date_from, args.date_to):
+        try:
+            dates.append(normalize_date(value) if value else None)
+        except ValueError:
+            raise CommandError(f"некорректная дата '{value}', ожидается ГГГГ-ММ-ДД")
+    _, _, purchases = open_bank()
+    rows = purchases.select(args.name, *dates, not args.oldest_first)
+    for i, purchase in islice(rows, args.limit):
+        print(f"{i}. {purchase['date']}  {purchase['name']}  {purchase['amount']:.2f} руб.  "
+              f"(баланс после: {purchase['balance_after']:.2f} руб.)")
+    return True
+
+def cmd_batch(args):
+    """Выполнение команд из файла (по одной на строку, # - комментарий)"""
+    import shlex
+    parser = build_cli_parser()
+    f = sys.stdin if args.file == '-' else open(args.file, encoding='utf-8')
+    failed = 0
+    try:
+        for line_number, line in enumerate(f, 1):
+            try:
+                argv = shlex.split(line, comments=True)
+            except ValueError as e:
+                print(f"Ошибка: строка {line_number}: {e}", file=sys.stderr)
+                failed += 1
+                continue
+            if not argv:
+                continue
+            if run_command(parser, argv, f"строка {line_number}: ") != 0:
+                failed += 1
+                if args.stop_on_error:
+                    break
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    if failed:
+        print(f"Ошибка: не выполнено команд: {failed}", file=sys.stderr)
+    return not failed
+
+def positive_int(text):
+    """Тип аргумента: целое число не меньше 1"""
+    import argparse
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"некорректное число '{text}'")
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"число должно быть не меньше 1: '{text}'")
+    return value
+
+def build_cli_parser():
+    """Параметры неинтерактивного режима"""
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog=os.path.basename(sys.argv[0]) or "file_manager_07.py",
+        description="Консольный файловый менеджер (без аргументов запускается меню)")
+    parser.add_argument('-C', '--directory', help="рабочая директория (по умолчанию текущая)")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="сохранить метрики команд в FILE (.prom - формат Prometheus, иначе JSON)")
+    sub = parser.add_subparsers(dest='command', required=True)
+    
+    cd = sub.add_parser('cd', help="сменить рабочую директорию (для пакетов)")
+    cd.add_argument('path')
+    cd.set_defaults(func=cmd_cd)
+    
+    mkdir = sub.add_parser('mkdir', help="создать папки")
+    mkdir.add_argument('names', nargs='+')
+    mkdir.add_argument('-p', '--parents', action='store_true', help="не считать ошибкой существующую папку")
+    mkdir.set_defaults(func=cmd_mkdir)
+    
+    rm = sub.add_parser('rm', help="удалить файлы/папки (без подтверждения)")
+    rm.add_argument('names', nargs='+')
+    rm.add_argument('-f', '--force', action='store_true', help="пропускать несуществующие")
+    rm.add_argument('--workers', type=int, default=DELETE_WORKERS)
+    rm.set_defaults(func=cmd_rm)
+    
+    cp = sub.add_parser('cp', help="копировать файл/папку")
+    cp.add_argument('source')
+    cp.add_argument('dest')
+    cp.add_argument('--resume', action='store_true', help="докопировать в существующую папку")
+    cp.add_argument('--workers', type=int, default=COPY_WORKERS)
+    cp.add_argument('-v', '--verbose', action='store_true', help="вывести статистику копирования")
+    cp.set_defaults(func=cmd_cp)
+    
+    sync = sub.add_parser('sync', help="синхронизировать папку-копию с исходной")
+    sync.add_argument('source')
+    sync.add_argument('dest')
+    sync.add_argument('--checksum', action='store_true', help="сверять содержимое, а не только размер и дату")
+    sync.add_argument('--delete', action='store_true', help="удалять из копии лишние файлы")
+    sync.add_argument('--fat-mtime', action='store_true',
+                      help=f"сравнивать mtime с допуском {MTIME_TOLERANCE:g} с (копия на FAT/SMB)")
+    sync.add_argument('--workers', type=int, default=COPY_WORKERS)
+    sync.add_argument('-v', '--verbose', action='store_true', help="вывести статистику синхронизации")
+    sync.set_defaults(func=cmd_sync)
+    
+    archive = sub.add_parser('archive', help="упаковать файл/папку в tar.gz или zip")
+    archive.add_argument('source')
+    archive.add_argument('-o', '--output', help="имя архива (по умолчанию - имя источника с расширением)")
+    archive.add_argument('--zip', action='store_true', help="формат zip вместо tar.gz")
+    archive.add_argument('--workers', type=int, default=ARCHIVE_WORKERS)
+    archive.add_argument('-v', '--verbose', action='store_true', help="вывести объем и скорость")
+    archive.set_defaults(func=cmd_archive)
+    
+    extract = sub.add_parser('extract', help="распаковать архив tar.gz или zip")
+    extract.add_argument('archive')
+    extract.add_argument('dest', nargs='?', default='.')
+    extract.add_argument('--workers', type=int, default=ARCHIVE_WORKERS)
+    extract.add_argument('-v', '--verbose', action='store_true', help="вывести объем и скорость")
+    extract.set_defaults(func=cmd_extract)
+    
+    for name, func, help_text in (('ls', cmd_ls, "содержимое рабочей директории"),
+                                  ('dirs', cmd_dirs, "только папки"),
+                                  ('files', cmd_files, "только файлы")):
+        listing = sub.add_parser(name, help=help_text)
+        listing.add_argument('-U', '--unsorted', action='store_true', help="порядок диска")
+        listing.add_argument('-s', '--sort', choices=[code for code, _, key in LIST_ORDERS if key],
+                             default='name', help="порядок сортировки")
+        listing.set_defaults(func=func)
+    
+    top = sub.add_parser('top', help="самые большие или самые новые файлы")
+    top.add_argument('path', nargs='?', default='.')
+    top.add_argument('-n', type=int, default=20, help="сколько файлов показать")
+    top.add_argument('--by', choices=sorted(TOP_MODES), default='size')
+    top.add_argument('-r', '--recursive', action='store_true', help="включая вложенные папки и сводку по расширениям")
+    top.set_defaults(func=cmd_top)
+    
+    export = sub.add_parser('export', help="сохранить содержимое директории в файл")
+    export.add_argument('-f', '--format', choices=sorted(EXPORT_FILES), default='txt')
+    export.add_argument('-z', '--gzip', action='store_true')
+    export.add_argument('-s', '--snapshot', action='store_true',
+                        help=f"сохранить снимок дерева и сравнить с предыдущим ({SNAPSHOT_DIFF_FILE})")
+    export.set_defaults(func=cmd_export)
+    
+    du = sub.add_parser('du', help="анализ занятого места")
+    du.add_argument('path', nargs='?', default='.')
+    du.add_argument('--top', type=positive_int, default=10)
+    du.set_defaults(func=cmd_du)
+    
+    find = sub.add_parser('find', help="поиск файлов по индексу")
+    find.add_argument('query')
+    find.add_argument('--refresh', action='store_true', help="обновить индекс перед поиском")
+    find.add_argument('--limit', type=int)
+    find.set_defaults(func=cmd_find)
+    
+    bank = sub.add_parser('bank', help="банковский счет")
+    bank_sub = bank.add_subparsers(dest='bank_command', required=True)
+    bank_sub.add_parser('balance', help="текущий баланс").set_defaults(func=cmd_bank_balance)
+    deposit = bank_sub.add_parser('deposit', help="пополнить счет")
+    deposit.add_argument('amount')
+    deposit.set_defaults(func=cmd_bank_deposit)
+    purchase = bank_sub.add_parser('purchase', help="совершить покупку")
+    purchase.add_argument('amount')
+    purchase.add_argument('name', nargs='?')
+    purchase.set_defaults(func=cmd_bank_purchase)
+    history = bank_sub.add_parser('history', help="история покупок")
+    history.add_argument('--name')
+    history.add_argument('--from', dest='date_from', metavar='ГГГГ-ММ-ДД')
+    history.add_argument('--to', dest='date_to', metavar='ГГГГ-ММ-ДД')
+    history.add_argument('--limit', type=int)
+    history.add_argument('--oldest-first', action='store_true')
+    history.set_defaults(func=cmd_bank_history)
+    
+    batch = sub.add_parser('batch', help="выполнить команды из файла ('-' - stdin)")
+    batch.add_argument('file')
+    batch.add_argument('--stop-on-error', action='store_true')
+    batch.set_defaults(func=cmd_batch)
+    return parser
+
+def run_command(parser, argv, prefix=""):
+    """Разбор и выполнение одной команды; код возврата как у процесса"""
+    global working_directory
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        return e.code or 0
+    
+    # -C действует только на эту команду; между строками пакета
+    # рабочую директорию сохраняет лишь явная команда cd
+    previous_directory = working_directory
+    directory = None
+    try:
+        if args.directory:
+            # Рабочая директория меняется только после проверки, иначе
+            # неверный -C в пакете ломал бы все следующие строки
+            directory = os.path.normpath(os.path.join(working_directory, args.directory))
+            if not os.path.isdir(directory):
+                raise CommandError(f"'{args.directory}' не является папкой")
+            working_directory = directory
+        if metrics.enabled:
+            ok = metrics.call(f"cli_{args.func.__name__[4:]}", args.func, (args,), {})
+        else:
+            ok = args.func(args)
+        return 0 if ok else 1
+    except (CommandError, OSError) as e:
+        print(f"Ошибка: {prefix}{e}", file=sys.stderr)
+        return 1
+    except Exception as e:
+        # Непредвиденная ошибка одной команды не прерывает пакет
+        print(f"Ошибка: {prefix}непредвиденная ошибка {type(e).__name__}: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if directory is not None and working_directory == directory:
+            working_directory = previous_directory
+        if args.metrics:
+            try:
+                metrics.dump(args.metrics)
+            except OSError as e:
+                print(f"Ошибка при сохранении метрик: {e}", file=sys.stderr)
+
+def run_cli(argv):
+    """Неинтерактивный режим: одна команда или пакет команд в одном процессе"""
+    return run_command(build_cli_parser(), argv)
+
 # ========== ГЛАВНАЯ ПРОГРАММА ==========
 
 def main():
     """Главная функция программы"""
     global working_directory
     
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+    
     while True:
         choice = show_menu()
         
@@ -570,11 +5163,36 @@ def main():
         elif choice == "12":
             save_directory_contents()
         elif choice == "13":
+            active = job_manager.active()
+            if active:
+                confirm = prompt_input(f"Незавершенных заданий: {len(active)}. Отменить их и выйти? (y/n): ").strip().lower()
+                if confirm != 'y':
+                    screen.invalidate()
+                    continue
+            job_manager.shutdown()
             clear_screen()
             print("Спасибо за использование программы! До свидания!")
             sys.exit(0)
+        elif choice == "14":
+            show_diagnostics()
+        elif choice == "15":
+            analyze_disk_usage()
+        elif choice == "16":
+            search_files()
+        elif choice == "17":
+            show_jobs()
+        elif choice == "18":
+            find_duplicate_files()
+        elif choice == "19":
+            mirror_directory()
+        elif choice == "20":
+            show_top_files()
+        elif choice == "21":
+            archive_item()
+        elif choice == "22":
+            extract_item()
         else:
-            print("❌ Неверный пункт меню! Пожалуйста, выберите 1-13.")
+            print("❌ Неверный пункт меню! Пожалуйста, выберите 1-22.")
             wait_for_enter()
 
 if __name__ == "__main__":
@@ -0,0 +1,41 @@
+"""
+История покупок: фильтр периода по датам пользователя
+Запуск: python -m pytest tests/test_bank_history.py
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import file_manager_07 as fm
+
+def make_history():
+    """Покупки в конце декабря, в январе и в феврале 2024 года"""
+    purchases = []
+    balance = 100000
+    for date in ("2023-12-31 23:59:59", "2024-01-01 00:00:00", "2024-01-15 12:00:00",
+                 "2024-01-31 23:59:59", "2024-02-01 00:00:00"):
+        balance -= 10
+        purchases.append({'name': f"покупка {date}", 'amount': 10, 'date': date,
+                          'balance_after': balance})
+    return fm.PurchaseHistory(purchases)
+
+def dates(rows):
+    return [purchase['date'] for _, purchase in rows]
+
+def test_normalize_date_pads_month_and_day():
+    assert fm.normalize_date("2024-1-1") == "2024-01-01"
+    assert fm.normalize_date("2024-01-31") == "2024-01-31"
+
+def test_non_padded_date_range(monkeypatch):
+    answers = iter(["2024-1-1", "2024-1-31"])
+    monkeypatch.setattr(fm, "prompt_input", lambda prompt="": next(answers))
+    date_from = fm.read_date("с: ")
+    date_to = fm.read_date("по: ")
+    assert (date_from, date_to) == ("2024-01-01", "2024-01-31")
+
+    history = make_history()
+    expected = ["2024-01-01 00:00:00", "2024-01-15 12:00:00", "2024-01-31 23:59:59"]
+    assert dates(history.select(None, date_from, date_to, newest_first=False)) == expected
+    assert dates(history.select("покупка", date_from, date_to, newest_first=False)) == expected
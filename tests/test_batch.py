@@ -0,0 +1,38 @@
+"""
+Пакетный режим: рабочая директория между строками пакета
+Запуск: python -m pytest tests/test_batch.py
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import file_manager_07 as fm
+
+def make_tree(root):
+    """root/root.txt, root/sub/inner.txt, root/sub/sub/deep.txt"""
+    os.makedirs(root / "sub" / "sub")
+    for path in (root / "root.txt", root / "sub" / "inner.txt", root / "sub" / "sub" / "deep.txt"):
+        path.write_text("")
+
+def run_batch(root, lines, monkeypatch, capsys):
+    batch = root / "commands.txt"
+    batch.write_text("\n".join(lines) + "\n", encoding='utf-8')
+    monkeypatch.setattr(fm, "working_directory", str(root))
+    status = fm.run_cli(["batch", str(batch)])
+    return status, capsys.readouterr().out.splitlines()
+
+def test_directory_option_applies_to_one_line(tmp_path, monkeypatch, capsys):
+    make_tree(tmp_path)
+    status, lines = run_batch(tmp_path, ["-C sub files", "-C sub files", "files"], monkeypatch, capsys)
+    assert status == 0
+    assert [line.split()[2] for line in lines if "📄" in line] == ["inner.txt", "inner.txt", "commands.txt",
+                                                                  "root.txt"]
+    assert fm.working_directory == str(tmp_path)
+
+def test_cd_persists_between_lines(tmp_path, monkeypatch, capsys):
+    make_tree(tmp_path)
+    status, lines = run_batch(tmp_path, ["cd sub", "files"], monkeypatch, capsys)
+    assert status == 0
+    assert [line.split()[2] for line in lines if "📄" in line] == ["inner.txt"]
@@ -0,0 +1,37 @@
+"""
+Бюджет запуска file_manager_07: время импорта и отложенные модули
+Запуск: python -m pytest tests/test_startup.py
+"""
+import os
+import sys
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark_07 import LAZY_MODULES, parse_importtime
+
+BUDGET_MS = float(os.environ.get("FM_STARTUP_BUDGET_MS", "25"))
+REPEAT = 3
+
+CHECK_MODULES = "import sys, file_manager_07; print('\\n'.join(sorted(sys.modules)))"
+
+def import_file_manager():
+    """Импорт в отдельном интерпретаторе: (суммарное время импорта в мкс, загруженные модули)"""
+    env = dict(os.environ, PYTHONPATH=ROOT, FM_METRICS="1")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", CHECK_MODULES],
+                            capture_output=True, text=True, env=env, check=True)
+    modules = parse_importtime(result.stderr)
+    total_us = next(cumulative for name, _, cumulative in modules if name == "file_manager_07")
+    return total_us, set(result.stdout.split())
+
+def test_import_within_budget():
+    # Первый запуск может компилировать .pyc - берется лучший из нескольких
+    best_us = min(import_file_manager()[0] for _ in range(REPEAT))
+    assert best_us / 1000 <= BUDGET_MS, \
+        f"импорт file_manager_07 занял {best_us / 1000:.1f} мс, бюджет {BUDGET_MS:.1f} мс"
+
+def test_lazy_modules_not_loaded():
+    _, loaded = import_file_manager()
+    eager = [name for name in LAZY_MODULES if name in loaded]
+    assert not eager, f"при запуске загружены отложенные модули: {', '.join(eager)}"